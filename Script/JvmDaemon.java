@@ -0,0 +1,238 @@
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.File;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.InetAddress;
+import java.net.ServerSocket;
+import java.net.Socket;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+import java.util.ArrayList;
+import java.util.List;
+import java.util.concurrent.CountDownLatch;
+
+/**
+ * Runs the main method of merge tools in one long-lived JVM, so that JVM startup and JIT warm-up are paid once.
+ * <p>
+ * The daemon prints "PORT n" on stdout, then serves one request per connection, one connection at a time.
+ * If it can't intercept System.exit, it prints "NO-EXIT-TRAP" and exits, because every request would end the daemon.
+ * It exits when stdin is closed, which happens when the Python process that started it dies.
+ * The arguments are the classpath of the tool. Every request loads the tool in a new class loader,
+ * so that static fields of the tool don't carry over from one request to the next.
+ * See jvmDaemon.py for the protocol.
+ * <p>
+ * Written for Java 8 because FSTMerge requires Java 8.
+ */
+public class JvmDaemon {
+	private static volatile boolean shuttingDown = false;
+
+	private static URL[] toolClasspath;
+
+	/**
+	 * Where output goes outside of requests, e.g. from threads that a tool leaves running. It's discarded.
+	 */
+	private static final PrintStream idleStream = new PrintStream(new OutputStream() {
+		@Override
+		public void write(int b) {
+		}
+
+		@Override
+		public void write(byte[] b, int off, int len) {
+		}
+	});
+
+	static class ExitException extends SecurityException {
+		final int status;
+
+		ExitException(int status) {
+			super("System.exit(" + status + ")");
+			this.status = status;
+		}
+	}
+
+	/**
+	 * Collects the output of a request. If a line contains any of the patterns, the request is aborted.
+	 */
+	static class WatchedStream extends OutputStream {
+		private final ByteArrayOutputStream buffer = new ByteArrayOutputStream();
+		private final ByteArrayOutputStream line = new ByteArrayOutputStream();
+		private final List<String> patterns;
+		private final CountDownLatch done;
+		private volatile boolean aborted = false;
+
+		WatchedStream(List<String> patterns, CountDownLatch done) {
+			this.patterns = patterns;
+			this.done = done;
+		}
+
+		@Override
+		public synchronized void write(int b) {
+			buffer.write(b);
+			if (patterns.isEmpty())
+				return;
+
+			if (b == '\n') {
+				String text = new String(line.toByteArray(), StandardCharsets.UTF_8);
+				line.reset();
+				for (String pattern : patterns) {
+					if (text.contains(pattern)) {
+						aborted = true;
+						done.countDown();
+						break;
+					}
+				}
+			} else {
+				line.write(b);
+			}
+		}
+
+		synchronized byte[] toByteArray() {
+			return buffer.toByteArray();
+		}
+
+		boolean isAborted() {
+			return aborted;
+		}
+	}
+
+	public static void main(String[] args) throws Exception {
+		PrintStream stdout = System.out;
+		toolClasspath = new URL[args.length];
+		for (int i = 0; i < args.length; i++)
+			toolClasspath[i] = new File(args[i]).toURI().toURL();
+
+		Thread parentWatcher = new Thread(() -> {
+			try {
+				while (System.in.read() != -1) {
+				}
+			} catch (IOException ignored) {
+			}
+			shutdown();
+		});
+		parentWatcher.setDaemon(true);
+		parentWatcher.start();
+
+		try {
+			// Tools call System.exit. Turn it into an exception so that the daemon survives.
+			// Java 12+ only allows this if the JVM is started with -Djava.security.manager=allow.
+			System.setSecurityManager(new SecurityManager() {
+				@Override
+				public void checkPermission(Permission perm) {
+				}
+
+				@Override
+				public void checkPermission(Permission perm, Object context) {
+				}
+
+				@Override
+				public void checkExit(int status) {
+					if (!shuttingDown)
+						throw new ExitException(status);
+				}
+			});
+		} catch (UnsupportedOperationException | SecurityException e) {
+			// Java 18+ without -Djava.security.manager=allow, and Java 24+ always
+			stdout.println("NO-EXIT-TRAP");
+			stdout.flush();
+			shutdown();
+		}
+
+		ServerSocket server = new ServerSocket(0, 1, InetAddress.getLoopbackAddress());
+		stdout.println("PORT " + server.getLocalPort());
+		stdout.flush();
+		// Nobody may read the pipe of stdout any more, and a full pipe would block the tool.
+		System.setOut(idleStream);
+		System.setErr(idleStream);
+
+		while (true) {
+			boolean reusable;
+			try (Socket socket = server.accept()) {
+				reusable = handle(socket);
+			}
+			if (!reusable)
+				break;
+		}
+		shutdown();
+	}
+
+	private static void shutdown() {
+		shuttingDown = true;
+		Runtime.getRuntime().halt(0);
+	}
+
+	/**
+	 * @return false if threads of the tool may still be running, so the daemon must not be reused.
+	 */
+	private static boolean handle(Socket socket) throws Exception {
+		BufferedReader reader = new BufferedReader(new InputStreamReader(socket.getInputStream(), StandardCharsets.UTF_8));
+		String mainClass = reader.readLine();
+		String[] toolArgs = new String[Integer.parseInt(reader.readLine())];
+		for (int i = 0; i < toolArgs.length; i++)
+			toolArgs[i] = reader.readLine();
+		int patternCount = Integer.parseInt(reader.readLine());
+		List<String> patterns = new ArrayList<>();
+		for (int i = 0; i < patternCount; i++)
+			patterns.add(reader.readLine());
+
+		// The parent is the loader of the JDK, so classes of the tool and of the daemon aren't shared.
+		URLClassLoader loader = new URLClassLoader(toolClasspath, ClassLoader.getSystemClassLoader().getParent());
+		Method main = loader.loadClass(mainClass).getMethod("main", String[].class);
+
+		CountDownLatch done = new CountDownLatch(1);
+		WatchedStream out = new WatchedStream(new ArrayList<>(), done);
+		WatchedStream err = new WatchedStream(patterns, done);
+		int[] exitCode = {0};
+
+		PrintStream originalOut = System.out;
+		PrintStream originalErr = System.err;
+		System.setOut(new PrintStream(out, true));
+		System.setErr(new PrintStream(err, true));
+		Method toolMain = main;
+		Thread runner = new Thread(() -> {
+			try {
+				toolMain.invoke(null, (Object) toolArgs);
+			} catch (InvocationTargetException e) {
+				if (e.getCause() instanceof ExitException) {
+					exitCode[0] = ((ExitException) e.getCause()).status;
+				} else {
+					exitCode[0] = 1;
+					e.getCause().printStackTrace();
+				}
+			} catch (Throwable e) {
+				exitCode[0] = 1;
+				e.printStackTrace();
+			} finally {
+				done.countDown();
+			}
+		}, "tool-main");
+		runner.setContextClassLoader(loader);
+		runner.start();
+		done.await();
+
+		System.out.flush();
+		System.err.flush();
+		System.setOut(originalOut);
+		System.setErr(originalErr);
+		if (!err.isAborted()) {
+			// Release the jar files. Threads of an aborted tool may still load classes, and the daemon exits anyway.
+			loader.close();
+		}
+
+		byte[] outBytes = out.toByteArray();
+		byte[] errBytes = err.toByteArray();
+		String status = err.isAborted() ? "ABORTED" : "EXIT";
+		OutputStream response = socket.getOutputStream();
+		response.write((status + " " + exitCode[0] + " " + outBytes.length + " " + errBytes.length + "\n").getBytes(StandardCharsets.UTF_8));
+		response.write(outBytes);
+		response.write(errBytes);
+		response.flush();
+		return !err.isAborted();
+	}
+}
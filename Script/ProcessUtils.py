@@ -1,4 +1,384 @@
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import signal
 import subprocess
+import sys
+import threading
+import time
+
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+
+# UsageRecorder for the resource usage of every process run by runAsync, or None to not record.
+usageRecorder = None
+# Limits of every process started by Popen, applied on POSIX only. None means unlimited.
+# Bytes of data segment and heap, which excludes the address space that the JVM reserves but doesn't use.
+memoryLimit = None
+# Seconds of CPU time
+cpuLimit = None
+# Called with the number of live processes started by Popen in this process, whenever it changes. None to not notify.
+processListener = None
+_liveProcesses = 0
+
+
+class UsageRecorder:
+	"""
+	Append the resource usage of tool processes to a file, one JSON record per line.
+
+	Records are keyed by the example and tool in context, which the caller sets before running a tool.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self.context = {}
+		# Records since the context was set
+		self.records = []
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		# The workers of merge.py --jobs share the file. O_APPEND and one write per record keep their records whole.
+		self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+	def setContext(self, **context):
+		self.context = context
+		self.records = []
+
+	def record(self, **fields):
+		record = dict(self.context, time=datetime.datetime.now().isoformat(timespec='seconds'), **fields)
+		os.write(self._fd, (json.dumps(record, sort_keys=True) + '\n').encode('utf-8'))
+		self.records.append(record)
+
+	def close(self):
+		os.close(self._fd)
+
+	def __getstate__(self):
+		return self.path
+
+	def __setstate__(self, path):
+		self.__init__(path)
+
+
+def recordUsage(cmd, wallTime, exitStatus, userTime=None, systemTime=None, maxRss=None, timedOut=False, **fields):
+	"""
+	:param maxRss: peak resident set size in KiB
+	"""
+	if usageRecorder is None:
+		return
+	if isinstance(cmd, list):
+		cmd = ' '.join([str(c) for c in cmd])
+	usageRecorder.record(cmd=cmd, wallTime=round(wallTime, 3), exitStatus=exitStatus,
+						 userTime=None if userTime is None else round(userTime, 3),
+						 systemTime=None if systemTime is None else round(systemTime, 3),
+						 maxRss=maxRss, timedOut=timedOut, **fields)
+
+
+def _changeLiveProcesses(delta):
+	global _liveProcesses
+	_liveProcesses += delta
+	if processListener is not None:
+		processListener(_liveProcesses)
+
+
+def _setLimits():
+	# Runs in the child process before exec. The limits are inherited by the whole tree.
+	import resource
+	if memoryLimit is not None:
+		resource.setrlimit(resource.RLIMIT_DATA, (memoryLimit, memoryLimit))
+	if cpuLimit is not None:
+		# The soft limit sends SIGXCPU. The hard limit sends SIGKILL if the process ignores it.
+		resource.setrlimit(resource.RLIMIT_CPU, (cpuLimit, cpuLimit + 5))
+
+
+def Popen(cmd, **kwargs) -> subprocess.Popen:
+	"""
+	Same as subprocess.Popen, but on POSIX the process starts a new session, so that terminate kills every process it started,
+	e.g. the JVM started by a shell. memoryLimit and cpuLimit are applied.
+
+	Use runAsync or run to run tools. They reap the process in a way that keeps its resource usage.
+	"""
+	if os.name == 'posix':
+		kwargs.setdefault('start_new_session', True)
+		if memoryLimit is not None or cpuLimit is not None:
+			kwargs['preexec_fn'] = _setLimits
+	proc = subprocess.Popen(cmd, **kwargs)
+	proc.startTime = time.perf_counter()
+	_changeLiveProcesses(1)
+	return proc
+
+
+def terminate(proc: subprocess.Popen, sig=signal.SIGTERM):
+	"""
+	Send a signal to proc and every process in its session, if it's started by Popen on POSIX.
+	Unlike proc.terminate, this doesn't reap the process, so runAsync can still get its resource usage.
+	"""
+	if proc.returncode is not None:
+		# proc is reaped, so its process group id may belong to other processes now.
+		return
+	if os.name != 'posix':
+		proc.terminate()
+		return
+	try:
+		# The group id isn't reused while the leader is unreaped, even if the leader has exited.
+		os.killpg(proc.pid, sig)
+	except (ProcessLookupError, PermissionError):
+		pass
+
+
+def _recordReaped(proc, cmd, waitResult, wallTime, timedOut):
+	"""
+	:param waitResult: the result of os.wait4, or None if only proc.returncode is known.
+	"""
+	_changeLiveProcesses(-1)
+	if waitResult is None:
+		recordUsage(cmd, wallTime, proc.returncode, timedOut=timedOut)
+		return
+	_, status, usage = waitResult
+	# Tell Popen that the process is reaped.
+	proc.returncode = os.waitstatus_to_exitcode(status)
+	# ru_maxrss is in bytes on macOS, and in KiB elsewhere.
+	maxRss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+	recordUsage(cmd, wallTime, proc.returncode, usage.ru_utime, usage.ru_stime, maxRss, timedOut)
+
+
+async def _reap(proc: subprocess.Popen):
+	"""
+	Wait for proc to exit without blocking the event loop.
+	Popen.wait and the asyncio child watchers use waitpid, which discards rusage, so the process is reaped with wait4.
+	After proc exits and before it's reaped, the rest of its process group is killed.
+
+	:return: the result of os.wait4, or None if wait4 isn't available.
+	"""
+	loop = asyncio.get_running_loop()
+	if not hasattr(os, 'wait4'):
+		await loop.run_in_executor(None, proc.wait)
+		return None
+
+	pidfd = None
+	if hasattr(os, 'pidfd_open'):
+		try:
+			pidfd = os.pidfd_open(proc.pid)
+		except OSError:
+			pass
+	if pidfd is not None:
+		# A pidfd becomes readable when the process exits. No thread is needed.
+		exited = loop.create_future()
+		loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+		try:
+			await exited
+		finally:
+			loop.remove_reader(pidfd)
+			os.close(pidfd)
+	elif hasattr(os, 'waitid'):
+		# WNOWAIT leaves the process unreaped.
+		await loop.run_in_executor(None, os.waitid, os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+	else:
+		return await loop.run_in_executor(None, os.wait4, proc.pid, 0)
+	# Background processes of the tool would otherwise pile up, and keep the pipes open.
+	terminate(proc, signal.SIGKILL)
+	return os.wait4(proc.pid, 0)
+
+
+async def _pump(stream, chunks, onLine, limit, stop):
+	"""
+	Read stream to the end. Keep up to limit bytes in chunks, and pass every line to onLine.
+
+	:param chunks: a list of bytes, and the total number of bytes read is stored at chunks.length
+	:param stop: called if onLine returns True
+	"""
+	loop = asyncio.get_running_loop()
+	if os.name == 'posix':
+		reader = asyncio.StreamReader()
+		transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), stream)
+		read = reader.read
+	else:
+		# The proactor loop can't read anonymous pipes.
+		transport = None
+
+		async def read(n):
+			return await loop.run_in_executor(None, stream.read1, n)
+
+	kept = 0
+	partial = b''
+	try:
+		while True:
+			data = await read(64 * 1024)
+			if kept < limit:
+				chunks.append(data[0:limit - kept])
+				kept += len(chunks[-1])
+			if onLine is not None:
+				lines = (partial + data).split(b'\n')
+				# At the end of the stream, the last line may have no line break.
+				partial = lines.pop() if len(data) > 0 else b''
+				for line in lines:
+					if len(line) > 0 and onLine(line.decode('utf-8', errors='ignore')):
+						stop()
+			if len(data) == 0:
+				break
+	finally:
+		if transport is not None:
+			transport.close()
+
+
+class ToolResult:
+	__slots__ = ('cmd', 'returncode', 'stdout', 'stderr', 'stopped')
+
+	def __init__(self, cmd, returncode, stdout, stderr, stopped):
+		self.cmd = cmd
+		self.returncode = returncode
+		# None if not captured
+		self.stdout = stdout
+		# At most STDERR_LIMIT bytes
+		self.stderr = stderr
+		# A line callback asked to stop the process.
+		self.stopped = stopped
+
+	def check(self):
+		"""
+		:raise subprocess.SubprocessError: the process failed, or was stopped by a line callback.
+		"""
+		if self.returncode != 0 or self.stopped:
+			errs = self.stderr.decode('utf-8', errors='ignore')
+			if len(errs) > 500:
+				errs = f'Error message has {len(errs)} characters.'
+			raise subprocess.SubprocessError(f"Fail to run '{self.cmd}': {errs}")
+
+
+# Bytes of stderr kept in ToolResult. Tools print long stack traces, but only the beginning is useful.
+STDERR_LIMIT = 64 * 1024
+# A ConcurrencyLimit on the tool processes that runAsync runs at the same time, or None for unlimited
+concurrencyLimit = None
+# Seconds between two attempts to take a slot of concurrencyLimit
+SLOT_POLL_SECONDS = 0.05
+
+
+class ConcurrencyLimit:
+	"""
+	At most `slots` tool processes at the same time, across the event loops, threads, and processes that share folder,
+	e.g. the workers of merge.py --jobs.
+	A slot is a lock file in folder, locked with flock while a tool runs, so slots of a killed process are freed.
+	Without fcntl, the limit only holds within a process.
+	"""
+
+	def __init__(self, slots, folder):
+		self.slots = slots
+		self.folder = folder
+		os.makedirs(folder, exist_ok=True)
+		self._semaphore = threading.BoundedSemaphore(slots)
+
+	def tryAcquire(self):
+		"""
+		:return: a token for release, or None if every slot is taken
+		"""
+		if fcntl is None:
+			return True if self._semaphore.acquire(blocking=False) else None
+		for i in range(self.slots):
+			fd = os.open(os.path.join(self.folder, f'slot{i}'), os.O_RDWR | os.O_CREAT, 0o644)
+			try:
+				# Locks of different open files conflict even within a process.
+				fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+				return fd
+			except OSError:
+				os.close(fd)
+		return None
+
+	def release(self, token):
+		if fcntl is None:
+			self._semaphore.release()
+		else:
+			# The flock belongs to the open file, so the slot is free once it's closed.
+			os.close(token)
+
+	def __getstate__(self):
+		return self.slots, self.folder
+
+	def __setstate__(self, state):
+		self.__init__(*state)
+
+
+@contextlib.asynccontextmanager
+async def _toolSlot():
+	"""
+	Wait for a slot of concurrencyLimit without blocking the event loop.
+	"""
+	if concurrencyLimit is None:
+		yield
+		return
+	token = concurrencyLimit.tryAcquire()
+	while token is None:
+		await asyncio.sleep(SLOT_POLL_SECONDS)
+		token = concurrencyLimit.tryAcquire()
+	try:
+		yield
+	finally:
+		concurrencyLimit.release(token)
+
+
+def _describe(cmd):
+	if isinstance(cmd, list):
+		return '(quoting skipped) ' + ' '.join([str(c) for c in cmd])
+	return cmd
+
+
+async def runAsync(cmd, timeout, cwd=None, shell=False, onStdoutLine=None, onStderrLine=None, captureStdout=True) -> ToolResult:
+	"""
+	Run a tool process started by Popen, stream its output, and record its resource usage.
+
+	:param onStdoutLine: called with every line of stdout, without the line break. If it returns True, the process is stopped.
+	:param onStderrLine: same as onStdoutLine, for stderr
+	:param captureStdout: if False, stdout is only passed to onStdoutLine, and not kept in memory.
+	:raise subprocess.SubprocessError: the process doesn't finish in timeout seconds. The process tree is killed.
+	If the task is cancelled, the process tree is killed, and CancelledError is raised.
+	"""
+	async with _toolSlot():
+		proc = Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, shell=shell)
+		stopped = []
+
+		def stop():
+			if len(stopped) == 0:
+				stopped.append(True)
+				terminate(proc)
+
+		outs = []
+		errs = []
+		pumps = asyncio.gather(_pump(proc.stdout, outs, onStdoutLine, sys.maxsize if captureStdout else 0, stop),
+							   _pump(proc.stderr, errs, onStderrLine, STDERR_LIMIT, stop))
+		reaper = asyncio.ensure_future(_reap(proc))
+		timedOut = False
+		try:
+			await asyncio.wait_for(asyncio.shield(reaper), timeout)
+		except asyncio.TimeoutError:
+			timedOut = True
+		except asyncio.CancelledError:
+			terminate(proc, signal.SIGKILL)
+			_recordReaped(proc, cmd, await reaper, time.perf_counter() - proc.startTime, False)
+			pumps.cancel()
+			raise
+		if timedOut:
+			terminate(proc, signal.SIGKILL)
+		waitResult = await reaper
+		wallTime = time.perf_counter() - proc.startTime
+		_recordReaped(proc, cmd, waitResult, wallTime, timedOut)
+		try:
+			# A process outside the session, e.g. a daemon that the tool started, may still hold the pipes.
+			await asyncio.wait_for(pumps, 10)
+		except asyncio.TimeoutError:
+			pass
+		proc.stdout.close()
+		proc.stderr.close()
+
+	if timedOut:
+		raise subprocess.SubprocessError(f'{_describe(cmd)} does not finish in time')
+	return ToolResult(_describe(cmd), proc.returncode, b''.join(outs) if captureStdout else None, b''.join(errs), len(stopped) > 0)
+
+
+def run(cmd, timeout, **kwargs) -> ToolResult:
+	"""
+	Same as runAsync, for callers outside an event loop.
+	"""
+	return asyncio.run(runAsync(cmd, timeout, **kwargs))
 
 
 def runProcess(cmd, timeout) -> bytes:
@@ -11,19 +391,6 @@ def runProcess(cmd, timeout) -> bytes:
 
 	# The behavior of subprocess.Popen depends on the platform.
 	# On POSIX, if shell is true and cmd is a list, list is passed to the shell, not the program.
-	proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-	try:
-		outs, errs = proc.communicate(timeout=timeout)
-		if proc.returncode != 0:
-			errs = errs.decode('utf-8', errors='ignore')
-			if len(errs) > 500:
-				errs = f'Error message has {len(errs)} characters.'
-			if isinstance(cmd, list):
-				cmd = '(quoting skipped) ' + ' '.join([str(c) for c in cmd])
-			raise subprocess.SubprocessError("Fail to run '" + cmd + "' in shell: " + errs)
-
-		return outs
-	except subprocess.TimeoutExpired:
-		# Terminate the unfinished process
-		proc.terminate()
-		raise subprocess.SubprocessError(f'{cmd} does not finish in time')
+	result = run(cmd, timeout, shell=True)
+	result.check()
+	return result.stdout
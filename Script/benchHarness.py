@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Measure the overhead of the harness itself, apart from the merge tools.
+
+Every phase that merge.py and compare.py go through for an example is timed on synthetic datasets, see syntheticDataset.py.
+The merge tool is a fake Wiggle that only copies the left version.
+"""
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import compare
+import dataset
+import merge
+import optionUtils
+import syntheticDataset
+import workspaceManager
+
+# Version of the report format. Increase it when a phase changes meaning, so that old baselines aren't compared.
+REPORT_VERSION = '1'
+
+# Phases in the order they run for an example
+PHASES = ('loadDataset', 'prepareRepo', 'getMergedFile', 'createWorktrees', 'materializeInputs', 'runTool', 'releaseInputs',
+		  'normalizeFile', 'compareExample')
+
+# Phases shorter than this in total are too noisy to tell a regression.
+MIN_SECONDS = 0.05
+
+# Wiggle is called as: wiggle --merge base left right --output merged
+_FAKE_TOOL = '#!/bin/sh\ncp "$3" "$6"\n'
+
+
+class _Timer:
+	def __init__(self):
+		self.seconds = {phase: 0.0 for phase in PHASES}
+		self.counts = {phase: 0 for phase in PHASES}
+
+	def time(self, phase, func, *args):
+		start = time.perf_counter()
+		result = func(*args)
+		self.seconds[phase] += time.perf_counter() - start
+		self.counts[phase] += 1
+		return result
+
+
+def createFakeTool(folder):
+	"""
+	:return: path of the fake tool. Its path names Wiggle, so that merge.py recognizes it.
+	"""
+	toolPath = os.path.join(folder, 'wiggle', 'wiggle')
+	os.makedirs(os.path.dirname(toolPath), exist_ok=True)
+	with open(toolPath, 'w') as f:
+		f.write(_FAKE_TOOL)
+	os.chmod(toolPath, 0o755)
+	return toolPath
+
+
+def prepareDataset(workFolder, size, examplesPerRepo):
+	"""
+	Generate the dataset of the size, or reuse the one generated by a previous run.
+
+	:return: path of the list of examples
+	"""
+	folder = os.path.join(workFolder, f'dataset-{size}-{examplesPerRepo}')
+	totalListPath = os.path.join(folder, 'total_list.txt')
+	if not os.path.isfile(totalListPath):
+		shutil.rmtree(folder, ignore_errors=True)
+		syntheticDataset.createDataset(folder, size, examplesPerRepo)
+	return totalListPath
+
+
+def benchmark(workFolder, size, examplesPerRepo=50):
+	"""
+	Run every phase on a dataset of the size, in a new workspace.
+
+	:return: a dict from phase to (count, seconds)
+	"""
+	totalListPath = prepareDataset(workFolder, size, examplesPerRepo)
+	toolPath = createFakeTool(workFolder)
+	pathPrefix = os.path.join(workFolder, 'run')
+	shutil.rmtree(pathPrefix, ignore_errors=True)
+	workspaceFolder = os.path.join(pathPrefix, merge.workspace)
+	resultFolder = os.path.join(workspaceFolder, 'result')
+	os.makedirs(resultFolder)
+
+	merge.path_prefix = pathPrefix
+	merge.workspaces = workspaceManager.WorkspaceManager(workspaceFolder)
+	timer = _Timer()
+
+	examples = timer.time('loadDataset', lambda: dataset.Dataset(optionUtils.readTotalList(totalListPath)))
+	with tempfile.TemporaryDirectory() as tmp:
+		normalizedFile = os.path.join(tmp, 'normalized.java')
+		for i in examples.orderByRepository(range(len(examples))):
+			example = examples[i]
+			repoPath = os.path.join(workspaceFolder, example.repoName)
+			timer.time('prepareRepo', merge.prepare_repo, repoPath, example.repoUrl, example.mergeCommit)
+			timer.time('getMergedFile', example.getMergedFile, workspaceFolder)
+			inputFolders = timer.time('createWorktrees', merge.create4Worktrees, example, workspaceFolder, repoPath)
+			timer.time('materializeInputs', merge.materializeInputs, example, workspaceFolder, merge.getObjectReader(repoPath))
+			timer.time('runTool', merge.runMerger, merge.Merger.Wiggle, toolPath, example, repoPath, resultFolder, inputFolders)
+			timer.time('releaseInputs', merge.workspaces.releaseInputs, example.repoName)
+
+			fileActual = os.path.join(resultFolder, merge.Merger.Wiggle.value, example.repoName, example.conflictingFile)
+			timer.time('normalizeFile', compare.normalizeFile, fileActual, normalizedFile)
+			timer.time('compareExample', compare.processExample, os.path.join(resultFolder, merge.Merger.Wiggle.value), workspaceFolder, example)
+	# The reader of the last repository is still running.
+	merge.closeObjectReader(repoPath)
+	merge.workspaces.release()
+	return {phase: (timer.counts[phase], timer.seconds[phase]) for phase in PHASES}
+
+
+def formatReport(results):
+	"""
+	:param results: a dict from size to the result of benchmark
+	:return: lines of a tab-separated report, one line per size and phase
+	"""
+	lines = [f'# benchHarness {REPORT_VERSION}', 'size\tphase\tcount\tseconds\tmsPerCall']
+	for size in sorted(results):
+		for phase in PHASES:
+			count, seconds = results[size][phase]
+			lines.append(f'{size}\t{phase}\t{count}\t{seconds:.3f}\t{seconds * 1000 / max(count, 1):.3f}')
+	return lines
+
+
+def parseReport(lines):
+	"""
+	:return: a dict from (size, phase) to (seconds, milliseconds per call)
+	"""
+	if len(lines) == 0 or lines[0].strip() != f'# benchHarness {REPORT_VERSION}':
+		raise ValueError(f'The report is not of format version {REPORT_VERSION}.')
+	report = {}
+	for line in lines[2:]:
+		size, phase, _, seconds, msPerCall = line.rstrip('\n').split('\t')
+		report[(int(size), phase)] = (float(seconds), float(msPerCall))
+	return report
+
+
+def findRegressions(report, baseline, tolerance):
+	"""
+	:param tolerance: a phase regresses if it's slower per call than the baseline by this ratio, e.g. 0.2
+	:return: a list of (size, phase, baseline ms, ms)
+	"""
+	regressions = []
+	for key in sorted(report):
+		if key not in baseline or max(report[key][0], baseline[key][0]) < MIN_SECONDS:
+			continue
+		if report[key][1] > baseline[key][1] * (1 + tolerance):
+			regressions.append(key + (baseline[key][1], report[key][1]))
+	return regressions
+
+
+if __name__ == '__main__':
+	if '--help' in sys.argv:
+		print('''
+{0} [--sizes 10,100,1000] [--examples-per-repo 50] [--work folder] [--output file] [--baseline file] [--tolerance 0.2]
+
+Time every phase of the harness on synthetic datasets of the given numbers of examples, with a fake merge tool that does nothing.
+No network is used. Datasets are generated in the work folder once, and reused. Default work folder is the system temp folder.
+10000 examples take far longer than the others, mostly spent in git.
+
+The report is tab-separated, one line per size and phase, and written to stdout or the output file.
+With --baseline, phases slower than in the baseline report by more than the tolerance are printed, and the exit code is 1.
+'''.format(sys.argv[0]))
+		exit(0)
+
+	sizes = [10, 100, 1000]
+	examplesPerRepo = 50
+	tolerance = 0.2
+	try:
+		if '--sizes' in sys.argv:
+			sizes = [int(s) for s in sys.argv[sys.argv.index('--sizes') + 1].split(',')]
+		if '--examples-per-repo' in sys.argv:
+			examplesPerRepo = int(sys.argv[sys.argv.index('--examples-per-repo') + 1])
+		if '--tolerance' in sys.argv:
+			tolerance = float(sys.argv[sys.argv.index('--tolerance') + 1])
+	except (IndexError, ValueError):
+		print('Options --sizes, --examples-per-repo, and --tolerance must be numbers.', file=sys.stderr)
+		exit(1)
+	try:
+		i = sys.argv.index('--work')
+		workFolder = sys.argv[i + 1]
+	except:
+		workFolder = os.path.join(tempfile.gettempdir(), 'conflictbench-bench')
+
+	logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+	# Per-example messages would dominate the time of small phases.
+	merge.logger.setLevel(logging.WARNING)
+	compare.logger.setLevel(logging.WARNING)
+
+	results = {}
+	for size in sizes:
+		logging.info(f'Benchmark {size} examples')
+		results[size] = benchmark(workFolder, size, examplesPerRepo)
+	lines = formatReport(results)
+
+	try:
+		i = sys.argv.index('--output')
+		with open(sys.argv[i + 1], 'w') as f:
+			f.write('\n'.join(lines) + '\n')
+	except ValueError:
+		print('\n'.join(lines))
+
+	if '--baseline' in sys.argv:
+		with open(sys.argv[sys.argv.index('--baseline') + 1]) as f:
+			baseline = parseReport(f.readlines())
+		regressions = findRegressions(parseReport(lines), baseline, tolerance)
+		for size, phase, before, after in regressions:
+			print(f'{phase} of {size} examples regressed from {before:.3f} ms to {after:.3f} ms.', file=sys.stderr)
+		if len(regressions) > 0:
+			exit(1)
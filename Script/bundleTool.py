@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Export the commits of the examples from the clones in Resource/workspace to one git bundle per repository,
+and import them into the clones of another machine without network.
+
+A bundle pins the base, left, right, and merge commits of every example of the repository under gitUtils.FETCHED_REF_PREFIX,
+and has every object that they reach.
+"""
+import logging
+import os
+import sys
+from concurrent import futures
+
+import gitUtils
+import optionUtils
+
+logger = logging.getLogger('bundleTool')
+
+
+def exportRepo(repoPath, commits, bundleFile):
+	"""
+	:param commits: ids of the commits to pin in the bundle
+	:raise RuntimeError: a commit is missing from the clone, or git fails.
+	"""
+	refs = []
+	for sha in commits:
+		ref = gitUtils.FETCHED_REF_PREFIX + sha
+		proc = gitUtils._git(['update-ref', ref, sha], repoPath)
+		if proc.returncode != 0:
+			raise RuntimeError(f'Commit {sha} is not in {repoPath}: {proc.stderr.strip()}')
+		refs.append(ref)
+
+	os.makedirs(os.path.dirname(os.path.abspath(bundleFile)), exist_ok=True)
+	tmp = bundleFile + '.tmp'
+	proc = gitUtils._git(['bundle', 'create', '-q', os.path.abspath(tmp)] + refs, repoPath)
+	if proc.returncode != 0:
+		raise RuntimeError(f'Failed to create the bundle of {repoPath}: {proc.stderr[0:500]}')
+	os.replace(tmp, bundleFile)
+
+
+def exportDataset(examples, workspaceFolder, bundleFolder, jobs):
+	"""
+	Export a bundle of every repository of the examples, one repository per thread.
+	Repositories that aren't cloned in workspaceFolder are skipped.
+
+	:return: names of the exported repositories
+	"""
+	repos = {}
+	for example in examples:
+		commits = repos.setdefault(example.repoName, [])
+		for sha in (example.baseCommit, example.leftCommit, example.rightCommit, example.mergeCommit):
+			if sha not in commits:
+				commits.append(sha)
+
+	exported = []
+	with futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+		tasks = {}
+		for name, commits in repos.items():
+			repoPath = os.path.join(workspaceFolder, name)
+			if not os.path.isdir(os.path.join(repoPath, '.git')):
+				logger.warning(f'{repoPath} is not cloned. Skipped.')
+				continue
+			tasks[executor.submit(exportRepo, repoPath, commits, gitUtils.bundlePath(bundleFolder, name))] = name
+		for task in futures.as_completed(tasks):
+			try:
+				task.result()
+				exported.append(tasks[task])
+			except Exception as e:
+				logger.error(f'Failed to export {tasks[task]}: {e}')
+	return sorted(exported)
+
+
+def importRepo(repoPath, repoUrl, bundleFile):
+	"""
+	Create the clone at repoPath if it doesn't exist, and fetch the bundle into it.
+	The remote stays repoUrl, so commits missing from the bundle can still be fetched from the network.
+
+	:return: True if the bundle is fetched
+	"""
+	if not os.path.isdir(os.path.join(repoPath, '.git')):
+		os.makedirs(repoPath, exist_ok=True)
+		gitUtils._git(['init', '-q'], repoPath, check=True)
+		gitUtils._git(['remote', 'add', 'origin', repoUrl], repoPath, check=True)
+	return gitUtils.fetchBundle(repoPath, bundleFile)
+
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2 or sys.argv[1] not in ('export', 'import') or '--help' in sys.argv:
+		print('''
+{0} export|import [--bundles folder] [--jobs N]
+
+export: write Resource/bundles/<repoName>.bundle for every repository of the selected examples, from the clones in Resource/workspace.
+Export from full clones. A clone made by merge.py --partial-clone lacks blobs, which git would fetch from the network.
+
+import: create the clones in Resource/workspace from the bundles, without network.
+merge.py fetches from the bundles by itself, so import is only needed to provision a machine ahead of time.
+
+--bundles folder	default is Resource/bundles.
+--jobs N	process N repositories in parallel. Default is 4.
+'''.format(sys.argv[0]) + optionUtils.getHelp())
+		exit(0)
+
+	logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+	jobs = optionUtils.getPositiveInt('--jobs', 4)
+
+	opt = optionUtils.Options()
+	opt.LoadDataset()
+	opt.LoadRange()
+	try:
+		i = sys.argv.index('--bundles')
+		bundleFolder = sys.argv[i + 1]
+	except:
+		bundleFolder = os.path.join(opt.path_prefix, 'Resource/bundles')
+	workspaceFolder = os.path.join(opt.path_prefix, 'Resource/workspace')
+	examples = [opt.dataset[i] for i in opt.evaluationRange]
+
+	if sys.argv[1] == 'export':
+		exported = exportDataset(examples, workspaceFolder, bundleFolder, jobs)
+		logger.info(f'Exported {len(exported)} repositories to {bundleFolder}')
+	else:
+		repos = {}
+		for example in examples:
+			repos.setdefault(example.repoName, example.repoUrl)
+		with futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+			tasks = {executor.submit(importRepo, os.path.join(workspaceFolder, name), url, gitUtils.bundlePath(bundleFolder, name)): name
+					 for name, url in repos.items()}
+			imported = [tasks[task] for task in futures.as_completed(tasks) if task.result()]
+		for name in sorted(set(repos) - set(imported)):
+			logger.warning(f'No bundle of {name} is imported.')
+		logger.info(f'Imported {len(imported)} of {len(repos)} repositories')
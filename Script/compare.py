@@ -1,70 +1,250 @@
 #!/usr/bin/env python3
 
 import csv
+import difflib
+import functools
+import hashlib
 import logging
 import os
 import subprocess
 import sys
-from typing import List
+import tempfile
+from concurrent import futures
+from typing import Iterable, Iterator, List
 
 
 import dataset
+import goldenCache as goldenCacheModule
 import optionUtils
+import resultStore
 
 logger = logging.getLogger('diff_logger')
 logger.setLevel(logging.INFO)
 
+# Normalized expected files, set by __main__
+goldenCache = None
 
-def normalizeFile(filePath, normalizedFile):
-	with open(filePath, 'r', encoding='utf-8', errors='ignore') as f:
-		lines = f.readlines()
 
-	before_imports = []
+def normalizeLines(lines) -> Iterator[str]:
+	"""
+	Sort the import block of a Java file.
+	Lines before and after the import block are passed through, so only the import block is held in memory.
+	"""
+	lines = iter(lines)
 	imports = []
-
-	i = 0
-	while i < len(lines):
-		line = lines[i]
+	for line in lines:
 		if line.startswith('import '):
+			imports.append(line)
 			break
-		before_imports.append(line)
-		i += 1
+		yield line
 
-	while i < len(lines):
-		line = lines[i]
+	firstAfterImports = None
+	for line in lines:
 		if len(line.strip()) > 0 and line.startswith('import ') is False:
+			firstAfterImports = line
 			break
 		imports.append(line)
-		i += 1
-
-	after_imports = lines[i:]
 
 	# Sort import lines alphabetically
 	imports.sort()
+	yield from imports
+	if firstAfterImports is not None:
+		yield firstAfterImports
+	yield from lines
 
-	# Combine all parts
-	normalized_content = before_imports + imports + after_imports
 
-	with open(normalizedFile, 'w', encoding='utf-8') as f:
-		f.writelines(normalized_content)
+def normalizeFile(filePath, normalizedFile):
+	with open(filePath, 'r', encoding='utf-8', errors='ignore') as f, open(normalizedFile, 'w', encoding='utf-8') as output:
+		output.writelines(normalizeLines(f))
+
+
+# The characters that git treats as whitespace. str.split() would also remove Unicode spaces.
+_WHITESPACE = str.maketrans('', '', ' \t\n\v\f\r')
+
+
+def canonicalLines(lines: Iterable[str]) -> List[str]:
+	"""
+	Remove all whitespace from each line and drop blank lines.
+	Two files have the same canonical lines if and only if
+	git diff --ignore-blank-lines --ignore-all-space finds no difference.
+	"""
+	canonical = []
+	for line in lines:
+		line = line.translate(_WHITESPACE)
+		if len(line) > 0:
+			canonical.append(line)
+	return canonical
+
+
+def contentHash(canonical: List[str]) -> str:
+	return hashlib.sha256('\n'.join(canonical).encode('utf-8')).hexdigest()
+
+
+# difflib takes time quadratic in the number of lines. If the differing parts of two files have more line pairs than this,
+# git diff, which runs Myers in linear space, aligns them.
+DIFFLIB_MAX_PAIRS = 10 ** 6
+
+
+def _changedLinesWithGit(canonicalActual: List[str], canonicalExpected: List[str]) -> Iterator[str]:
+	"""
+	:return: the lines that git diff adds or removes
+	:raise subprocess.SubprocessError: git fails
+	"""
+	with tempfile.TemporaryDirectory() as folder:
+		files = []
+		for name, lines in (('actual', canonicalActual), ('expected', canonicalExpected)):
+			files.append(os.path.join(folder, name))
+			with open(files[-1], 'w', encoding='utf-8', newline='\n') as f:
+				f.writelines(line + '\n' for line in lines)
+		proc = subprocess.run(['git', 'diff', '--no-index', '--no-color', '--unified=0', '--', files[0], files[1]], capture_output=True)
+	if proc.returncode not in (0, 1):
+		raise subprocess.SubprocessError(proc.stderr.decode('utf-8', errors='ignore'))
+	inHunks = False
+	for line in proc.stdout.decode('utf-8', errors='ignore').split('\n'):
+		# Lines before the first hunk are headers, like --- a/actual.
+		if line.startswith('@@'):
+			inHunks = True
+		elif inHunks and line[0:1] in ('+', '-'):
+			yield line[1:]
+
+
+def diffSize(canonicalActual: List[str], canonicalExpected: List[str], expectedHash=None) -> int:
+	"""
+	:param expectedHash: contentHash of canonicalExpected, if known.
+	:return: the number of characters, whitespace excluded, in lines that are added or removed. 0 means fully matched.
+	"""
+	if expectedHash is None:
+		expectedHash = contentHash(canonicalExpected)
+	if contentHash(canonicalActual) == expectedHash:
+		return 0
+
+	# Merged files mostly differ in a few places, so only the part between the common prefix and suffix is aligned.
+	start = 0
+	while start < min(len(canonicalActual), len(canonicalExpected)) and canonicalActual[start] == canonicalExpected[start]:
+		start += 1
+	end = 0
+	while end < min(len(canonicalActual), len(canonicalExpected)) - start and canonicalActual[-1 - end] == canonicalExpected[-1 - end]:
+		end += 1
+	actual = canonicalActual[start:len(canonicalActual) - end]
+	expected = canonicalExpected[start:len(canonicalExpected) - end]
+
+	if len(actual) * len(expected) > DIFFLIB_MAX_PAIRS:
+		try:
+			return sum(len(line) for line in _changedLinesWithGit(actual, expected))
+		except (OSError, subprocess.SubprocessError) as e:
+			logger.warning(f'Failed to run git diff, so difflib is used: {e}')
+
+	size = 0
+	matcher = difflib.SequenceMatcher(None, actual, expected, autojunk=False)
+	for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+		if tag != 'equal':
+			size += sum(len(line) for line in actual[i1:i2])
+			size += sum(len(line) for line in expected[j1:j2])
+	return size
+
+
+def _readLines(filePath) -> Iterator[str]:
+	# Like git, only \n ends a line. A UTF-8 multibyte character never contains the byte \n.
+	with open(filePath, 'rb') as f:
+		for line in f:
+			yield line.decode('utf-8', errors='ignore')
+
+
+def loadCanonical(filePath) -> List[str]:
+	"""
+	:return: canonical lines of the file. Imports of a Java file are sorted first.
+	"""
+	lines = _readLines(filePath)
+	if filePath.endswith('.java'):
+		lines = normalizeLines(lines)
+	return canonicalLines(lines)
+
+
+def loadExpected(baseFolderExpected, subjectRepo: dataset.SubjectRepo, mergedFile):
+	"""
+	Load the expected file from goldenCache, or from the workspace.
+	The entry is cached only if the workspace has checked out the merge commit.
+
+	:return: (hash, canonical lines), or None if the expected file doesn't exist.
+	"""
+	if goldenCache is not None:
+		cached = goldenCache.get(subjectRepo.mergeCommit, mergedFile)
+		if cached is not None:
+			return cached
 
+	folderExpected = os.path.join(baseFolderExpected, subjectRepo.repoName)
+	fileExpected = os.path.join(folderExpected, mergedFile)
+	if os.path.exists(fileExpected) is False:
+		return None
+	canonical = loadCanonical(fileExpected)
+	digest = contentHash(canonical)
+	if goldenCache is not None and goldenCacheModule.readHead(folderExpected) == subjectRepo.mergeCommit:
+		goldenCache.put(subjectRepo.mergeCommit, mergedFile, digest, canonical)
+	return digest, canonical
+
+
+def diffWithGit(fileActual, fileExpected):
+	"""
+	:return: (diff size, command) where diff size is the length of git diff output, or None if git fails.
+	"""
+	args = ['git', 'diff', '--exit-code', '--no-index', '--ignore-blank-lines', '--ignore-all-space', '--', fileActual, fileExpected]
+	cmd = subprocess.list2cmdline(args)
+	try:
+		# Pass a list so that paths with spaces work.
+		proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		stdout, stderr = proc.communicate()
+		if proc.returncode == 0:
+			return 0, cmd
+		elif proc.returncode == 1:
+			stdout = stdout.decode('utf-8', errors='ignore')
+			return len(stdout), cmd
+		else:
+			stderr = stderr.decode('utf-8', errors='ignore')
+			logger.error(f'Failed to run {cmd}: ' + stderr)
+	except:
+		logger.error(f'Failed to run {cmd}')
+	return None, cmd
+
+
+def _normalizedCopy(filePath, folder):
+	"""
+	:return: the path of a normalized copy in folder if filePath is a Java file, otherwise filePath.
+	"""
+	if filePath.endswith('.java'):
+		os.makedirs(folder, exist_ok=True)
+		normalized = os.path.join(folder, os.path.basename(filePath))
+		normalizeFile(filePath, normalized)
+		return normalized
+	return filePath
 
-def processExample(baseFolderActual, baseFolderExpected, subjectRepo: dataset.SubjectRepo) -> List:
+
+def processExample(baseFolderActual, baseFolderExpected, subjectRepo: dataset.SubjectRepo, backend='builtin') -> List:
 	'''
 
 	:param baseFolderActual:
 	:param baseFolderExpected:
 	:param subjectRepo:
+	:param backend: builtin compares in process. git runs git diff, and the diff size is the length of its output.
 	:return:  csvFields ('repo', 'conflicting file', 'diff size')
 	'''
 	csvFields = [subjectRepo.repoName, subjectRepo.conflictingFile, '-']
 
 	folderExpected = os.path.join(baseFolderExpected, subjectRepo.repoName)
-	mergedFile = subjectRepo.getMergedFile(baseFolderExpected)
+	if os.path.isdir(folderExpected):
+		mergedFile = subjectRepo.getMergedFile(baseFolderExpected)
+	else:
+		# merge.py --workspace-budget evicts a clone only if the golden cache has the expected files under the conflicting files.
+		mergedFile = subjectRepo.conflictingFile
 	fileExpected = os.path.join(folderExpected, mergedFile)
 	folderActual = os.path.join(baseFolderActual, subjectRepo.repoName)
 	fileActual = os.path.join(folderActual, mergedFile)
-	if os.path.exists(fileExpected) is False:
+	if backend == 'git':
+		expected = None
+		expectedExists = os.path.exists(fileExpected)
+	else:
+		expected = loadExpected(baseFolderExpected, subjectRepo, mergedFile)
+		expectedExists = expected is not None
+	if expectedExists is False:
 		logger.warning("File " + fileExpected + " doesn't exist. The file may be deleted in the merge commit.")
 		if os.path.exists(fileActual) is False:
 			logger.info('Fully matched')
@@ -76,43 +256,90 @@ def processExample(baseFolderActual, baseFolderExpected, subjectRepo: dataset.Su
 		logger.info("File name error: File " + fileActual + " doesn't exist")
 		return csvFields
 
-	if fileActual.endswith('.java'):
-		p = fileActual.rfind('.')
-		normalized = fileActual[0:p] + '-normalized' + fileActual[p:]
-		# if os.path.exists(normalized) is False:
-		normalizeFile(fileActual, normalized)
-		fileActual = normalized
-
-	if fileExpected.endswith('.java'):
-		p = fileExpected.rfind('.')
-		normalized = fileExpected[0:p] + '-normalized' + fileExpected[p:]
-		# if os.path.exists(normalized) is False:
-		normalizeFile(fileExpected, normalized)
-		fileExpected = normalized
-
-	cmd = f'git diff --exit-code --no-index --ignore-blank-lines --ignore-all-space -- {fileActual} {fileExpected}'
-	try:
-		# On POSIX, if args is a string, the string is interpreted as the name or path of the program to execute.
-		# On the other hand, the Windows API natively expects a string. So it's fine to pass the program path with arguments as one string to Popen().
-		isPosix = sys.platform == 'linux'
-		proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=isPosix)
-		stdout, stderr = proc.communicate()
-		if proc.returncode == 0:
-			csvFields[2] = 0
-			logger.info('Fully matched')
-		elif proc.returncode == 1:
-			stdout = stdout.decode('utf-8', errors='ignore')
-			csvFields[2] = len(stdout)
-			logger.info(f'Merged file does not fully match actual file. Diff size is {len(stdout)}. Command is {cmd}')
-		else:
-			stderr = stderr.decode('utf-8', errors='ignore')
-			logger.error(f'Failed to run {cmd}: ' + stderr)
-	except:
-		logger.error(f'Failed to run {cmd}')
+	if backend == 'git':
+		# Normalized files are written to a temporary folder, not next to the results.
+		with tempfile.TemporaryDirectory() as tmp:
+			size, cmd = diffWithGit(_normalizedCopy(fileActual, os.path.join(tmp, 'actual')), _normalizedCopy(fileExpected, os.path.join(tmp, 'expected')))
+		description = f'Command is {cmd}'
+	else:
+		size = diffSize(loadCanonical(fileActual), expected[1], expected[0])
+		description = f'Files are {fileActual} and {fileExpected}'
+
+	if size == 0:
+		csvFields[2] = 0
+		logger.info('Fully matched')
+	elif size is not None:
+		csvFields[2] = size
+		logger.info(f'Merged file does not fully match actual file. Diff size is {size}. {description}')
 
 	return csvFields
 
 
+# Folders in the result folder that merge.py creates for other purposes
+_NON_TOOL_FOLDERS = ('summer', 'usage')
+
+
+def listMergers(resultFolder) -> List[str]:
+	"""
+	:return: names of the tool folders in resultFolder
+	"""
+	return sorted(entry.name for entry in os.scandir(resultFolder) if entry.is_dir() and entry.name not in _NON_TOOL_FOLDERS)
+
+
+def processExampleMatrix(resultFolder, baseFolderExpected, mergers, subjectRepo: dataset.SubjectRepo) -> List:
+	'''
+	Compare the results of all mergers on one example. The expected file is read and normalized once.
+
+	:param resultFolder: the folder containing one folder per merger
+	:param mergers: names of the mergers
+	:return: csvFields ('repo', 'conflicting file', diff size of each merger)
+	'''
+	csvFields = [subjectRepo.repoName, subjectRepo.conflictingFile] + ['-'] * len(mergers)
+
+	mergedFile = subjectRepo.getMergedFile(baseFolderExpected)
+	expected = loadExpected(baseFolderExpected, subjectRepo, mergedFile)
+	if expected is None:
+		fileExpected = os.path.join(baseFolderExpected, subjectRepo.repoName, mergedFile)
+		logger.warning("File " + fileExpected + " doesn't exist. The file may be deleted in the merge commit.")
+		return csvFields
+
+	expectedHash, canonicalExpected = expected
+	for j, merger in enumerate(mergers):
+		fileActual = os.path.join(resultFolder, merger, subjectRepo.repoName, mergedFile)
+		if os.path.exists(fileActual) is False:
+			continue
+		csvFields[2 + j] = diffSize(loadCanonical(fileActual), canonicalExpected, expectedHash)
+	return csvFields
+
+
+def _verifyExample(func, *args, **kwargs):
+	# The example is the last positional argument. It's passed as (index, subjectRepo) for logging.
+	*args, (i, subjectRepo) = args
+	logger.info(f"Start verifying project {i} {subjectRepo.repoName}")
+	return func(*args, subjectRepo, **kwargs)
+
+
+def _initWorker(logFile, cache):
+	# A spawned worker doesn't inherit the golden cache that __main__ sets, so it comes in initargs.
+	global goldenCache
+	goldenCache = cache
+	configureLogger(logFile)
+
+
+def configureLogger(logFile):
+	formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+	logger.handlers.clear()
+	if logFile is not None:
+		fh = logging.FileHandler(logFile)
+		fh.setLevel(logging.INFO)
+		fh.setFormatter(formatter)
+		logger.addHandler(fh)
+
+	streamHandler = logging.StreamHandler()
+	streamHandler.setFormatter(formatter)
+	logger.addHandler(streamHandler)
+
+
 if __name__ == '__main__':
 	if '--help' in sys.argv:
 		print('''
@@ -122,36 +349,100 @@ if __name__ == '__main__':
 --merger str
 The name of the merger, not path.
 
+--all-mergers
+Compare every tool folder in Resource/workspace/result/ in one pass, instead of --merger.
+The CSV report has one row per example and one column per tool. Only the builtin diff backend is supported.
+
+--jobs N
+Compare N examples in parallel. Default is 1.
+
+--db file
+Record diff sizes in an SQLite database. Default is Resource/workspace/result/results.sqlite.
+
+--label name
+Name this run in the database, to compare runs in makeLatex.py.
+
+--golden-cache folder
+Cache normalized expected files in folder, keyed by merge commit and path.
+Default is Resource/workspace/golden-cache.
+
+--no-golden-cache
+Always normalize expected files from the workspace.
+
 --log-file file	
 specify the path of a log file. If this option is missing, log is not written to disk.
 
 --csv file
 Write a CSV report.
 
+--diff-backend builtin|git
+builtin (default) compares files in process, and the diff size is the number of non-whitespace characters in changed lines.
+Large differences of builtin are aligned by git diff instead of difflib, which may pick other changed lines.
+git runs git diff, and the diff size is the length of its output, which depends on the file paths.
+
 '''.format(sys.argv[0]) + optionUtils.getHelp())
 		exit(0)
 
-	formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 	try:
 		i = sys.argv.index('--log-file')
 		logger_path = sys.argv[i + 1]
-		fh = logging.FileHandler(logger_path)
-		fh.setLevel(logging.INFO)
-		# create formatter and add it to the handlers
-		fh.setFormatter(formatter)
-		# add the handlers to the logger
-		logger.addHandler(fh)
 	except:
-		pass
-
-	streamHandler = logging.StreamHandler()
-	streamHandler.setFormatter(formatter)
-	logger.addHandler(streamHandler)
+		logger_path = None
+	configureLogger(logger_path)
 
 	opt = optionUtils.Options()
 	opt.LoadDataset()
 	opt.LoadRange()
 
+	baseFolderExpected = os.path.join(opt.path_prefix, 'Resource/workspace')
+	resultFolder = os.path.join(opt.path_prefix, 'Resource/workspace/result/')
+
+	allMergers = '--all-mergers' in sys.argv
+	if allMergers:
+		mergers = listMergers(resultFolder)
+	else:
+		try:
+			i = sys.argv.index('--merger')
+			baseFolderActual = os.path.join(resultFolder, sys.argv[i + 1])
+		except:
+			print('Option --merger or --all-mergers is required.', file=sys.stderr)
+			exit(1)
+
+	try:
+		i = sys.argv.index('--diff-backend')
+		backend = sys.argv[i + 1]
+	except:
+		backend = 'builtin'
+	if backend not in ('builtin', 'git'):
+		print(f'Option --diff-backend must be builtin or git. What you passed is {backend}', file=sys.stderr)
+		exit(1)
+	if allMergers and backend != 'builtin':
+		print('Option --all-mergers only supports --diff-backend builtin.', file=sys.stderr)
+		exit(1)
+
+	if '--no-golden-cache' not in sys.argv:
+		try:
+			i = sys.argv.index('--golden-cache')
+			goldenCacheFolder = sys.argv[i + 1]
+		except:
+			goldenCacheFolder = os.path.join(baseFolderExpected, 'golden-cache')
+		goldenCache = goldenCacheModule.GoldenCache(goldenCacheFolder)
+
+	try:
+		i = sys.argv.index('--db')
+		dbPath = sys.argv[i + 1]
+	except:
+		dbPath = os.path.join(resultFolder, 'results.sqlite')
+	try:
+		i = sys.argv.index('--label')
+		label = sys.argv[i + 1]
+	except:
+		label = None
+	results = resultStore.ResultStore(dbPath)
+	results.startRun('compare', label, sys.argv[1:])
+
+	jobs = optionUtils.getPositiveInt('--jobs', 1)
+
 	try:
 		i = sys.argv.index('--csv')
 		arg = sys.argv[i + 1]
@@ -159,25 +450,38 @@ Write a CSV report.
 		csvfile = open(arg, 'w', newline='')
 		csvWriter = csv.writer(csvfile)
 
-		csvWriter.writerow(['repo', 'conflicting file', 'diff size'])
+		if allMergers:
+			csvWriter.writerow(['repo', 'conflicting file'] + mergers)
+		else:
+			csvWriter.writerow(['repo', 'conflicting file', 'diff size'])
 	except:
 		csvfile = None
 		csvWriter = None
 
-	baseFolderExpected = os.path.join(opt.path_prefix, 'Resource/workspace')
-
-	try:
-		i = sys.argv.index('--merger')
-		baseFolderActual = os.path.join(opt.path_prefix, 'Resource/workspace/result/', sys.argv[i + 1])
-	except:
-		print('Option --merger is required.', file=sys.stderr)
-		exit(1)
-
-	for i in opt.evaluationRange:
-		logger.info(f"Start verifying project {i} {opt.dataset[i].repoName}")
-		csvFields = processExample(baseFolderActual, baseFolderExpected, opt.dataset[i])
+	if allMergers:
+		logger.info(f'Comparing results of {", ".join(mergers)}')
+		task = functools.partial(_verifyExample, processExampleMatrix, resultFolder, baseFolderExpected, mergers)
+	else:
+		task = functools.partial(_verifyExample, processExample, baseFolderActual, baseFolderExpected, backend=backend)
+
+	examples = [(i, opt.dataset[i]) for i in opt.evaluationRange]
+	executor = None
+	if jobs == 1:
+		rows = map(task, examples)
+	else:
+		# map keeps the order of the evaluation range.
+		executor = futures.ProcessPoolExecutor(max_workers=jobs, initializer=_initWorker, initargs=(logger_path, goldenCache))
+		rows = executor.map(task, examples, chunksize=8)
+
+	tools = mergers if allMergers else [os.path.basename(baseFolderActual)]
+	for (i, subjectRepo), csvFields in zip(examples, rows):
 		if csvWriter is not None:
 			csvWriter.writerow(csvFields)
+		for tool, size in zip(tools, csvFields[2:]):
+			results.addComparison(subjectRepo, tool, None if size == '-' else size)
+	results.close()
 
+	if executor is not None:
+		executor.shutdown()
 	if csvfile is not None:
 		csvfile.close()
@@ -0,0 +1,23 @@
+import pytest
+
+import dataset
+
+
+@pytest.fixture
+def makeExample():
+	"""
+	A factory of SubjectRepo for tests. Commits are placeholders unless passed.
+	"""
+
+	def make(repoName='r1', conflictingFile='A.java', mergeCommit='merge'):
+		example = dataset.SubjectRepo()
+		example.repoUrl = f'https://example.com/{repoName}.git'
+		example.repoName = repoName
+		example.baseCommit = 'base'
+		example.leftCommit = 'left'
+		example.rightCommit = 'right'
+		example.mergeCommit = mergeCommit
+		example.conflictingFile = conflictingFile
+		return example
+
+	return make
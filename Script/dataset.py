@@ -1,4 +1,5 @@
 import os
+import typing
 
 from git import Repo
 
@@ -22,6 +23,9 @@ def _findRenamedFile(file, commit1, commit2, repo_path):
 
 
 class SubjectRepo:
+	# Without __dict__, an example takes about a third of the memory.
+	__slots__ = ('repoUrl', 'repoName', 'baseCommit', 'leftCommit', 'rightCommit', 'mergeCommit', 'conflictingFile', '_mergedFile')
+
 	def __init__(self):
 		self.repoUrl = None
 		self.repoName = None
@@ -41,3 +45,141 @@ class SubjectRepo:
 			self._mergedFile = _findRenamedFile(self.conflictingFile, self.baseCommit, self.mergeCommit, os.path.join(baseFolder, self.repoName))
 
 		return self._mergedFile
+
+
+def getExtension(file) -> str:
+	return os.path.splitext(file)[1].lower()
+
+
+class Dataset:
+	"""
+	A list of examples with indexes by repository, extension of the conflicting file, and merge commit.
+	The indexes are built on first use.
+	"""
+
+	def __init__(self, examples: typing.List[SubjectRepo]):
+		self._examples = examples
+		self._indexes = None
+
+	def __len__(self):
+		return len(self._examples)
+
+	def __getitem__(self, i) -> SubjectRepo:
+		return self._examples[i]
+
+	def __iter__(self):
+		return iter(self._examples)
+
+	def _getIndexes(self):
+		if self._indexes is None:
+			byRepository = {}
+			byExtension = {}
+			byMergeCommit = {}
+			for i, example in enumerate(self._examples):
+				byRepository.setdefault(example.repoName, []).append(i)
+				byExtension.setdefault(getExtension(example.conflictingFile), []).append(i)
+				byMergeCommit.setdefault(example.mergeCommit, []).append(i)
+			self._indexes = {'repo': byRepository, 'ext': byExtension, 'merge': byMergeCommit}
+		return self._indexes
+
+	def byRepository(self, repoName) -> typing.List[int]:
+		return self._getIndexes()['repo'].get(repoName, [])
+
+	def byExtension(self, extension) -> typing.List[int]:
+		"""
+		:param extension: such as .java
+		"""
+		return self._getIndexes()['ext'].get(extension.lower(), [])
+
+	def byMergeCommit(self, mergeCommit) -> typing.List[int]:
+		"""
+		:param mergeCommit: the full commit id, or an abbreviation of at least 4 characters.
+		"""
+		index = self._getIndexes()['merge']
+		if mergeCommit in index or len(mergeCommit) < 4:
+			return index.get(mergeCommit, [])
+		return [i for commit, indices in index.items() if commit.startswith(mergeCommit) for i in indices]
+
+	def _matchFilter(self, expression) -> typing.Set[int]:
+		key, sep, values = expression.partition('=')
+		if len(sep) == 0 or len(values) == 0:
+			raise ValueError(f'{expression} is not in the form of key=value.')
+		matched = set()
+		for value in values.split(','):
+			if key == 'repo':
+				matched.update(self.byRepository(value))
+			elif key == 'ext':
+				matched.update(self.byExtension(value if value.startswith('.') else '.' + value))
+			elif key == 'merge':
+				matched.update(self.byMergeCommit(value))
+			elif key == 'id':
+				s = value.find('..')
+				if s == -1:
+					matched.add(int(value))
+				else:
+					matched.update(range(int(value[0:s]), int(value[s + 2:])))
+			else:
+				raise ValueError(f'{key} is not a filter key. Use repo, ext, merge, or id.')
+		return matched
+
+	def select(self, indices, filters) -> typing.List[int]:
+		"""
+		:param indices: indices of examples in the order to keep
+		:param filters: expressions in the form of key=value1,value2. An example is selected if it matches all expressions.
+		:raise ValueError: an expression is invalid
+		"""
+		selected = None
+		for expression in filters:
+			matched = self._matchFilter(expression)
+			selected = matched if selected is None else selected & matched
+		if selected is None:
+			return list(indices)
+		return [i for i in indices if i in selected]
+
+	def orderByRepository(self, indices) -> typing.List[int]:
+		"""
+		Move examples of the same repository next to each other, so that the clone and caches of a repository stay warm.
+		Repositories are in the order of their first example, and examples of a repository keep their order.
+		"""
+		groups = {}
+		for i in indices:
+			groups.setdefault(self._examples[i].repoName, []).append(i)
+		return [i for group in groups.values() for i in group]
+
+	def orderByCost(self, indices, costs) -> typing.List[int]:
+		"""
+		Run the most costly examples first, so that a parallel run doesn't end waiting on one slow example.
+		Examples of a repository stay next to each other, because they run one after another anyway.
+		Repositories are in the order of their total cost, and examples of a repository in the order of their cost, both descending.
+
+		:param costs: a dict from index to the estimated cost of the example
+		"""
+		groups = {}
+		for i in indices:
+			groups.setdefault(self._examples[i].repoName, []).append(i)
+		ordered = sorted(groups.values(), key=lambda group: -sum(costs[i] for i in group))
+		return [i for group in ordered for i in sorted(group, key=lambda i: -costs[i])]
+
+	def shard(self, indices, shardIndex, shardCount, costs=None) -> typing.List[int]:
+		"""
+		Split examples into shards of about the same total cost, and keep those of one shard in their order.
+		Examples of a repository are in the same shard, so that only one machine clones the repository.
+		Repositories are assigned from the most costly one to the shard with the least cost so far,
+		so every machine computes the same shards from the same indices and costs.
+
+		:param shardIndex: 0-based index of the shard to keep
+		:param costs: a dict from index to the estimated cost of the example. Default is 1 for every example.
+		"""
+		groups = {}
+		for i in indices:
+			groups.setdefault(self._examples[i].repoName, []).append(i)
+		groupCosts = {name: sum(1 if costs is None else costs[i] for i in group) for name, group in groups.items()}
+
+		loads = [0] * shardCount
+		kept = set()
+		for name in sorted(groups, key=lambda name: (-groupCosts[name], name)):
+			target = min(range(shardCount), key=lambda s: (loads[s], s))
+			loads[target] += groupCosts[name]
+			if target == shardIndex:
+				kept.add(name)
+		return [i for i in indices if self._examples[i].repoName in kept]
@@ -47,10 +47,9 @@ if __name__ == '__main__':
 	opt = optionUtils.Options()
 	opt.LoadDataset()
 
-	for example in opt.dataset:
-		if example.repoName == repoName:
-			runAction(folder, example)
-			exit(0)
+	for i in opt.dataset.byRepository(repoName):
+		runAction(folder, opt.dataset[i])
+		exit(0)
 
 	print(f'Repository {repoName} is not found.', file=sys.stderr)
 	input()
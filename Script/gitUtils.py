@@ -0,0 +1,210 @@
+import os
+import subprocess
+from concurrent import futures
+
+# Commits fetched by prefetchRepos are pinned under this namespace, so that a rerun can tell what is present
+# without touching objects. In a partial clone, asking git about a missing object fetches it on the spot.
+FETCHED_REF_PREFIX = 'refs/conflictbench/'
+# prefetchRepos fetches at most this many repositories at the same time by default. Fetching is bound by the network, not the CPUs.
+PREFETCH_JOBS = 8
+
+
+def _git(args, cwd, **kwargs):
+	return subprocess.run(['git'] + args, cwd=cwd, capture_output=True, text=True, **kwargs)
+
+
+def listFetchedCommits(repoPath):
+	proc = _git(['for-each-ref', '--format=%(objectname)', FETCHED_REF_PREFIX], repoPath)
+	return set(proc.stdout.split())
+
+
+def bundlePath(bundleFolder, repoName):
+	return os.path.join(bundleFolder, repoName + '.bundle')
+
+
+def fetchBundle(repoPath, bundleFile):
+	"""
+	Fetch the commits pinned in a bundle made by bundleTool.py, with everything they reach.
+
+	:return: True if the bundle is fetched, False if it doesn't exist or git fails.
+	"""
+	if bundleFile is None or not os.path.isfile(bundleFile):
+		return False
+	proc = _git(['fetch', '--no-tags', '--no-write-fetch-head', os.path.abspath(bundleFile), f'{FETCHED_REF_PREFIX}*:{FETCHED_REF_PREFIX}*'], repoPath)
+	return proc.returncode == 0
+
+
+def listBlobs(repoPath, sha, paths):
+	"""
+	Resolve paths at a commit to blob ids. Only trees are read, so no blob is fetched.
+
+	:return: a dict from path to blob id. Paths that don't exist at the commit are absent.
+	"""
+	proc = _git(['ls-tree', '-z', sha, '--'] + list(paths), repoPath)
+	blobs = {}
+	for entry in proc.stdout.split('\0'):
+		if len(entry) == 0:
+			continue
+		# Format is "<mode> SP <type> SP <object> TAB <file>"
+		info, path = entry.split('\t', 1)
+		mode, objectType, oid = info.split(' ')
+		if objectType == 'blob':
+			blobs[path] = oid
+	return blobs
+
+
+def blobSizes(repoPath, names):
+	"""
+	:param names: object names that cat-file understands, usually <sha>:<path>
+	:return: a dict from name to the size of the blob. Names of missing objects are absent.
+	A partial clone gives an empty dict, because git would fetch missing blobs to tell their sizes.
+	"""
+	if not os.path.isdir(os.path.join(repoPath, '.git')) or _git(['config', '--get', 'remote.origin.promisor'], repoPath).stdout.strip() == 'true':
+		return {}
+	names = list(names)
+	proc = _git(['cat-file', '--batch-check'], repoPath, input=''.join(name + '\n' for name in names))
+	sizes = {}
+	# Every line is "<oid> SP <type> SP <size>" or "<object> SP missing", in the order of names.
+	for name, line in zip(names, proc.stdout.splitlines()):
+		parts = line.split()
+		if len(parts) == 3 and parts[1] == 'blob':
+			sizes[name] = int(parts[2])
+	return sizes
+
+
+def preparePartialRepo(repoPath, repoUrl, examples, timeout=None, bundleFile=None):
+	"""
+	Prepare a blobless clone that has every commit of the given examples, and only the blobs of their conflicting files.
+
+	All missing commits are fetched in one call, then all needed blobs in another call.
+	The main worktree becomes sparse, containing only the conflicting files and the renamed merged files.
+
+	:param examples: SubjectRepo objects of the repository
+	:param bundleFile: a bundle of the repository to fetch from before the network. Commits from the bundle have all their blobs.
+	:return: the number of commits fetched from the network
+	"""
+	if not os.path.isdir(os.path.join(repoPath, '.git')):
+		os.makedirs(repoPath, exist_ok=True)
+		_git(['init', '-q'], repoPath, check=True)
+		_git(['remote', 'add', 'origin', repoUrl], repoPath, check=True)
+	_git(['config', 'core.longpaths', 'true'], repoPath)
+
+	def listMissing():
+		fetched = listFetchedCommits(repoPath)
+		missing = []
+		for example in examples:
+			for sha in (example.baseCommit, example.leftCommit, example.rightCommit, example.mergeCommit):
+				if sha not in fetched and sha not in missing:
+					missing.append(sha)
+		return missing
+
+	missing = listMissing()
+	if len(missing) > 0 and fetchBundle(repoPath, bundleFile):
+		missing = listMissing()
+
+	if len(missing) > 0:
+		refspecs = [f'{sha}:{FETCHED_REF_PREFIX}{sha}' for sha in missing]
+		proc = _git(['fetch', '--filter=blob:none', '--no-tags', '--no-write-fetch-head', 'origin'] + refspecs, repoPath, timeout=timeout)
+		if proc.returncode != 0:
+			raise subprocess.SubprocessError(f'Failed to fetch {len(missing)} commits from {repoUrl}: {proc.stderr[0:500]}')
+
+	sparsePaths = []
+	blobs = set()
+	for example in examples:
+		if example.conflictingFile not in sparsePaths:
+			sparsePaths.append(example.conflictingFile)
+		for sha in (example.baseCommit, example.leftCommit, example.rightCommit, example.mergeCommit):
+			if sha in missing:
+				blobs.update(listBlobs(repoPath, sha, [example.conflictingFile]).values())
+
+	if len(blobs) > 0:
+		# This is how git itself fetches missing objects of a partial clone, except that all blobs go in one request.
+		proc = _git(['-c', 'fetch.negotiationAlgorithm=noop', 'fetch', '--filter=blob:none', '--no-tags', '--no-write-fetch-head',
+					 '--recurse-submodules=no', 'origin'] + sorted(blobs), repoPath, timeout=timeout)
+		if proc.returncode != 0:
+			raise subprocess.SubprocessError(f'Failed to fetch {len(blobs)} blobs from {repoUrl}: {proc.stderr[0:500]}')
+
+	for example in examples:
+		# A path that still exists in the merge commit can't be the source of a rename,
+		# so rename detection, which may fetch many blobs, is only needed when the conflicting file is gone.
+		if len(listBlobs(repoPath, example.mergeCommit, [example.conflictingFile])) == 0:
+			mergedFile = example.getMergedFile(os.path.dirname(repoPath))
+			if mergedFile not in sparsePaths:
+				sparsePaths.append(mergedFile)
+
+	_git(['sparse-checkout', 'set', '--no-cone'] + sparsePaths, repoPath, check=True)
+	return len(missing)
+
+
+def prefetchRepos(examples, workspaceFolder, jobs, logger, timeout=None, bundleFolder=None):
+	"""
+	Call preparePartialRepo for every repository of the examples, one repository per thread.
+
+	:param examples: SubjectRepo objects. Examples of the same repository are prepared together.
+	:param jobs: number of threads, or None for PREFETCH_JOBS
+	:param bundleFolder: the folder of <repoName>.bundle files, or None
+	"""
+	repos = {}
+	for example in examples:
+		repos.setdefault(example.repoName, []).append(example)
+	if len(repos) == 0:
+		return
+	if jobs is None:
+		jobs = min(PREFETCH_JOBS, len(repos))
+
+	def prepare(repoExamples):
+		repoPath = os.path.join(workspaceFolder, repoExamples[0].repoName)
+		bundleFile = None if bundleFolder is None else bundlePath(bundleFolder, repoExamples[0].repoName)
+		count = preparePartialRepo(repoPath, repoExamples[0].repoUrl, repoExamples, timeout, bundleFile)
+		logger.debug(f'Fetched {count} commits for {repoExamples[0].repoName}')
+
+	with futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+		tasks = {executor.submit(prepare, repoExamples): name for name, repoExamples in repos.items()}
+		for task in futures.as_completed(tasks):
+			try:
+				task.result()
+			except Exception as e:
+				logger.error(f'Failed to prefetch {tasks[task]}: {e}')
+
+
+class ObjectReader:
+	"""
+	Read objects through one long-lived `git cat-file --batch` process instead of spawning git for every object.
+	"""
+
+	def __init__(self, repoPath):
+		self.repoPath = repoPath
+		self._proc = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=repoPath,
+									  stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+	def read(self, name):
+		"""
+		:param name: an object name that cat-file understands, usually <sha>:<path>
+		:return: content of the blob, or None if name doesn't refer to a blob.
+		"""
+		self._proc.stdin.write(name.encode('utf-8') + b'\n')
+		self._proc.stdin.flush()
+		header = self._proc.stdout.readline()
+		if len(header) == 0:
+			raise subprocess.SubprocessError(f'git cat-file exited unexpectedly in {self.repoPath}')
+
+		# Format is "<oid> SP <type> SP <size> LF <contents> LF", or "<object> SP missing LF".
+		parts = header.split()
+		if len(parts) != 3 or parts[2].isdigit() is False:
+			return None
+		content = self._proc.stdout.read(int(parts[2]))
+		self._proc.stdout.read(1)
+		if parts[1] != b'blob':
+			return None
+		return content
+
+	def close(self):
+		if self._proc.poll() is None:
+			self._proc.stdin.close()
+			self._proc.wait()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
@@ -0,0 +1,62 @@
+import hashlib
+import os
+import tempfile
+
+# Bump when normalization changes, so that old entries are not used.
+NORMALIZATION_VERSION = '1'
+
+
+def readHead(repoPath):
+	"""
+	:return: the commit that the worktree at repoPath has checked out, or None if HEAD is not detached.
+	"""
+	try:
+		with open(os.path.join(repoPath, '.git', 'HEAD'), 'r') as f:
+			head = f.read().strip()
+	except OSError:
+		return None
+	if head.startswith('ref:'):
+		return None
+	return head
+
+
+class GoldenCache:
+	"""
+	An on-disk cache of normalized expected solutions, keyed by (merge commit, path).
+
+	An entry holds the hash of the canonical lines on the first line, followed by the canonical lines.
+	The expected file is a pure function of the key, so entries never need invalidation.
+	"""
+
+	def __init__(self, root):
+		self.root = root
+		os.makedirs(root, exist_ok=True)
+
+	@staticmethod
+	def key(mergeCommit, path):
+		return hashlib.sha256('\0'.join((NORMALIZATION_VERSION, mergeCommit, path)).encode('utf-8')).hexdigest()
+
+	def _path(self, key):
+		return os.path.join(self.root, key[0:2], key)
+
+	def get(self, mergeCommit, path):
+		"""
+		:return: (hash, canonical lines), or None if not cached.
+		"""
+		try:
+			with open(self._path(self.key(mergeCommit, path)), 'r', encoding='utf-8') as f:
+				content = f.read()
+		except FileNotFoundError:
+			return None
+		digest, _, body = content.partition('\n')
+		return digest, body.split('\n') if len(body) > 0 else []
+
+	def put(self, mergeCommit, path, digest, canonical):
+		entry = self._path(self.key(mergeCommit, path))
+		os.makedirs(os.path.dirname(entry), exist_ok=True)
+		# Workers of compare.py --jobs may read the entry while it's being written, so it's renamed into place once complete.
+		fd, tmp = tempfile.mkstemp(dir=os.path.dirname(entry))
+		with os.fdopen(fd, 'w', encoding='utf-8') as f:
+			f.write(digest + '\n')
+			f.write('\n'.join(canonical))
+		os.replace(tmp, entry)
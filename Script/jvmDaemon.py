@@ -0,0 +1,212 @@
+"""
+Client of JvmDaemon.java, which runs the main method of Java-based merge tools in one long-lived JVM.
+Every request loads the tool in a new class loader, so static state of the tool doesn't leak between requests.
+
+The daemon prints "PORT <port>" on stdout when it's ready, or "NO-EXIT-TRAP" if the JVM can't intercept System.exit.
+Protocol, one request per connection:
+request: main class, number of arguments, arguments, number of abort patterns, abort patterns, each on one line.
+response: "EXIT|ABORTED <exit code> <stdout length> <stderr length>" on one line, followed by stdout and stderr bytes.
+ABORTED means a line of stderr contains an abort pattern. The daemon exits after that because the tool may still be running.
+"""
+import atexit
+import hashlib
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import zipfile
+
+STARTUP_TIMEOUT = 30
+
+# Java executables that can't intercept System.exit, so tools always run in new processes with them
+_noExitTrap = set()
+
+_source = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'JvmDaemon.java')
+
+
+class DaemonUnavailable(Exception):
+	"""
+	The daemon can't run the request. The caller should run the tool in a new process.
+	"""
+	pass
+
+
+def _compile(javaPath):
+	"""
+	Compile JvmDaemon.java with the javac next to javaPath, once per version of the source.
+
+	:return: the folder containing JvmDaemon.class
+	"""
+	javac = os.path.join(os.path.dirname(javaPath), 'javac') if os.path.dirname(javaPath) else 'javac'
+	with open(_source, 'rb') as f:
+		key = hashlib.sha256(f.read() + javac.encode('utf-8')).hexdigest()[0:16]
+	classesFolder = os.path.join(tempfile.gettempdir(), 'conflictbench-jvmdaemon-' + key)
+	if os.path.isfile(os.path.join(classesFolder, 'JvmDaemon.class')):
+		return classesFolder
+
+	tmp = tempfile.mkdtemp(prefix='conflictbench-jvmdaemon-')
+	try:
+		proc = subprocess.run([javac, '-d', tmp, _source], capture_output=True)
+	except OSError as e:
+		raise DaemonUnavailable(f'Failed to run {javac}: {e}')
+	if proc.returncode != 0:
+		raise DaemonUnavailable(f'Failed to compile {_source}: ' + proc.stderr.decode('utf-8', errors='ignore')[0:500])
+	try:
+		os.replace(tmp, classesFolder)
+	except OSError:
+		# Another process has compiled it.
+		pass
+	return classesFolder
+
+
+def readJarManifest(jarPath):
+	"""
+	:return: (Main-Class, classpath) as `java -jar jarPath` would use.
+	"""
+	with zipfile.ZipFile(jarPath) as jar:
+		manifest = jar.read('META-INF/MANIFEST.MF').decode('utf-8', errors='ignore')
+
+	# Lines longer than 72 bytes continue on the next line, which starts with a space.
+	attributes = {}
+	lastKey = None
+	for line in manifest.splitlines():
+		if line.startswith(' ') and lastKey is not None:
+			attributes[lastKey] += line[1:]
+		elif ':' in line:
+			lastKey, value = line.split(':', 1)
+			attributes[lastKey] = value.strip()
+
+	classpath = [os.path.abspath(jarPath)]
+	for entry in attributes.get('Class-Path', '').split():
+		classpath.append(os.path.join(os.path.dirname(os.path.abspath(jarPath)), entry))
+	return attributes.get('Main-Class'), classpath
+
+
+def _drain(stream):
+	while len(stream.read(65536)) > 0:
+		pass
+
+
+class JvmDaemon:
+	def __init__(self, javaPath, classpath, cwd):
+		self.javaPath = javaPath
+		self.classpath = classpath
+		self.cwd = cwd
+		# Requests are serialized because stdout and stderr are global in a JVM.
+		self.lock = threading.Lock()
+		# Don't try again and again if the daemon can't start at all, e.g. javac is missing.
+		self.startFailed = False
+		self._proc = None
+		self._port = None
+
+	def start(self):
+		try:
+			classesFolder = _compile(self.javaPath)
+		except DaemonUnavailable:
+			self.startFailed = True
+			raise
+		noExitTrap = False
+		# The daemon loads the tool from the classpath in its arguments, in a new class loader per request.
+		cmd = ['-cp', classesFolder, 'JvmDaemon'] + [os.path.join(self.cwd, path) for path in self.classpath]
+		# Java 12+ needs the flag to intercept System.exit. Java 8 to 11 refuse to start with it.
+		for flags in (['-Djava.security.manager=allow'], []):
+			try:
+				proc = subprocess.Popen([self.javaPath] + flags + cmd, cwd=self.cwd,
+										stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+			except OSError as e:
+				self.startFailed = True
+				raise DaemonUnavailable(f'Failed to run {self.javaPath}: {e}')
+			lines = []
+			reader = threading.Thread(target=lambda: lines.append(proc.stdout.readline()), daemon=True)
+			reader.start()
+			reader.join(STARTUP_TIMEOUT)
+			if len(lines) == 1 and lines[0].strip() == b'NO-EXIT-TRAP':
+				noExitTrap = True
+			if len(lines) == 1 and lines[0].startswith(b'PORT '):
+				self._proc = proc
+				self._port = int(lines[0].split()[1])
+				# The daemon shouldn't write more, but if it does, a full pipe must not block it.
+				threading.Thread(target=_drain, args=(proc.stdout,), daemon=True).start()
+				return
+			proc.kill()
+			proc.wait()
+		self.startFailed = True
+		if noExitTrap:
+			_noExitTrap.add(self.javaPath)
+			raise DaemonUnavailable(f"{self.javaPath} can't intercept System.exit, so the JVM daemon is off for it")
+		raise DaemonUnavailable(f'JVM daemon for {self.classpath} did not start')
+
+	def stop(self):
+		if self._proc is not None:
+			self._proc.kill()
+			self._proc.wait()
+			self._proc = None
+
+	def run(self, mainClass, args, timeout, abortPatterns=()):
+		"""
+		:return: (exit code, stdout bytes, stderr bytes, aborted)
+		:raise subprocess.TimeoutExpired: the tool didn't finish in time. The daemon is stopped.
+		:raise DaemonUnavailable: the daemon didn't start, or crashed.
+		"""
+		if self.startFailed or self.javaPath in _noExitTrap:
+			raise DaemonUnavailable(f'JVM daemon for {self.classpath} failed to start before')
+		if self._proc is None or self._proc.poll() is not None:
+			self.start()
+
+		request = [mainClass, str(len(args))] + [str(a) for a in args] + [str(len(abortPatterns))] + list(abortPatterns)
+		try:
+			sock = socket.create_connection(('127.0.0.1', self._port), timeout=STARTUP_TIMEOUT)
+		except OSError as e:
+			self.stop()
+			raise DaemonUnavailable(f'Failed to connect to JVM daemon: {e}')
+
+		with sock, sock.makefile('rb') as response:
+			try:
+				sock.sendall(('\n'.join(request) + '\n').encode('utf-8'))
+				sock.settimeout(timeout)
+				header = response.readline()
+				parts = header.split()
+				if len(parts) != 4:
+					self.stop()
+					raise DaemonUnavailable(f'JVM daemon exited while running {mainClass}')
+				outs = response.read(int(parts[2]))
+				errs = response.read(int(parts[3]))
+			except socket.timeout:
+				self.stop()
+				raise subprocess.TimeoutExpired(mainClass, timeout)
+			except OSError as e:
+				self.stop()
+				raise DaemonUnavailable(f'Lost connection to JVM daemon: {e}')
+
+		aborted = parts[0] == b'ABORTED'
+		if aborted:
+			self.stop()
+		return int(parts[1]), outs, errs, aborted
+
+
+_daemons = {}
+_lock = threading.Lock()
+
+
+def run(javaPath, classpath, mainClass, args, cwd, timeout, abortPatterns=()):
+	"""
+	Run mainClass in the daemon for (javaPath, classpath, cwd), starting the daemon if needed.
+
+	See JvmDaemon.run for return value and exceptions.
+	"""
+	key = (javaPath, tuple(classpath), os.path.abspath(cwd))
+	with _lock:
+		daemon = _daemons.get(key)
+		if daemon is None:
+			daemon = JvmDaemon(javaPath, list(classpath), os.path.abspath(cwd))
+			_daemons[key] = daemon
+
+	with daemon.lock:
+		return daemon.run(mainClass, args, timeout, abortPatterns)
+
+
+@atexit.register
+def stopAll():
+	for daemon in _daemons.values():
+		daemon.stop()
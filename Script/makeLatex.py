@@ -1,14 +1,14 @@
 import csv
 import sys
 
-if __name__ == '__main__':
-	csv_file = sys.argv[-1]
+import resultStore
 
-	java_files = []
-	javaZero = 0
-	non_java_files = []
-	nonJavaZero = 0
 
+def loadCsv(csv_file):
+	"""
+	:return: a list of (repo, conflicting file, diff size) from a CSV report of compare.py
+	"""
+	rows = []
 	with open(csv_file, newline='', encoding='utf-8') as f:
 		reader = csv.DictReader(f)
 		for row in reader:
@@ -17,19 +17,60 @@ if __name__ == '__main__':
 			except (ValueError, TypeError):
 				continue  # skip rows with non-numeric or empty diff size
 
-			repo = row['repo'].strip()
-			file_path = row['conflicting file'].strip()
+			rows.append((row['repo'].strip(), row['conflicting file'].strip(), diff_size))
+	return rows
+
+
+def getCompareRun(store, label=None):
+	"""
+	:return: id of the latest compare run with the label, or the latest compare run if label is None.
+	"""
+	if label is None:
+		found = store.query("SELECT max(id) FROM runs WHERE kind = 'compare'")
+	else:
+		found = store.query("SELECT max(id) FROM runs WHERE kind = 'compare' AND label = ?", (label,))
+	if found[0][0] is None:
+		print(f'No compare run{"" if label is None else " labeled " + label} is in the database.', file=sys.stderr)
+		exit(1)
+	return found[0][0]
+
 
-			if file_path.endswith(".java"):
-				if diff_size == 0:
-					javaZero += 1
-					continue
-				java_files.append((repo, diff_size))
-			else:
-				if diff_size == 0:
-					nonJavaZero += 1
-					continue
-				non_java_files.append((repo, diff_size))
+def getMergeRuns(store, label):
+	"""
+	:return: ids of the merge runs with the label, e.g. the shards of a run
+	"""
+	found = [row[0] for row in store.query("SELECT id FROM runs WHERE kind = 'merge' AND label = ?", (label,))]
+	if len(found) == 0:
+		print(f'No merge run labeled {label} is in the database.', file=sys.stderr)
+		exit(1)
+	return found
+
+
+def loadDb(store, tool, runId):
+	"""
+	:return: a list of (repo, conflicting file, diff size) of the tool in the compare run
+	"""
+	return store.query('SELECT e.repoName, e.conflictingFile, c.diffSize FROM comparisons c JOIN examples e ON e.id = c.exampleId '
+					   'WHERE c.runId = ? AND c.tool = ? AND c.diffSize IS NOT NULL', (runId, tool))
+
+
+def printDiffSizes(rows):
+	java_files = []
+	javaZero = 0
+	non_java_files = []
+	nonJavaZero = 0
+
+	for repo, file_path, diff_size in rows:
+		if file_path.endswith(".java"):
+			if diff_size == 0:
+				javaZero += 1
+				continue
+			java_files.append((repo, diff_size))
+		else:
+			if diff_size == 0:
+				nonJavaZero += 1
+				continue
+			non_java_files.append((repo, diff_size))
 
 	# Sort by diff size ascending
 	java_files.sort(key=lambda x: x[1])
@@ -45,3 +86,98 @@ if __name__ == '__main__':
 	print(f'{nonJavaZero} are identical')
 	for repo, size in non_java_files[:3]:
 		print(r'\ShowDiffSize{' + repo + '}{' + str(size) + '}')
+
+
+def printLeaderboard(store, runId, mergeRunIds=None):
+	"""
+	Print the number of examples and identical results of every tool in the compare run, with its mean duration and peak memory.
+
+	:param mergeRunIds: take duration and memory from these merge runs.
+	None takes, for every compared example, the latest run of the tool before the compare run, so that runs resumed with --resume count.
+	"""
+	if mergeRunIds is None:
+		usage = '''
+			SELECT t.tool, t.duration, t.maxRss FROM comparisons c JOIN toolRuns t ON t.tool = c.tool AND t.exampleId = c.exampleId
+			WHERE c.runId = ? AND t.runId = (SELECT max(t2.runId) FROM toolRuns t2 WHERE t2.tool = c.tool AND t2.exampleId = c.exampleId AND t2.runId < c.runId)'''
+		params = (runId,)
+	else:
+		usage = f'SELECT tool, duration, maxRss FROM toolRuns WHERE runId IN ({", ".join("?" * len(mergeRunIds))})'
+		params = tuple(mergeRunIds)
+	rows = store.query(f'''
+		WITH usage AS ({usage})
+		SELECT c.tool, count(c.diffSize), sum(c.diffSize = 0), sum(c.diffSize = 0 AND e.conflictingFile LIKE '%.java'),
+			(SELECT avg(u.duration) FROM usage u WHERE u.tool = c.tool), (SELECT max(u.maxRss) FROM usage u WHERE u.tool = c.tool)
+		FROM comparisons c JOIN examples e ON e.id = c.exampleId
+		WHERE c.runId = ?
+		GROUP BY c.tool
+		ORDER BY sum(c.diffSize = 0) DESC''', params + (runId,))
+	for tool, compared, identical, javaIdentical, duration, maxRss in rows:
+		duration = '-' if duration is None else f'{duration:.1f}'
+		maxRss = '-' if maxRss is None else str(maxRss // 1024)
+		print(r'\ShowTool{' + tool + '}{' + str(compared) + '}{' + str(identical) + '}{' + str(javaIdentical) + '}{' + duration + '}{' + maxRss + '}')
+
+
+def printChanges(store, tool, runId1, runId2):
+	"""
+	Print examples whose diff size of the tool differs between two compare runs.
+	"""
+	rows = store.query('''
+		SELECT e.repoName, e.conflictingFile, c1.diffSize, c2.diffSize
+		FROM comparisons c1 JOIN comparisons c2 ON c2.exampleId = c1.exampleId AND c2.tool = c1.tool
+			JOIN examples e ON e.id = c1.exampleId
+		WHERE c1.runId = ? AND c2.runId = ? AND c1.tool = ? AND c1.diffSize IS NOT c2.diffSize
+		ORDER BY e.repoName''', (runId1, runId2, tool))
+	print(f'{len(rows)} examples changed')
+	for repo, file, size1, size2 in rows:
+		print(r'\ShowChange{' + repo + '}{' + file + '}{' + str(size1) + '}{' + str(size2) + '}')
+
+
+if __name__ == '__main__':
+	if '--help' in sys.argv:
+		print('''
+{0} file.csv
+Print the LaTeX summary of a CSV report of compare.py.
+
+{0} --db file --tool name [--label name]
+Same, but for the tool in the latest compare run with the label, from the database of compare.py.
+
+{0} --db file --leaderboard [--label name] [--merge-label name]
+Print identical results, mean duration, and peak memory (MiB) of every tool in the compare run.
+Duration and memory are from the merge runs labeled --merge-label.
+Without it, they are from the latest run of the tool on each compared example, so examples skipped by merge.py --resume count their earlier run.
+
+{0} --db file --tool name --changes label1 label2
+Print examples whose diff size of the tool differs between two compare runs.
+'''.format(sys.argv[0]))
+		exit(0)
+
+	if '--db' not in sys.argv:
+		printDiffSizes(loadCsv(sys.argv[-1]))
+		exit(0)
+
+	store = resultStore.ResultStore(sys.argv[sys.argv.index('--db') + 1])
+	try:
+		i = sys.argv.index('--label')
+		label = sys.argv[i + 1]
+	except:
+		label = None
+	try:
+		i = sys.argv.index('--tool')
+		tool = sys.argv[i + 1]
+	except:
+		tool = None
+
+	if '--leaderboard' in sys.argv:
+		mergeRunIds = None
+		if '--merge-label' in sys.argv:
+			mergeRunIds = getMergeRuns(store, sys.argv[sys.argv.index('--merge-label') + 1])
+		printLeaderboard(store, getCompareRun(store, label), mergeRunIds)
+	elif tool is None:
+		print('Option --tool is required.', file=sys.stderr)
+		exit(1)
+	elif '--changes' in sys.argv:
+		i = sys.argv.index('--changes')
+		printChanges(store, tool, getCompareRun(store, sys.argv[i + 1]), getCompareRun(store, sys.argv[i + 2]))
+	else:
+		printDiffSizes(loadDb(store, tool, getCompareRun(store, label)))
+	store.close()
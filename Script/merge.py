@@ -3,21 +3,31 @@
 # Script to run experiments
 import datetime
 import enum
+import functools
 import glob
 import os
 import sys
 import logging
-import shutil
 import pathlib
 import subprocess
+import tempfile
 import time
+from concurrent import futures
 
-from git import Repo
+from git import GitCommandError, Repo
 
 import dataset
+import gitUtils
+import goldenCache
 import mergeTools
 import optionUtils
 import ProcessUtils
+import progressMonitor
+import resultStore
+import runManifest
+import snapshotCache
+import timeoutPolicy
+import workspaceManager
 
 # Set path
 workspace = 'Resource/workspace'
@@ -28,8 +38,8 @@ commandLineError = 1
 # Set constant
 # Set the longest waiting time to wait for a task to execute (Unit: minutes)
 MAX_WAITINGTIME_MERGE = 5 * 60
-# maximum waiting time to resolve a merge conflict.
-MAX_WAITINGTIME_RESOLVE = 3 * 60
+# The tool runners in mergeTools.py define the default timeout.
+MAX_WAITINGTIME_RESOLVE = mergeTools.MAX_WAITINGTIME_RESOLVE
 Rename_Threshold = "90%"
 
 
@@ -88,23 +98,17 @@ class Merger(enum.Enum):
 # 		pass
 
 
-def merge_with_AutoMerge(toolPath, left, base, right, output_path, logger):
+def merge_with_AutoMerge(toolPath, left, base, right, output_path, logger, timeout=MAX_WAITINGTIME_RESOLVE):
 	# I can't use ProcessUtils.runProcess because AutoMerge needs to look up the git library.
 	cmd = f"{javaPath} -jar {toolPath} -o {output_path} -m structured -log info -f -S {left} {base} {right}"
 	# Place the libgit binary at the same folder as the jar, unless the library is globally installed.
 	cwd = pathlib.Path(toolPath).parent
 	logger.debug(f'cmd: {cmd}')
-	proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, cwd=cwd)
-	try:
-		outs, errs = proc.communicate(timeout=MAX_WAITINGTIME_RESOLVE)
-		if proc.returncode != 0:
-			errs = errs.decode('utf-8', errors='ignore')
-			errs = errs[0:min(500, len(errs))]
-			raise subprocess.SubprocessError("Fail to run '" + cmd + "' in shell: " + errs)
-	except subprocess.TimeoutExpired:
-		# Terminate the unfinished process
-		proc.terminate()
-		raise subprocess.SubprocessError(f'{cmd} does not finish in time')
+	result = mergeTools.runJarInJvmDaemon(javaPath, toolPath, ['-o', output_path, '-m', 'structured', '-log', 'info', '-f', '-S', left, base, right],
+										  cwd, cmd, logger, timeout=timeout)
+	if result is None:
+		result = ProcessUtils.run(cmd, timeout, cwd=cwd, shell=True, captureStdout=False)
+	result.check()
 
 
 # merge two commits
@@ -155,14 +159,51 @@ def createSparseWorktree(mainWorktree, newWorktree, sha, file_path):
 	subprocess.run(['git', 'checkout', '-f'], cwd=newWorktree, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
 
 
+def compareNeedsClone(goldenCacheFolder, workspaceFolder, examplesByRepo, repoName):
+	"""
+	A keepClone of WorkspaceManager. compare.py reads the expected files of the examples from the clone,
+	unless the golden cache has them under their conflicting files.
+
+	:param examplesByRepo: a dict from repository name to its examples in the run
+	"""
+	cache = goldenCache.GoldenCache(goldenCacheFolder)
+	for example in examplesByRepo.get(repoName, []):
+		try:
+			if example.getMergedFile(workspaceFolder) != example.conflictingFile:
+				return True
+		except (GitCommandError, OSError):
+			return True
+		if cache.get(example.mergeCommit, example.conflictingFile) is None:
+			return True
+	return False
+
+
+def _hasCommit(repo, sha):
+	try:
+		# In a partial clone, asking about a missing object would fetch it on the spot. Git before 2.44 ignores the variable.
+		with repo.git.custom_environment(GIT_NO_LAZY_FETCH='1'):
+			repo.git.cat_file('-e', sha + '^{commit}')
+		return True
+	except GitCommandError:
+		return False
+
+
 def prepare_repo(local_path, project_url, sha):
+	"""
+	Check out sha in the clone at local_path. A missing commit is fetched from the bundle in bundleFolder, or from project_url.
+	"""
 	if os.path.isdir(local_path) and os.path.isdir(os.path.join(local_path, '.git')):
 		repo = Repo(local_path)
 	else:
 		os.makedirs(local_path, exist_ok=True)
 		repo = Repo.init(local_path)
 		repo.create_remote('origin', project_url)
-		repo.remotes.origin.fetch(sha)
+	if not _hasCommit(repo, sha):
+		# Another example of the repository may have created the clone, but this commit isn't fetched yet.
+		bundleFile = None if bundleFolder is None else gitUtils.bundlePath(bundleFolder, os.path.basename(local_path))
+		if not (gitUtils.fetchBundle(local_path, bundleFile) and _hasCommit(repo, sha)):
+			repo.remotes.origin.fetch(sha)
+		closeObjectReader(local_path)
 
 	repo.git.config('core.longpaths', 'true')
 	repo.git.checkout(sha, force=True)
@@ -195,19 +236,194 @@ def create4Worktrees(subjectRepo, workspace, mainWorktree):
 	return (base_folder, left_Folder, right_folder, child_folder)
 
 
-def processExample(merger: Merger, mergerPath, subjectRepo: dataset.SubjectRepo):
+def inputVersions(subjectRepo):
+	"""
+	:return: (folder suffix, sha) of base, left, right, and child, in the order of create4Worktrees
+	"""
+	return (('-base', subjectRepo.baseCommit), ('-left', subjectRepo.leftCommit),
+			('-right', subjectRepo.rightCommit), ('-child', subjectRepo.mergeCommit))
+
+
+def restoreInputs(subjectRepo, workspace, cache: snapshotCache.SnapshotCache):
+	"""
+	Create the input folders from the snapshot cache.
+
+	:return: (base_folder, left_Folder, right_folder, child_folder), or None if any version is not cached.
+	"""
+	cached = [cache.get(subjectRepo.repoUrl, sha, subjectRepo.conflictingFile) for _, sha in inputVersions(subjectRepo)]
+	if None in cached:
+		return None
+
+	folders = []
+	for (suffix, _), cachedFile in zip(inputVersions(subjectRepo), cached):
+		folder = os.path.join(workspace, subjectRepo.repoName + suffix)
+		filePath = os.path.join(folder, subjectRepo.conflictingFile)
+		if cachedFile is snapshotCache.ABSENT:
+			pathlib.Path(filePath).unlink(missing_ok=True)
+		else:
+			cache.materialize(cachedFile, filePath)
+		folders.append(folder)
+	logger.debug('Restored inputs from snapshot cache')
+	return tuple(folders)
+
+
+def storeInputs(subjectRepo, inputFolders, cache: snapshotCache.SnapshotCache):
+	for (_, sha), folder in zip(inputVersions(subjectRepo), inputFolders):
+		filePath = os.path.join(folder, subjectRepo.conflictingFile)
+		cache.put(subjectRepo.repoUrl, sha, subjectRepo.conflictingFile, filePath if os.path.isfile(filePath) else None)
+
+
+def materializeInputs(subjectRepo, workspace, objectReader):
+	"""
+	Write the conflicting file of base, left, right, and child (merged) into the folders that create4Worktrees would create,
+	reading blobs from objectReader rather than creating worktrees.
+
+	:param objectReader: gitUtils.ObjectReader of the main worktree
+	:return: (base_folder, left_Folder, right_folder, child_folder)
+	"""
+	folders = []
+	for suffix, sha in inputVersions(subjectRepo):
+		folder = os.path.join(workspace, subjectRepo.repoName + suffix)
+		filePath = pathlib.Path(folder, subjectRepo.conflictingFile)
+		content = objectReader.read(f'{sha}:{subjectRepo.conflictingFile}')
+		if content is None:
+			# The file doesn't exist in this version. Remove what a previous example may have left.
+			filePath.unlink(missing_ok=True)
+		else:
+			filePath.parent.mkdir(parents=True, exist_ok=True)
+			# The path may be a hard link made by an older snapshot cache. Writing through it would change the other file.
+			filePath.unlink(missing_ok=True)
+			filePath.write_bytes(content)
+		logger.debug(f"Prepared {suffix[1:]} version")
+		folders.append(folder)
+	return tuple(folders)
+
+
+_objectReader = None
+
+
+def closeObjectReader(repoPath):
+	"""
+	Close the reader of repoPath, if it's alive. A running git cat-file may not see objects fetched after it started.
+	"""
+	global _objectReader
+	if _objectReader is not None and _objectReader.repoPath == repoPath:
+		_objectReader.close()
+		_objectReader = None
+
+
+def getObjectReader(repoPath):
+	"""
+	Examples of a repository run one after another, so keep the reader of the current repository alive until the next repository comes.
+	"""
+	global _objectReader
+	if _objectReader is not None and _objectReader.repoPath != repoPath:
+		_objectReader.close()
+		_objectReader = None
+	if _objectReader is None:
+		_objectReader = gitUtils.ObjectReader(repoPath)
+	return _objectReader
+
+
+def processExample(mergers, subjectRepo: dataset.SubjectRepo):
+	"""
+	Prepare the inputs of an example once, then run every merger against them.
+
+	:param mergers: a list of (Merger, mergerPath)
+	"""
 	# os.chdir(os.path.join(path_prefix, workspace))
 	repoPath = os.path.join(path_prefix, workspace, subjectRepo.repoName)
-	prepare_repo(repoPath, subjectRepo.repoUrl, subjectRepo.mergeCommit)
-
 	resultFolder = os.path.join(path_prefix, workspace, 'result')
 	pathlib.Path(resultFolder).mkdir(exist_ok=True)
 
+	key = runManifest.exampleKey(subjectRepo)
+	if resume:
+		pending = []
+		for merger, mergerPath in mergers:
+			mergeResultFolder = os.path.join(resultFolder, Merger(merger).value, subjectRepo.repoName)
+			if journal.isUpToDate(Merger(merger).value, key, runManifest.hashTool(mergerPath), mergeResultFolder):
+				logger.info(f'{Merger(merger).value} result is up to date. Skipped.')
+			else:
+				pending.append((merger, mergerPath))
+		mergers = pending
+		if len(mergers) == 0:
+			return
+
+	workspaces.useRepo(subjectRepo.repoName)
+	inputFolders = None
+	if snapshots is not None:
+		inputFolders = restoreInputs(subjectRepo, workspaces.inputRoot(), snapshots)
+	# Summer works on the clone, not on the input folders.
+	if inputFolders is None or any(merger == Merger.Summer for merger, _ in mergers):
+		prepare_repo(repoPath, subjectRepo.repoUrl, subjectRepo.mergeCommit)
+
+	if inputFolders is None:
+		if useWorktrees:
+			inputFolders = create4Worktrees(subjectRepo, workspaces.inputRoot(), repoPath)
+		else:
+			inputFolders = materializeInputs(subjectRepo, workspaces.inputRoot(), getObjectReader(repoPath))
+		if snapshots is not None:
+			storeInputs(subjectRepo, inputFolders, snapshots)
+
+	inputHashes = runManifest.hashInputs(subjectRepo, inputFolders)
+	inputBytes = sum(os.path.getsize(file) for file in (os.path.join(folder, subjectRepo.conflictingFile) for folder in inputFolders[0:3])
+					 if os.path.isfile(file))
+	# Tools write to scratch if it's set. Only their outputs are copied to the result folder.
+	stagingFolder = workspaces.outputRoot()
+	for merger, mergerPath in mergers:
+		if ProcessUtils.usageRecorder is not None:
+			ProcessUtils.usageRecorder.setContext(example=key, repo=subjectRepo.repoName, tool=Merger(merger).value)
+		timeout = MAX_WAITINGTIME_RESOLVE
+		if timeouts is not None:
+			previous = journal.latest(Merger(merger).value, key)
+			if previous is not None and previous.get('outcome') == 'timeout' and previous.get('timeout', MAX_WAITINGTIME_RESOLVE) < MAX_WAITINGTIME_RESOLVE:
+				reason = f'the upper bound, because the last run timed out at the adaptive timeout of {previous["timeout"]:.1f} s'
+			else:
+				timeout, reason = timeouts.timeout(Merger(merger).value, inputBytes)
+			logger.info(f'Timeout of {Merger(merger).value} is {timeout:.1f} s: {reason}.')
+		if progress is not None:
+			progress.startTool(Merger(merger).value)
+		start = time.perf_counter()
+		outcome, written = runMerger(merger, mergerPath, subjectRepo, repoPath, resultFolder if stagingFolder is None else stagingFolder, inputFolders,
+									 timeout)
+		duration = time.perf_counter() - start
+		if ProcessUtils.usageRecorder is not None and any(u['timedOut'] for u in ProcessUtils.usageRecorder.records):
+			outcome = 'timeout'
+		if progress is not None:
+			progress.finishTool(Merger(merger).value, outcome)
+
+		mergeResultFolder = os.path.join(resultFolder, Merger(merger).value, subjectRepo.repoName)
+		if stagingFolder is not None:
+			workspaceManager.copyOutputs(os.path.join(stagingFolder, Merger(merger).value, subjectRepo.repoName), mergeResultFolder, written)
+		journal.append({'example': key, 'repo': subjectRepo.repoName, 'tool': Merger(merger).value,
+						'toolHash': runManifest.hashTool(mergerPath), 'inputs': inputHashes, 'inputBytes': inputBytes,
+						'outcome': outcome, 'duration': round(duration, 3), 'timeout': round(timeout, 3),
+						'outputs': {path: runManifest.hashFile(os.path.join(mergeResultFolder, path)) for path in written}})
+		if results is not None:
+			results.addToolRun(subjectRepo, Merger(merger).value, runManifest.hashTool(mergerPath), outcome, round(duration, 3),
+							   ProcessUtils.usageRecorder.records if ProcessUtils.usageRecorder is not None else [])
+
+	workspaces.releaseInputs(subjectRepo.repoName)
+	if any(merger == Merger.FstMerge for merger, _ in mergers):
+		# FSTMerge of another process may still be using its temporary folder.
+		workspaces.cleanToolTemp(MAX_WAITINGTIME_RESOLVE)
+
+
+def runMerger(merger: Merger, mergerPath, subjectRepo: dataset.SubjectRepo, repoPath, resultFolder, inputFolders, timeout=MAX_WAITINGTIME_RESOLVE):
+	"""
+	Run one merger against the prepared inputs of an example and write to result/<merger>/<repo>.
+
+	:param inputFolders: (base_folder, left_Folder, right_folder, child_folder) from create4Worktrees
+	:param timeout: seconds that the merger may run
+	:return: (outcome, written) where outcome is success, failure, or no-output,
+	and written are the files in result/<merger>/<repo> that the merger wrote, relative to that folder.
+	"""
+	(base_folder, left_Folder, right_folder, child_folder) = inputFolders
 	toolResultFolder = pathlib.Path(resultFolder, Merger(merger).value)
 	toolResultFolder.mkdir(exist_ok=True)
 	mergeResultFolder = toolResultFolder / subjectRepo.repoName
 	mergeResultFolder.mkdir(exist_ok=True)
-	(base_folder, left_Folder, right_folder, child_folder) = create4Worktrees(subjectRepo, os.path.join(path_prefix, workspace), repoPath)
+	before = runManifest.statOutputs(mergeResultFolder)
 	match merger:
 		case Merger.Summer:
 			pathlib.Path(os.path.join(resultFolder, 'summer')).mkdir(exist_ok=True)
@@ -215,61 +431,195 @@ def processExample(merger: Merger, mergerPath, subjectRepo: dataset.SubjectRepo)
 				mergeTools.runSummer(mergerPath, repoPath,
 									 subjectRepo.leftCommit, subjectRepo.rightCommit, subjectRepo.baseCommit, mergeResultFolder,
 									 subjectRepo.conflictingFile, subjectRepo.getMergedFile(os.path.join(path_prefix, workspace)),
-									 logger)
+									 logger, timeout)
 				logger.info("summer solution generated")
 			except Exception as e:
 				logger.error(e)
+				return 'failure', []
 			# Summer doesn't need file existence check.
-			return
+			return 'success', runManifest.changedOutputs(mergeResultFolder, before)
 		case Merger.FstMerge:
 			try:
-				mergeTools.runFSTMerge(mergerPath, repoPath, toolResultFolder, logger)
+				# FSTMerge finds the input folders by the name of the repository.
+				mergeTools.runFSTMerge(mergerPath, os.path.join(os.path.dirname(base_folder), subjectRepo.repoName), toolResultFolder, logger, timeout)
 			except Exception as e:
 				logger.error(e)
 		case Merger.AutoMerge:
 			try:
-				merge_with_AutoMerge(mergerPath, left_Folder, base_folder, right_folder, mergeResultFolder, logger)
+				merge_with_AutoMerge(mergerPath, left_Folder, base_folder, right_folder, mergeResultFolder, logger, timeout)
 			except Exception as e:
 				logger.error(e)
-				return
+				return 'failure', []
 		case Merger.IntelliMerge:
 			try:
-				mergeTools.runIntelliMerge(mergerPath, left_Folder, base_folder, right_folder, mergeResultFolder, logger)
+				mergeTools.runIntelliMerge(mergerPath, left_Folder, base_folder, right_folder, mergeResultFolder, logger, timeout)
 			except Exception as e:
 				logger.error(e)
-				return
+				return 'failure', []
 		case Merger.KDiff:
 			try:
-				if False is mergeTools.runKDiff3(mergerPath, left_Folder, base_folder, right_folder, mergeResultFolder, logger):
+				if False is mergeTools.runKDiff3(mergerPath, left_Folder, base_folder, right_folder, mergeResultFolder, logger, timeout):
 					logger.info('KDiff failed.')
-					return
+					return 'failure', []
 			except Exception as e:
 				logger.error(e)
-				return
+				return 'failure', []
 		case Merger.Wiggle:
 			try:
-				if False is mergeTools.runWiggle(mergerPath, left_Folder, base_folder, right_folder, mergeResultFolder, logger, subjectRepo):
+				if False is mergeTools.runWiggle(mergerPath, left_Folder, base_folder, right_folder, mergeResultFolder, logger, subjectRepo, timeout):
 					logger.info('Wiggle failed')
-					return
+					return 'failure', []
 			except Exception as e:
 				logger.error(e)
-				return
+				return 'failure', []
+
+	written = runManifest.changedOutputs(mergeResultFolder, before)
+	if len(written) > 0:
+		logger.info(f"{Merger(merger).value} solution generated")
+		return 'success', written
 
-	for item in (toolResultFolder / subjectRepo.repoName).rglob('*'):
+	for item in mergeResultFolder.rglob('*'):
 		if os.path.isfile(item):
 			if item.name.endswith('-normalized.java'):
 				continue
-			if time.time() - os.path.getmtime(item) <= 10:
-
-				logger.info(f"{Merger(merger).value} solution generated")
-			else:
-				mtime = datetime.datetime.fromtimestamp(os.path.getmtime(item)).isoformat(timespec='seconds')
-				logger.warning(f'File {item} is lastly modified on {mtime}. ' +
-							   f'You may want to clean up {toolResultFolder}.')
-			return
+			mtime = datetime.datetime.fromtimestamp(os.path.getmtime(item)).isoformat(timespec='seconds')
+			logger.warning(f'File {item} is lastly modified on {mtime}. ' +
+						   f'You may want to clean up {toolResultFolder}.')
+			return 'no-output', []
 
 	logger.info(f'{Merger(merger).value} fails to write any files.')
+	return 'no-output', []
+
 
+def groupByRepository(examples, evaluationRange):
+	"""
+	Group example indices by repository, keeping the order of evaluationRange within each group.
+
+	Examples of the same repository share the clone in workspace and the -base/-left/-right/-child folders,
+	so they must run one after another. Different groups are independent.
+
+	:return: a list of lists of indices
+	"""
+	groups = {}
+	for i in evaluationRange:
+		groups.setdefault(examples[i].repoName, []).append(i)
+	return list(groups.values())
+
+
+def estimateDurations(examples, indices, mergers):
+	"""
+	Predict how long the mergers take on each example, from the journal, or from the sizes of the conflicting files in the clones.
+
+	:return: a dict from index to seconds
+	"""
+	sizes = {}
+	for group in groupByRepository(examples, indices):
+		names = {i: f'{examples[i].leftCommit}:{examples[i].conflictingFile}' for i in group}
+		found = gitUtils.blobSizes(os.path.join(path_prefix, workspace, examples[group[0]].repoName), names.values())
+		sizes.update({i: found[name] for i, name in names.items() if name in found})
+	durations = runManifest.loadDurations(journal.path, [Merger(merger).value for merger, _ in mergers])
+	costs = runManifest.estimateCosts({i: examples[i] for i in indices}, durations, sizes)
+	known = sum(1 for i in indices if runManifest.exampleKey(examples[i]) in durations)
+	logger.info(f'{known} of {len(indices)} examples have durations in the journal. Predicted total is {sum(costs.values()):.0f} seconds.')
+	return costs
+
+
+def configureLogger(logLevel, logFile):
+	formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+	logger.setLevel(logLevel)
+	logger.handlers.clear()
+	if logFile is not None:
+		fh = logging.FileHandler(logFile)
+		fh.setLevel(logging.INFO)
+		fh.setFormatter(formatter)
+		logger.addHandler(fh)
+
+	streamHandler = logging.StreamHandler()
+	streamHandler.setFormatter(formatter)
+	logger.addHandler(streamHandler)
+
+
+# Module globals that __main__ sets from the command line
+_WORKER_SETTINGS = ('path_prefix', 'javaPath', 'useWorktrees', 'snapshots', 'journal', 'resume', 'results', 'workspaces', 'bundleFolder',
+					'timeouts', 'progress')
+
+
+# Globals of ProcessUtils that __main__ sets from the command line
+_PROCESS_SETTINGS = ('usageRecorder', 'memoryLimit', 'cpuLimit', 'concurrencyLimit')
+
+
+def _initWorker(settings, jvmDaemon, processSettings, logLevel, logFile):
+	global progress
+	# Worker processes may be spawned rather than forked, so module globals set in __main__ are not inherited.
+	globals().update(settings)
+	# Each worker starts its own daemons.
+	mergeTools.useJvmDaemon = jvmDaemon
+	for name, value in processSettings.items():
+		setattr(ProcessUtils, name, value)
+	if progress is not None:
+		# A forked worker inherits the progress of the main process, which writes to the file of the main process.
+		progress = progressMonitor.WorkerProgress(progress.folder)
+		ProcessUtils.processListener = progress.setLiveProcesses
+	configureLogger(logLevel, logFile)
+
+
+def processExamples(mergers, examples):
+	"""
+	:param mergers: a list of (Merger, mergerPath)
+	:param examples: a list of (index, SubjectRepo)
+	"""
+	for i, subjectRepo in examples:
+		logger.info(f"Start processing project {i}, {subjectRepo.repoName}. Conflicting file is {pathlib.Path(subjectRepo.conflictingFile).name}.")
+		if progress is not None:
+			progress.startExample(i, subjectRepo)
+		processExample(mergers, subjectRepo)
+		if progress is not None:
+			progress.finishExample()
+	workspaces.release()
+	if results is not None:
+		results.flush()
+
+
+def detectMerger(mergerPath):
+	"""
+	:return: the Merger named in mergerPath, or None if the path doesn't name a supported merger.
+	"""
+	if 'summer' in mergerPath.lower():
+		return Merger.Summer
+	elif 'automerge' in mergerPath.lower():
+		return Merger.AutoMerge
+	elif 'fstmerge' in mergerPath.lower():
+		return Merger.FstMerge
+	elif 'intellimerge' in mergerPath.lower():
+		return Merger.IntelliMerge
+	elif 'jdime' in mergerPath.lower():
+		return Merger.JDime
+	elif 'kdiff' in mergerPath.lower():
+		return Merger.KDiff
+	elif 'wiggle' in mergerPath.lower():
+		return Merger.Wiggle
+	else:
+		return None
+
+
+# Create the input folders as sparse worktrees. If False, write the conflicting files from git objects directly.
+useWorktrees = True
+# snapshotCache.SnapshotCache of the input files, or None if the inputs are always created from git.
+snapshots = None
+# runManifest.RunJournal recording every tool run
+journal = None
+# Skip tool runs that are up to date according to the journal.
+resume = False
+# resultStore.ResultStore of this run, or None
+results = None
+# workspaceManager.WorkspaceManager of Resource/workspace
+workspaces = None
+# The folder of repository bundles made by bundleTool.py, or None to always fetch from the network
+bundleFolder = None
+# A timeoutPolicy.TimeoutPolicy, or None to give every tool run MAX_WAITINGTIME_RESOLVE
+timeouts = None
+# A progressMonitor.WorkerProgress, or None if progress isn't reported
+progress = None
 
 # create logger to record complete info
 # create logger with 'script_logger'
@@ -286,10 +636,59 @@ if __name__ == '__main__':
 --path-prefix	the directory of ConflictBench. If this option is missing, the path is the parent of parent folder of {0}, which is {1}.
 --total_list	the path to the file containing all examples. If this option is missing, the path is derived from --path-prefix.
 --range	n1..n2	run experiments against examples from n1, inclusive to n2, exclusive. n1 starts at 0. If this option is missing, run all examples.
+--bundles folder	fetch commits from <repoName>.bundle files in folder, made by bundleTool.py, before the network.
+	Default is Resource/bundles.
+--partial-clone	before running, fetch all commits each repository needs in one blobless fetch, and check out only the conflicting files.
+	Repositories are prefetched in parallel, see --prefetch-jobs.
+--prefetch-jobs N	prefetch N repositories at the same time for --partial-clone. Default is 8, or the number of repositories if fewer.
+--inputs worktree|cat-file
+	how to create the base/left/right/child folders. worktree (default) creates a sparse git worktree for each version.
+	cat-file writes only the conflicting file, read by one long-running git cat-file process per repository. Summer reads the clone, so it works with both.
+--snapshot-cache folder
+	cache the base/left/right/child files in this folder. On a hit, the clone is neither fetched nor checked out.
+--snapshot-cache-size size
+	the size limit of the snapshot cache, like 500M or 2G. Least recently used files are evicted. Default is 1G.
+--jvm-daemon	run IntelliMerge, FSTMerge, and AutoMerge in a long-lived JVM, which loads each tool in a new class loader for every example.
+	Timeouts stay the same. If the daemon can't start, crashes, or times out, the tool runs in a new process.
+	Java 24 and later can't intercept System.exit of the tools, so tools always run in new processes with them.
+--journal file	append a record of every tool run to this file. Default is Resource/workspace/result/journal.jsonl.
+--usage-file file	append wall time, CPU time, peak memory, and exit status of every tool process to this file, one JSON record per line.
+	Default is Resource/workspace/result/usage/<start time>.jsonl.
+--tool-memory-limit size
+	limit the data segment of every tool process, like 4G. A JVM-based tool fails at startup if its maximum heap, -Xmx, doesn't fit.
+--tool-cpu-limit seconds
+	limit the CPU time of every tool process. A process over the limit is killed.
+	Both limits apply to the tool and its children on Linux and macOS, but not to tools run in the JVM daemon.
+--db file	record tool runs of this run in an SQLite database. Default is Resource/workspace/result/results.sqlite.
+--label name	name this run in the database, e.g. a version of the tools, to compare runs in makeLatex.py.
+--workspace-budget size
+	the disk budget of the clones in Resource/workspace, like 20G. When a process moves on to another repository,
+	least recently used clones that no process is using are removed. See also workspaceManager.py gc.
+	compare.py reads the expected files from the clones, so a clone is kept until the golden cache of compare.py
+	(Resource/workspace/golden-cache) has the expected files of its examples in the range, e.g. after compare.py has run on them once.
+--keep-inputs	keep the base/left/right/child folders after an example. By default they are removed, and their worktrees are pruned,
+	once the results of the example are recorded.
+--scratch folder	create the base/left/right/child folders, and let tools write, in a folder of this process in folder,
+	e.g. /dev/shm. Only the files that tools write are copied to Resource/workspace/result. The folder is cleaned after every example.
+--adaptive-timeouts	set the timeout of each tool run from the durations of the tool in the journal and the size of the conflicting file,
+	at most 3 minutes. Tools with fewer than 20 successful runs in the journal get 3 minutes. Every timeout is logged and recorded in the journal.
+	A run that timed out at an adaptive timeout is run again with 3 minutes, e.g. by --resume.
+--resume, --incremental
+	skip a tool on an example if the journal has a successful run of the same tool binary on it, and the files it wrote are unchanged.
+	Failures, timeouts, and runs without output are run again.
+--status-file file	rewrite this file every 5 seconds with the progress of the run in JSON: examples done and remaining, the example and tool
+	that every process is running, counts of success, failure, no-output, and timeout of every tool, throughput, ETA, and live tool processes.
+--status-port port	serve the same JSON at http://127.0.0.1:port/.
+--max-tool-processes N	run at most N tool processes at the same time, across the processes of --jobs. By default there is no limit.
+--jobs N	run examples in N processes. Examples of the same repository share a clone, so they still run one after another. Default is 1.
+--order longest-first	run repositories, and examples in them, from the longest predicted duration of the mergers,
+	so that the processes of --jobs end together instead of waiting on one slow example. Durations are from the journal.
+	Examples without one are estimated by the size of the conflicting file in the clone, and the durations of the repository.
 
 --merger path	
 run the merge at the given path. 
 {0} automatically checks if the merge is AutoMerge, FSTMerge, IntelliMerge, JDime, KDiff3, or summer.
+Repeat this option to run several mergers. The inputs of each example are prepared once and shared by all mergers.
 '''.format(sys.argv[0], pathlib.Path(__file__).parent.parent.resolve()))
 		exit(0)
 
@@ -313,63 +712,137 @@ run the merge at the given path.
 	except:
 		path_prefix = pathlib.Path(__file__).parent.parent.resolve()
 
-	try:
-		i = sys.argv.index('--merger')
+	mergers = []
+	for i, arg in enumerate(sys.argv):
+		if arg != '--merger' or i + 1 == len(sys.argv):
+			continue
 		mergerPath = sys.argv[i + 1]
-		if 'summer' in mergerPath.lower():
-			merger = Merger.Summer
-		elif 'automerge' in mergerPath.lower():
-			merger = Merger.AutoMerge
-		elif 'fstmerge' in mergerPath.lower():
-			merger = Merger.FstMerge
-		elif 'intellimerge' in mergerPath.lower():
-			merger = Merger.IntelliMerge
-		elif 'jdime' in mergerPath.lower():
-			merger = Merger.JDime
-		elif 'kdiff' in mergerPath.lower():
-			merger = Merger.KDiff
-		elif 'wiggle' in mergerPath.lower():
-			merger = Merger.Wiggle
-		else:
+		merger = detectMerger(mergerPath)
+		if merger is None:
 			print(f"Can't recognize the merger from path {mergerPath}. Name a folder or the file to the supported merger.", file=sys.stderr)
 			exit(commandLineError)
-	except:
+		mergers.append((merger, mergerPath))
+	if len(mergers) == 0:
 		print(f'Option --merger is required.', file=sys.stderr)
 		exit(commandLineError)
 
-	formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 	try:
 		i = sys.argv.index('--log-file')
 		logger_path = sys.argv[i + 1]
-		fh = logging.FileHandler(logger_path)
-		fh.setLevel(logging.INFO)
-		# create formatter and add it to the handlers
-		fh.setFormatter(formatter)
-		# add the handlers to the logger
-		logger.addHandler(fh)
 	except:
-		pass
+		logger_path = None
+	configureLogger(logger.level, logger_path)
+
+	if '--inputs' in sys.argv:
+		i = sys.argv.index('--inputs')
+		inputMode = sys.argv[i + 1] if i + 1 < len(sys.argv) else ''
+		if inputMode not in ('worktree', 'cat-file'):
+			print(f'Option --inputs must be worktree or cat-file. What you passed is {inputMode}', file=sys.stderr)
+			exit(commandLineError)
+		useWorktrees = inputMode == 'worktree'
 
-	streamHandler = logging.StreamHandler()
-	streamHandler.setFormatter(formatter)
-	logger.addHandler(streamHandler)
+	mergeTools.useJvmDaemon = '--jvm-daemon' in sys.argv
+
+	if '--snapshot-cache' in sys.argv:
+		i = sys.argv.index('--snapshot-cache')
+		cacheSize = optionUtils.getSize('--snapshot-cache-size', 1024 ** 3, example='500M or 2G')
+		snapshots = snapshotCache.SnapshotCache(sys.argv[i + 1], cacheSize)
+
+	try:
+		i = sys.argv.index('--journal')
+		journalPath = sys.argv[i + 1]
+	except:
+		journalPath = os.path.join(path_prefix, workspace, 'result', 'journal.jsonl')
+	journal = runManifest.RunJournal(journalPath)
+	if '--adaptive-timeouts' in sys.argv:
+		# Built once, so that the timeouts of this run only depend on the journal before it.
+		timeouts = timeoutPolicy.TimeoutPolicy.fromJournal(journalPath, MAX_WAITINGTIME_RESOLVE)
+		for merger, _ in mergers:
+			logger.info(timeouts.describe(Merger(merger).value))
+
+	try:
+		i = sys.argv.index('--usage-file')
+		usagePath = sys.argv[i + 1]
+	except:
+		usagePath = os.path.join(path_prefix, workspace, 'result', 'usage', datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.jsonl')
+	ProcessUtils.usageRecorder = ProcessUtils.UsageRecorder(usagePath)
+
+	try:
+		i = sys.argv.index('--db')
+		dbPath = sys.argv[i + 1]
+	except:
+		dbPath = os.path.join(path_prefix, workspace, 'result', 'results.sqlite')
+	try:
+		i = sys.argv.index('--label')
+		label = sys.argv[i + 1]
+	except:
+		label = None
+	results = resultStore.ResultStore(dbPath)
+	results.startRun('merge', label, sys.argv[1:])
+
+	ProcessUtils.memoryLimit = optionUtils.getSize('--tool-memory-limit')
+	ProcessUtils.cpuLimit = optionUtils.getPositiveInt('--tool-cpu-limit')
+	maxToolProcesses = optionUtils.getPositiveInt('--max-tool-processes')
+	if maxToolProcesses is not None:
+		ProcessUtils.concurrencyLimit = ProcessUtils.ConcurrencyLimit(maxToolProcesses, tempfile.mkdtemp(prefix='conflictbench-slots-'))
+	resume = '--resume' in sys.argv or '--incremental' in sys.argv
+
+	workspaceBudget = optionUtils.getSize('--workspace-budget', example='20G')
+	try:
+		i = sys.argv.index('--scratch')
+		scratch = sys.argv[i + 1]
+	except:
+		scratch = None
+	workspaces = workspaceManager.WorkspaceManager(os.path.join(path_prefix, workspace), workspaceBudget, '--keep-inputs' in sys.argv, scratch)
+
+	try:
+		i = sys.argv.index('--bundles')
+		bundleFolder = sys.argv[i + 1]
+	except:
+		bundleFolder = os.path.join(path_prefix, 'Resource/bundles')
+
+	jobs = optionUtils.getPositiveInt('--jobs', 1)
+	# None lets prefetchRepos choose.
+	prefetchJobs = optionUtils.getPositiveInt('--prefetch-jobs')
+
+	try:
+		i = sys.argv.index('--status-file')
+		statusFile = sys.argv[i + 1]
+	except:
+		statusFile = None
+	statusPort = None
+	if '--status-port' in sys.argv:
+		i = sys.argv.index('--status-port')
+		try:
+			statusPort = int(sys.argv[i + 1])
+		except (IndexError, ValueError):
+			statusPort = -1
+		if not 0 <= statusPort <= 65535:
+			print('Option --status-port must be a port number.', file=sys.stderr)
+			exit(commandLineError)
 
 	opt = optionUtils.Options()
 	opt.LoadDataset()
-	opt.LoadRange()
-
-	if merger == Merger.FstMerge:
-		# clean up its temp folders.
-		# When FSMerge throws exceptions, it doesn't clean up.
-		workspaceFolder = os.path.join(path_prefix, workspace, 'result', 'FSTMerge')
-		for entry in os.listdir(workspaceFolder):
-			full_path = os.path.join(workspaceFolder, entry)
-			# Check if it's a directory and if it matches the substring
-			if os.path.isdir(full_path) and 'fstmerge_tmp' in entry:
-				try:
-					shutil.rmtree(full_path)
-				except Exception as e:
-					print(f"Failed to delete {full_path}: {e}")
+	opt.LoadRange(lambda indices: estimateDurations(opt.dataset, indices, mergers))
+	if workspaceBudget is not None:
+		examplesByRepo = {}
+		for i in opt.evaluationRange:
+			examplesByRepo.setdefault(opt.dataset[i].repoName, []).append(opt.dataset[i])
+		workspaces.keepClone = functools.partial(compareNeedsClone, os.path.join(path_prefix, workspace, 'golden-cache'),
+												 os.path.join(path_prefix, workspace), examplesByRepo)
+
+	monitor = None
+	if statusFile is not None or statusPort is not None:
+		progressFolder = tempfile.mkdtemp(prefix='conflictbench-progress-')
+		progress = progressMonitor.WorkerProgress(progressFolder)
+		ProcessUtils.processListener = progress.setLiveProcesses
+		monitor = progressMonitor.ProgressMonitor(progressFolder, len(opt.evaluationRange), statusFile, statusPort)
+		monitor.start()
+		if statusPort is not None:
+			logger.info(f'Progress is at http://127.0.0.1:{monitor.port}/')
+
+	# When FSTMerge throws exceptions, it doesn't clean up its temp folders.
+	workspaces.cleanToolTemp()
 
 	try:
 		i = sys.argv.index('--java')
@@ -379,6 +852,26 @@ run the merge at the given path.
 
 	# print(ProcessUtils.runProcess('java -version', None).decode('utf-8', errors='ignore'))
 	# exit(0)
-	for i in opt.evaluationRange:
-		logger.info(f"Start processing project {i}, {opt.dataset[i].repoName}. Conflicting file is {pathlib.Path(opt.dataset[i].conflictingFile).name}.")
-		processExample(merger, mergerPath, opt.dataset[i])
+	if '--partial-clone' in sys.argv:
+		repoNames = set(opt.dataset[i].repoName for i in opt.evaluationRange)
+		gitUtils.prefetchRepos([example for example in opt.dataset if example.repoName in repoNames],
+							   os.path.join(path_prefix, workspace), prefetchJobs, logger, bundleFolder=bundleFolder)
+
+	try:
+		if jobs == 1:
+			processExamples(mergers, [(i, opt.dataset[i]) for i in opt.evaluationRange])
+		else:
+			groups = groupByRepository(opt.dataset, opt.evaluationRange)
+			with futures.ProcessPoolExecutor(max_workers=jobs, initializer=_initWorker,
+											 initargs=({name: globals()[name] for name in _WORKER_SETTINGS}, mergeTools.useJvmDaemon,
+													   {name: getattr(ProcessUtils, name) for name in _PROCESS_SETTINGS}, logger.level, logger_path)) as executor:
+				tasks = [executor.submit(processExamples, mergers, [(i, opt.dataset[i]) for i in group]) for group in groups]
+				for task in futures.as_completed(tasks):
+					task.result()
+	finally:
+		if monitor is not None:
+			monitor.stop()
+		if ProcessUtils.concurrencyLimit is not None:
+			workspaceManager.removeTree(ProcessUtils.concurrencyLimit.folder)
+
+	results.close()
@@ -2,77 +2,89 @@ import logging
 import os
 import pathlib
 import subprocess
-import threading
+import time
+import zipfile
 
+import jvmDaemon
 import ProcessUtils
 
 # maximum waiting time to resolve a merge conflict.
 MAX_WAITINGTIME_RESOLVE = 3 * 60
 toolError = 10
 
+# Run Java-based tools in a long-lived JVM instead of starting a JVM per example. See jvmDaemon.py.
+useJvmDaemon = False
 
-def runIntelliMerge(toolPath, left, base, right, output_path, logger):
-	cmd = f"java -jar {toolPath} -d {left} {base} {right} -o {output_path}"
-	logger.debug('cmd: ' + cmd)
+# IntelliMerge misses error handling in threads. If stderr has these lines, it will never exit.
+INTELLIMERGE_FATAL_PATTERNS = ("concurrent.ExecutionException", "at edu.pku.intellimerge.client.IntelliMerge.main(IntelliMerge.java")
 
-	# I can't call ProcessUtils.runProcess because IntelliMerge uses multithreading, and it misses error handling in threads,
-	# so if a thread throws, IntelliMerge does not exit and runs forever.
-	proc = subprocess.Popen(
-		cmd,
-		stdout=subprocess.PIPE,
-		stderr=subprocess.PIPE,
-		shell=True,
-		text=True,
-		bufsize=1  # line-buffered
-	)
-
-	stdout_lines = []
-	stderr_lines = []
-	exception_found = threading.Event()
-
-	def watch_stderr():
-		for line in proc.stderr:
-			stderr_lines.append(line)
-			# print("[STDERR]", line.strip())  # Optional
-			if "concurrent.ExecutionException" in line or "at edu.pku.intellimerge.client.IntelliMerge.main(IntelliMerge.java" in line:
-				exception_found.set()
-				proc.terminate()
-				break
-
-	def watch_stdout():
-		for line in proc.stdout:
-			stdout_lines.append(line)
-
-	# print("[STDOUT]", line.strip())  # Optional
-
-	t1 = threading.Thread(target=watch_stderr, daemon=True)
-	t2 = threading.Thread(target=watch_stdout, daemon=True)
-	t1.start()
-	t2.start()
 
+def runInJvmDaemon(javaPath, classpath, mainClass, args, cwd, cmd, logger, abortPatterns=(), timeout=MAX_WAITINGTIME_RESOLVE):
+	"""
+	Run a Java tool in the JVM daemon if useJvmDaemon is on.
+
+	:param cmd: the equivalent command line, for messages
+	:param timeout: seconds
+	:return: a ProcessUtils.ToolResult, where stopped means stderr has an abort pattern.
+	None if the tool should run in a new process, e.g. the daemon didn't start, crashed, or timed out.
+	"""
+	if not useJvmDaemon:
+		return None
+	start = time.perf_counter()
 	try:
-		proc.wait(timeout=MAX_WAITINGTIME_RESOLVE)
+		result = jvmDaemon.run(javaPath, classpath, mainClass, args, cwd, timeout, abortPatterns)
+	except subprocess.TimeoutExpired:
+		# The daemon may hang rather than the tool. The daemon is stopped, and the new process decides whether the tool times out.
+		logger.warning(f'{cmd} does not finish in time in the JVM daemon. Run it in a new process.')
+		return None
+	except jvmDaemon.DaemonUnavailable as e:
+		logger.warning(f'{e}. Run {cmd} in a new process.')
+		return None
+	returncode, outs, errs, aborted = result
+	# CPU time and memory of the shared JVM can't be attributed to one run.
+	ProcessUtils.recordUsage(cmd, time.perf_counter() - start, returncode, jvmDaemon=True)
+	return ProcessUtils.ToolResult(cmd, returncode, outs, errs, aborted)
+
+
+def runJarInJvmDaemon(javaPath, jarPath, args, cwd, cmd, logger, abortPatterns=(), timeout=MAX_WAITINGTIME_RESOLVE):
+	"""
+	Same as runInJvmDaemon, but the main class and classpath come from the manifest of jarPath, like `java -jar`.
+	"""
+	if not useJvmDaemon:
+		return None
+	try:
+		mainClass, classpath = jvmDaemon.readJarManifest(jarPath)
+	except (OSError, KeyError, zipfile.BadZipFile) as e:
+		logger.warning(f"Can't read the manifest of {jarPath}: {e}. Run {cmd} in a new process.")
+		return None
+	if mainClass is None:
+		return None
+	return runInJvmDaemon(javaPath, classpath, mainClass, args, cwd, cmd, logger, abortPatterns, timeout)
 
-		if proc.returncode != 0 or exception_found.is_set():
-			full_err = ''.join(stderr_lines)
-			if len(full_err) > 500:
-				full_err = f'Error message has {len(full_err)} characters.'
-			raise subprocess.SubprocessError(f"Failed to run '{cmd}': {full_err}")
 
-		return ''.join(stdout_lines)
-	except subprocess.TimeoutExpired:
-		proc.terminate()
-		raise subprocess.SubprocessError(f'{cmd} did not finish in time')
+def runIntelliMerge(toolPath, left, base, right, output_path, logger, timeout=MAX_WAITINGTIME_RESOLVE):
+	cmd = f"java -jar {toolPath} -d {left} {base} {right} -o {output_path}"
+	logger.debug('cmd: ' + cmd)
+
+	result = runJarInJvmDaemon('java', toolPath, ['-d', left, base, right, '-o', output_path], os.getcwd(), cmd, logger,
+							   INTELLIMERGE_FATAL_PATTERNS, timeout)
+	if result is None:
+		# IntelliMerge uses multithreading, and it misses error handling in threads,
+		# so if a thread throws, IntelliMerge does not exit and runs forever. Stop it once stderr shows the exception.
+		result = ProcessUtils.run(cmd, timeout, shell=True,
+								  onStderrLine=lambda line: any(pattern in line for pattern in INTELLIMERGE_FATAL_PATTERNS))
+	result.check()
+	return result.stdout.decode('utf-8', errors='ignore')
 
 
-def runKDiff3(toolPath, left, base, right, output_path, logger):
+def runKDiff3(toolPath, left, base, right, output_path, logger, timeout=MAX_WAITINGTIME_RESOLVE):
 	cmd = [r'C:\ProgramData\chocolatey\lib\autohotkey.portable\tools\AutoHotkey.exe', r'D:\ConflictBench\Script\KDiffRunner.ahk',
 		   toolPath, base, left, right, output_path]
 
-	ProcessUtils.runProcess(cmd, MAX_WAITINGTIME_RESOLVE)
+	ProcessUtils.runProcess(cmd, timeout)
 
 
-def runWiggle(toolPath, left, base, right, output_path, logger, repo):
+def runWiggle(toolPath, left, base, right, output_path, logger, repo, timeout=MAX_WAITINGTIME_RESOLVE):
 	baseFile = pathlib.Path(base) / repo.conflictingFile
 	leftFile = pathlib.Path(left) / repo.conflictingFile
 	rightFile = pathlib.Path(right) / repo.conflictingFile
@@ -85,41 +97,28 @@ def runWiggle(toolPath, left, base, right, output_path, logger, repo):
 		   '--merge', baseFile, leftFile, rightFile,
 		   '--output', outputFile]
 
-	proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-	try:
-		outs, errs = proc.communicate(timeout=MAX_WAITINGTIME_RESOLVE)
-		if proc.returncode != 0:
-			errs = errs.decode('utf-8', errors='ignore')
-			if len(errs) > 500:
-				errs = f'Error message has {len(errs)} characters.'
-			cmd = '(quoting skipped) ' + ' '.join([str(c) for c in cmd])
-			raise subprocess.SubprocessError("Fail to run '" + cmd + "' in shell: " + errs)
-	except subprocess.TimeoutExpired:
-		# Terminate the unfinished process
-		proc.terminate()
-		raise subprocess.SubprocessError(f'{cmd} does not finish in time')
+	ProcessUtils.run(cmd, timeout, captureStdout=False).check()
 
 
-def runSummer(toolPath, repo, leftSha, rightSha, baseSha, output_path, targetFile1, targetFile2, logger):
+def runSummer(toolPath, repo, leftSha, rightSha, baseSha, output_path, targetFile1, targetFile2, logger, timeout=MAX_WAITINGTIME_RESOLVE):
 	cmd = f'{toolPath} merge -C {repo} -l {leftSha} -r {rightSha} -b {baseSha} --worktree {output_path} --keep -- {targetFile1}'
 	if targetFile2 is not None and targetFile2 != targetFile1:
 		cmd += ' ' + targetFile2
-	try:
-		logger.debug(f'cmd: {cmd}')
-		stdout = ProcessUtils.runProcess(cmd, MAX_WAITINGTIME_RESOLVE)
-		if logger.isEnabledFor(logging.DEBUG):
-			logger.debug(stdout.decode('utf-8', errors='ignore'))
-	except subprocess.SubprocessError as e:
-		logger.error(e)
+	logger.debug(f'cmd: {cmd}')
+	# SubprocessError goes to the caller, which records the run as a failure.
+	stdout = ProcessUtils.runProcess(cmd, timeout)
+	if logger.isEnabledFor(logging.DEBUG):
+		logger.debug(stdout.decode('utf-8', errors='ignore'))
 
 
-def runFSTMerge(toolPath, repoDir, containerPath, logger):
+def runFSTMerge(toolPath, repoDir, containerPath, logger, timeout=MAX_WAITINGTIME_RESOLVE):
 	"""
 
 	:param toolPath:
 	:param repoDir:
 	:param containerPath:
 	:param logger: for debug info and critical error. Do not raise an exception as well as writing to log.
+	:param timeout: seconds
 	:return:
 	"""
 	# Create merge.config at first
@@ -134,27 +133,30 @@ def runFSTMerge(toolPath, repoDir, containerPath, logger):
 
 	logger.debug(f'cmd: {cmd}')
 
-    # On POSIX, if cmd is string, shell must be True
-	proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=containerPath, shell=True)
-	try:
-		outs, errs = proc.communicate(timeout=MAX_WAITINGTIME_RESOLVE)
-		errs = errs.decode('utf-8', errors='ignore')
-
-		if r'Cannot run program "C:\Programme\cygwin\bin\git.exe"' in errs or \
-				'unknown option: --merge-file' in errs:
-			logger.error('FSTMerge calls git with incorrect command line options. ' +
-						 'featurehouse_20220107.jar included in ConflictBench may only be used on Linux.\n' +
-						 'See https://github.com/joliebig/featurehouse/blob/81724157bc638524e72af5bb689cf939e6df8599/fstmerge/merger/LineBasedMerger.java#L93-L96')
-			exit(toolError)
-
-		if proc.returncode != 0:
-			if len(errs) > 500:
-				errs = f'Error message has {len(errs)} characters.'
-			raise subprocess.SubprocessError("Fail to run '" + cmd + "' in shell: " + errs)
-
-		if logger.isEnabledFor(logging.DEBUG):
-			logger.debug(outs.decode('utf-8', errors='ignore'))
-	except subprocess.TimeoutExpired:
-		# Terminate the unfinished process
-		proc.terminate()
-		raise subprocess.SubprocessError(f'{cmd} does not finish in time')
+	wrongGitCalls = []
+
+	def watchStderr(line):
+		if r'Cannot run program "C:\Programme\cygwin\bin\git.exe"' in line or 'unknown option: --merge-file' in line:
+			wrongGitCalls.append(line)
+
+	result = runInJvmDaemon('java', [os.path.abspath(toolPath)], 'merger.FSTGenMerger',
+							['--expression', configPath, '--output-directory', containerPath, '--base-directory', pathlib.Path(repoDir).parent],
+							containerPath, cmd, logger, timeout=timeout)
+	if result is not None:
+		for line in result.stderr.decode('utf-8', errors='ignore').splitlines():
+			watchStderr(line)
+	else:
+		# On POSIX, if cmd is string, shell must be True
+		result = ProcessUtils.run(cmd, timeout, cwd=containerPath, shell=True, onStderrLine=watchStderr,
+								  captureStdout=logger.isEnabledFor(logging.DEBUG))
+
+	if len(wrongGitCalls) > 0:
+		logger.error('FSTMerge calls git with incorrect command line options. ' +
+					 'featurehouse_20220107.jar included in ConflictBench may only be used on Linux.\n' +
+					 'See https://github.com/joliebig/featurehouse/blob/81724157bc638524e72af5bb689cf939e6df8599/fstmerge/merger/LineBasedMerger.java#L93-L96')
+		exit(toolError)
+
+	result.check()
+
+	if logger.isEnabledFor(logging.DEBUG):
+		logger.debug(result.stdout.decode('utf-8', errors='ignore'))
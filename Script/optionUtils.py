@@ -4,14 +4,69 @@ import sys
 import typing
 
 import dataset
+import renameIndex
+import runManifest
+import snapshotCache
+
+
+def readTotalList(totalListPath) -> typing.List[dataset.SubjectRepo]:
+	with open(totalListPath, 'r') as f:
+		lines = f.readlines()
+		total_list = []
+		for line in lines:
+			parts = line.strip().split('\t')
+			# Create a dictionary for each line
+			item = dataset.SubjectRepo()
+			# Many examples share a repository.
+			item.repoUrl = sys.intern(parts[0])
+			item.repoName = sys.intern(parts[1])
+			item.mergeCommit = parts[2]
+			item.leftCommit = parts[3]
+			item.rightCommit = parts[4]
+			item.baseCommit = parts[5]
+			item.conflictingFile = parts[6]
+
+			total_list.append(item)
+	return total_list
+
+
+def getPositiveInt(name, default=None):
+	"""
+	:return: the integer after option name, or default if the option is missing. Exit if it's not a positive integer.
+	"""
+	if name not in sys.argv:
+		return default
+	try:
+		value = int(sys.argv[sys.argv.index(name) + 1])
+	except (IndexError, ValueError):
+		value = 0
+	if value < 1:
+		print(f'Option {name} must be a positive integer.', file=sys.stderr)
+		exit(1)
+	return value
+
+
+def getSize(name, default=None, example='4G'):
+	"""
+	:return: bytes of the size after option name, like 500M, or default if the option is missing. Exit if it's not a size.
+	"""
+	if name not in sys.argv:
+		return default
+	try:
+		return snapshotCache.parseSize(sys.argv[sys.argv.index(name) + 1])
+	except (IndexError, ValueError):
+		print(f'Option {name} must be a size, like {example}.', file=sys.stderr)
+		exit(1)
 
 
 class Options:
-	dataset: typing.List[dataset.SubjectRepo]
+	dataset: dataset.Dataset
+	evaluationRange: typing.List[int]
 
 	def __init__(self):
 		self.dataset = None
 		self.evaluationRange = None
+		self.totalListPath = None
 		try:
 			i = sys.argv.index('--path-prefix')
 			self.path_prefix = sys.argv[i + 1]
@@ -30,26 +85,16 @@ class Options:
 			print('Use option --total_list to directly specify the path to total_list.txt.', file=sys.stderr)
 			exit(1)
 
-		with open(totalListPath, 'r') as f:
-			lines = f.readlines()
-			total_list = []
-			for line in lines:
-				parts = line.strip().split('\t')
-				# Create a dictionary for each line
-				item = dataset.SubjectRepo()
-				item.repoUrl = parts[0]
-				item.repoName = parts[1]
-				item.mergeCommit = parts[2]
-				item.leftCommit = parts[3]
-				item.rightCommit = parts[4]
-				item.baseCommit = parts[5]
-				item.conflictingFile = parts[6]
-
-				total_list.append(item)
-
-		self.dataset = total_list
-
-	def LoadRange(self):
+		total_list = readTotalList(totalListPath)
+		renameIndex.apply(total_list, renameIndex.load(renameIndex.sidecarPath(totalListPath)))
+		self.dataset = dataset.Dataset(total_list)
+		self.totalListPath = totalListPath
+
+	def LoadRange(self, estimateCosts=None):
+		"""
+		:param estimateCosts: a function from a list of indices to a dict from index to the estimated cost of the example.
+		Option --order longest-first is only accepted with it.
+		"""
 		try:
 			i = sys.argv.index('--range')
 			value = sys.argv[i + 1]
@@ -69,7 +114,54 @@ class Options:
 			evaluateFrom = 0
 			evaluateTo = len(self.dataset)
 
-		self.evaluationRange = range(evaluateFrom, evaluateTo)
+		indices = range(evaluateFrom, evaluateTo)
+
+		filters = [sys.argv[i + 1] for i, arg in enumerate(sys.argv[0:-1]) if arg == '--filter']
+		try:
+			indices = self.dataset.select(indices, filters)
+		except ValueError as e:
+			print(f'Option --filter is invalid: {e}', file=sys.stderr)
+			exit(1)
+
+		if '--shard' in sys.argv:
+			indices = self._selectShard(indices)
+
+		try:
+			i = sys.argv.index('--order')
+			order = sys.argv[i + 1]
+		except:
+			order = 'input'
+		if order == 'repo':
+			indices = self.dataset.orderByRepository(indices)
+		elif order == 'longest-first' and estimateCosts is not None:
+			indices = self.dataset.orderByCost(indices, estimateCosts(list(indices)))
+		elif order == 'longest-first':
+			print('Option --order longest-first is only supported by merge.py.', file=sys.stderr)
+			exit(1)
+		elif order != 'input':
+			print(f'Option --order must be input, repo, or longest-first. What you passed is {order}', file=sys.stderr)
+			exit(1)
+
+		self.evaluationRange = list(indices)
+
+	def _selectShard(self, indices):
+		i = sys.argv.index('--shard')
+		try:
+			shardIndex, shardCount = [int(n) for n in sys.argv[i + 1].split('/')]
+		except (IndexError, ValueError):
+			shardIndex, shardCount = 0, 0
+		if not 1 <= shardIndex <= shardCount:
+			print('Option --shard must be k/n, where 1 <= k <= n, like 2/4.', file=sys.stderr)
+			exit(1)
+
+		costs = None
+		if '--shard-costs' in sys.argv:
+			costsPath = sys.argv[sys.argv.index('--shard-costs') + 1]
+			if not os.path.isfile(costsPath):
+				print(f'The journal for option --shard-costs is not at {costsPath}.', file=sys.stderr)
+				exit(1)
+			costs = runManifest.estimateCosts({i: self.dataset[i] for i in indices}, runManifest.loadDurations(costsPath))
+		return self.dataset.shard(indices, shardIndex - 1, shardCount, costs)
 
 
 def getHelp():
@@ -83,4 +175,24 @@ the path to the file containing all examples. If this option is missing, the pat
 
 --range	n1..n2
 run experiments against examples from n1, inclusive to n2, exclusive. n1 starts at 0. If this option is missing, run all examples.	
+
+--filter key=value1,value2
+only run examples matching any of the values. key is repo, ext (extension of the conflicting file, such as .java),
+merge (merge commit, may be abbreviated), or id (index of the example, or n1..n2).
+This option can be repeated, and an example must match all of them.
+
+--shard k/n
+only run the k-th of n shards, for running the examples on n machines. k starts at 1.
+Shards have about the same estimated cost, and every repository is in one shard. Apply the same --range and --filter on every machine.
+Combine the results of the machines with shardMerge.py.
+
+--shard-costs file
+estimate the cost of examples by their durations in this journal of merge.py. Without it, every example costs the same.
+Every machine must use the same file, or the shards overlap.
+
+--order input|repo|longest-first
+input (default) runs examples in the order of the list. repo runs examples of the same repository one after another.
+longest-first (merge.py only) runs repositories, and examples in them, from the longest predicted duration of the tools,
+so that a run with --jobs doesn't end waiting on one slow example. Durations are from the journal.
+Examples without a duration are estimated by the size of the conflicting file and the durations of the repository.
 '''.format(pathlib.Path(__file__).parent.parent.resolve())
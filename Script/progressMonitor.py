@@ -0,0 +1,194 @@
+"""
+Report the progress of a merge.py run in a status file that is rewritten periodically, or at a local HTTP endpoint, both in JSON.
+
+Every process that runs examples writes its own progress to <folder>/<pid>.json whenever it changes.
+The main process sums them up, so that a run with --jobs is reported as a whole.
+"""
+import datetime
+import http.server
+import json
+import logging
+import os
+import threading
+import time
+
+import workspaceManager
+
+# Seconds between two writes of the status file
+INTERVAL = 5
+OUTCOMES = ('success', 'failure', 'no-output', 'timeout')
+
+logger = logging.getLogger('progressMonitor')
+
+
+def _writeJson(path, value):
+	# Readers never see a partial file.
+	tmp = f'{path}.{os.getpid()}.tmp'
+	with open(tmp, 'w', encoding='utf-8') as f:
+		json.dump(value, f, indent='\t')
+	os.replace(tmp, path)
+
+
+class WorkerProgress:
+	"""
+	Progress of the examples run by this process.
+	"""
+
+	def __init__(self, folder):
+		self.folder = folder
+		self.done = 0
+		# (index, repo, conflicting file) of the example being run
+		self.example = None
+		self.tool = None
+		self.toolStarted = None
+		# A dict from tool to a dict from outcome to count
+		self.tools = {}
+		self.liveProcesses = 0
+		self._path = os.path.join(folder, f'{os.getpid()}.json')
+
+	def startExample(self, index, subjectRepo):
+		self.example = (index, subjectRepo.repoName, subjectRepo.conflictingFile)
+		self._write()
+
+	def startTool(self, tool):
+		self.tool = tool
+		self.toolStarted = time.time()
+		self._write()
+
+	def finishTool(self, tool, outcome):
+		"""
+		:param outcome: one of OUTCOMES, as recorded in the journal
+		"""
+		counts = self.tools.setdefault(tool, {name: 0 for name in OUTCOMES})
+		counts[outcome] += 1
+		self.tool = None
+		self.toolStarted = None
+		self._write()
+
+	def finishExample(self):
+		self.done += 1
+		self.example = None
+		self._write()
+
+	def setLiveProcesses(self, count):
+		"""
+		A ProcessUtils.processListener
+		"""
+		self.liveProcesses = count
+		self._write()
+
+	def _write(self):
+		_writeJson(self._path, {'done': self.done, 'example': self.example, 'tool': self.tool, 'toolStarted': self.toolStarted,
+								'tools': self.tools, 'liveProcesses': self.liveProcesses})
+
+	def __getstate__(self):
+		return self.folder
+
+	def __setstate__(self, folder):
+		# A worker process writes its own file.
+		self.__init__(folder)
+
+
+class ProgressMonitor:
+	"""
+	Sum up the progress of the processes in folder, and publish it in statusFile, at http://127.0.0.1:port/, or both.
+	"""
+
+	def __init__(self, folder, total, statusFile=None, port=None):
+		"""
+		:param total: number of examples of the run
+		:param port: 0 to pick a free port, which is in self.port after start
+		"""
+		self.folder = folder
+		self.total = total
+		self.statusFile = statusFile
+		self.port = port
+		self._started = time.time()
+		self._stopped = threading.Event()
+		self._thread = None
+		self._server = None
+
+	def snapshot(self):
+		"""
+		:return: the progress of the run, as a dict that json can serialize
+		"""
+		workers = []
+		for entry in os.scandir(self.folder):
+			if not entry.name.endswith('.json'):
+				continue
+			try:
+				with open(entry.path, 'r', encoding='utf-8') as f:
+					workers.append((int(entry.name[0:-len('.json')]), json.load(f)))
+			except (OSError, ValueError):
+				# The process is replacing the file.
+				continue
+
+		now = time.time()
+		done = sum(worker['done'] for _, worker in workers)
+		tools = {}
+		for _, worker in workers:
+			for tool, counts in worker['tools'].items():
+				total = tools.setdefault(tool, {name: 0 for name in OUTCOMES})
+				for name, count in counts.items():
+					total[name] += count
+		elapsed = now - self._started
+		perSecond = done / elapsed if elapsed > 0 else 0
+		return {
+			'started': datetime.datetime.fromtimestamp(self._started).isoformat(timespec='seconds'),
+			'elapsedSeconds': round(elapsed),
+			'total': self.total,
+			'done': done,
+			'remaining': self.total - done,
+			'examplesPerMinute': round(perSecond * 60, 2),
+			'etaSeconds': round((self.total - done) / perSecond) if perSecond > 0 else None,
+			'current': [{'pid': pid, 'index': worker['example'][0], 'repo': worker['example'][1], 'file': worker['example'][2], 'tool': worker['tool'],
+						 'toolSeconds': None if worker['toolStarted'] is None else round(now - worker['toolStarted'], 1)}
+						for pid, worker in sorted(workers) if worker['example'] is not None],
+			'tools': tools,
+			'liveProcesses': sum(worker['liveProcesses'] for _, worker in workers),
+		}
+
+	def start(self):
+		if self.port is not None:
+			monitor = self
+
+			class Handler(http.server.BaseHTTPRequestHandler):
+				def do_GET(self):
+					body = json.dumps(monitor.snapshot(), indent='\t').encode('utf-8')
+					self.send_response(200)
+					self.send_header('Content-Type', 'application/json')
+					self.send_header('Content-Length', str(len(body)))
+					self.end_headers()
+					self.wfile.write(body)
+
+				def log_message(self, format, *args):
+					pass
+
+			self._server = http.server.ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+			self.port = self._server.server_address[1]
+			threading.Thread(target=self._server.serve_forever, daemon=True).start()
+		if self.statusFile is not None:
+			self._thread = threading.Thread(target=self._writeStatusFile, daemon=True)
+			self._thread.start()
+
+	def _writeStatusFile(self):
+		while True:
+			try:
+				_writeJson(self.statusFile, self.snapshot())
+			except OSError as e:
+				logger.warning(f'Failed to write {self.statusFile}: {e}')
+			if self._stopped.wait(INTERVAL):
+				break
+
+	def stop(self):
+		"""
+		Write the status file a last time, stop the endpoint, and remove the progress files of the processes.
+		"""
+		self._stopped.set()
+		if self._thread is not None:
+			self._thread.join()
+			_writeJson(self.statusFile, self.snapshot())
+		if self._server is not None:
+			self._server.shutdown()
+			self._server.server_close()
+		workspaceManager.removeTree(self.folder)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Resolve the merged file of every example in one pass, and store the result next to the list of examples.
+
+The index is a TSV file with columns base commit, merge commit, conflicting file and merged file.
+"""
+import logging
+import os
+import sys
+from concurrent import futures
+
+import gitUtils
+
+logger = logging.getLogger('renameIndex')
+
+
+def sidecarPath(totalListPath):
+	"""
+	:return: the path of the rename index of the list of examples, e.g. total_list.renames.tsv for total_list.txt
+	"""
+	return os.path.splitext(totalListPath)[0] + '.renames.tsv'
+
+
+def load(indexPath):
+	"""
+	:return: a dict from (base commit, merge commit, conflicting file) to merged file. Empty if the index doesn't exist.
+	"""
+	index = {}
+	if not os.path.isfile(indexPath):
+		return index
+	with open(indexPath, 'r', encoding='utf-8') as f:
+		for line in f:
+			parts = line.rstrip('\n').split('\t')
+			if len(parts) == 4:
+				index[(parts[0], parts[1], parts[2])] = parts[3]
+	return index
+
+
+def save(indexPath, index):
+	tmp = indexPath + '.tmp'
+	with open(tmp, 'w', encoding='utf-8') as f:
+		for key in sorted(index):
+			f.write('\t'.join(key + (index[key],)) + '\n')
+	os.replace(tmp, indexPath)
+
+
+def apply(examples, index):
+	"""
+	Set the merged file of the examples found in the index. Others are detected when getMergedFile is called.
+	"""
+	for example in examples:
+		mergedFile = index.get((example.baseCommit, example.mergeCommit, example.conflictingFile))
+		if mergedFile is not None:
+			example._mergedFile = mergedFile
+
+
+def findRenamedFile(repoPath, file, baseCommit, mergeCommit):
+	"""
+	Same as dataset._findRenamedFile, but only files with the same extension are considered as rename targets.
+
+	:return: the merged file, or None if git fails, e.g. a commit is missing.
+	"""
+	pathspec = [file]
+	extension = os.path.splitext(file)[1]
+	if len(extension) > 0:
+		pathspec.append('*' + extension)
+	proc = gitUtils._git(['diff', '--name-status', '-z', '--find-renames', '--diff-filter=DR', baseCommit, mergeCommit, '--'] + pathspec, repoPath)
+	if proc.returncode != 0:
+		return None
+
+	fields = proc.stdout.split('\0')
+	i = 0
+	while i < len(fields) - 1:
+		status = fields[i]
+		if status.startswith('R'):
+			if fields[i + 1] == file:
+				return fields[i + 2]
+			i += 3
+		else:
+			i += 2
+	return file
+
+
+def resolveRepo(repoPath, examples):
+	"""
+	:param examples: examples of the repository at repoPath
+	:return: a dict from (base commit, merge commit, conflicting file) to merged file
+	"""
+	byMergeCommit = {}
+	for example in examples:
+		byMergeCommit.setdefault(example.mergeCommit, []).append(example)
+
+	index = {}
+	for mergeCommit, commitExamples in byMergeCommit.items():
+		# A file that still exists at the merge commit is never a rename source, so no diff is needed.
+		existing = gitUtils.listBlobs(repoPath, mergeCommit, [e.conflictingFile for e in commitExamples])
+		for example in commitExamples:
+			key = (example.baseCommit, example.mergeCommit, example.conflictingFile)
+			if example.conflictingFile in existing:
+				index[key] = example.conflictingFile
+			else:
+				mergedFile = findRenamedFile(repoPath, example.conflictingFile, example.baseCommit, mergeCommit)
+				if mergedFile is not None:
+					index[key] = mergedFile
+	return index
+
+
+def buildIndex(examples, workspaceFolder, jobs):
+	"""
+	Resolve the merged files of the examples, one repository per thread.
+	Repositories that aren't cloned in workspaceFolder are skipped.
+
+	:return: a dict from (base commit, merge commit, conflicting file) to merged file
+	"""
+	repos = {}
+	for example in examples:
+		repos.setdefault(example.repoName, []).append(example)
+
+	index = {}
+	with futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+		tasks = {}
+		for name, repoExamples in repos.items():
+			repoPath = os.path.join(workspaceFolder, name)
+			if not os.path.isdir(os.path.join(repoPath, '.git')):
+				logger.warning(f'{repoPath} is not cloned. Skip {len(repoExamples)} examples.')
+				continue
+			tasks[executor.submit(resolveRepo, repoPath, repoExamples)] = name
+		for task in futures.as_completed(tasks):
+			try:
+				index.update(task.result())
+			except Exception as e:
+				logger.error(f'Failed to resolve renames in {tasks[task]}: {e}')
+	return index
+
+
+if __name__ == '__main__':
+	# optionUtils imports this module.
+	import optionUtils
+
+	if '--help' in sys.argv:
+		print('''
+{0}
+
+Build the rename index next to the list of examples.
+Examples whose repositories aren't cloned in Resource/workspace are skipped. Existing entries are kept.
+
+--help	show this help.
+
+--jobs N
+Resolve N repositories in parallel. Default is 4.
+'''.format(sys.argv[0]) + optionUtils.getHelp())
+		exit(0)
+
+	logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+	jobs = optionUtils.getPositiveInt('--jobs', 4)
+
+	opt = optionUtils.Options()
+	opt.LoadDataset()
+	opt.LoadRange()
+
+	indexPath = sidecarPath(opt.totalListPath)
+	index = load(indexPath)
+	examples = [opt.dataset[i] for i in opt.evaluationRange]
+	resolved = buildIndex(examples, os.path.join(opt.path_prefix, 'Resource/workspace'), jobs)
+	index.update(resolved)
+	save(indexPath, index)
+	renamed = sum(1 for key, mergedFile in resolved.items() if key[2] != mergedFile)
+	logger.info(f'Resolved {len(resolved)} of {len(examples)} examples, {renamed} renamed. Index is at {indexPath}')
@@ -0,0 +1,173 @@
+import datetime
+import os
+import socket
+import sqlite3
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+	id INTEGER PRIMARY KEY,
+	kind TEXT NOT NULL,
+	label TEXT,
+	startedAt TEXT NOT NULL,
+	host TEXT,
+	args TEXT
+);
+CREATE TABLE IF NOT EXISTS examples (
+	id INTEGER PRIMARY KEY,
+	repoUrl TEXT NOT NULL,
+	repoName TEXT NOT NULL,
+	mergeCommit TEXT NOT NULL,
+	leftCommit TEXT NOT NULL,
+	rightCommit TEXT NOT NULL,
+	baseCommit TEXT NOT NULL,
+	conflictingFile TEXT NOT NULL,
+	UNIQUE (repoUrl, mergeCommit, leftCommit, rightCommit, baseCommit, conflictingFile)
+);
+CREATE TABLE IF NOT EXISTS toolRuns (
+	runId INTEGER NOT NULL REFERENCES runs(id),
+	exampleId INTEGER NOT NULL REFERENCES examples(id),
+	tool TEXT NOT NULL,
+	toolHash TEXT,
+	outcome TEXT NOT NULL,
+	duration REAL,
+	userTime REAL,
+	systemTime REAL,
+	maxRss INTEGER,
+	exitStatus INTEGER,
+	timedOut INTEGER
+);
+CREATE INDEX IF NOT EXISTS toolRunsByTool ON toolRuns (tool, exampleId);
+CREATE INDEX IF NOT EXISTS toolRunsByRun ON toolRuns (runId);
+CREATE TABLE IF NOT EXISTS comparisons (
+	runId INTEGER NOT NULL REFERENCES runs(id),
+	exampleId INTEGER NOT NULL REFERENCES examples(id),
+	tool TEXT NOT NULL,
+	diffSize INTEGER
+);
+CREATE INDEX IF NOT EXISTS comparisonsByTool ON comparisons (tool, exampleId);
+CREATE INDEX IF NOT EXISTS comparisonsByRun ON comparisons (runId);
+'''
+
+
+class ResultStore:
+	"""
+	An SQLite database of runs of merge.py and compare.py.
+
+	Rows are buffered and written in one transaction per batch, so several processes can share the database.
+	Call flush or close to write the buffered rows.
+	"""
+
+	def __init__(self, path, runId=None, batchSize=100):
+		self.path = path
+		self.runId = runId
+		self.batchSize = batchSize
+		self._pending = []
+		self._exampleIds = {}
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		# Other processes may hold the write lock for a batch.
+		self._connection = sqlite3.connect(path, timeout=60)
+		self._connection.execute('PRAGMA journal_mode=WAL')
+		with self._connection:
+			self._connection.executescript(_SCHEMA)
+
+	def startRun(self, kind, label=None, args=None):
+		"""
+		:param kind: merge or compare
+		:param label: a name to find the run in reports, e.g. a tool version
+		:return: id of the run
+		"""
+		with self._connection:
+			cursor = self._connection.execute('INSERT INTO runs (kind, label, startedAt, host, args) VALUES (?, ?, ?, ?, ?)',
+											  (kind, label, datetime.datetime.now().isoformat(timespec='seconds'), socket.gethostname(),
+											   None if args is None else ' '.join(args)))
+		self.runId = cursor.lastrowid
+		return self.runId
+
+	def _getExampleId(self, subjectRepo):
+		key = (subjectRepo.repoUrl, subjectRepo.mergeCommit, subjectRepo.leftCommit, subjectRepo.rightCommit, subjectRepo.baseCommit,
+			   subjectRepo.conflictingFile)
+		exampleId = self._exampleIds.get(key)
+		if exampleId is None:
+			self._connection.execute('INSERT OR IGNORE INTO examples (repoUrl, mergeCommit, leftCommit, rightCommit, baseCommit, conflictingFile, repoName) '
+									 'VALUES (?, ?, ?, ?, ?, ?, ?)', key + (subjectRepo.repoName,))
+			exampleId = self._connection.execute('SELECT id FROM examples WHERE repoUrl = ? AND mergeCommit = ? AND leftCommit = ? AND rightCommit = ? '
+												 'AND baseCommit = ? AND conflictingFile = ?', key).fetchone()[0]
+			self._exampleIds[key] = exampleId
+		return exampleId
+
+	def addToolRun(self, subjectRepo, tool, toolHash, outcome, duration, usage=()):
+		"""
+		:param usage: ProcessUtils usage records of the run. CPU times are summed, and memory is the peak.
+		"""
+		userTimes = [u['userTime'] for u in usage if u.get('userTime') is not None]
+		systemTimes = [u['systemTime'] for u in usage if u.get('systemTime') is not None]
+		maxRss = [u['maxRss'] for u in usage if u.get('maxRss') is not None]
+		self._pending.append(('INSERT INTO toolRuns (runId, exampleId, tool, toolHash, outcome, duration, userTime, systemTime, maxRss, exitStatus, timedOut) '
+							  'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+							  subjectRepo, (tool, toolHash, outcome, duration,
+											sum(userTimes) if len(userTimes) > 0 else None,
+											sum(systemTimes) if len(systemTimes) > 0 else None,
+											max(maxRss) if len(maxRss) > 0 else None,
+											usage[-1]['exitStatus'] if len(usage) > 0 else None,
+											any(u['timedOut'] for u in usage))))
+		if len(self._pending) >= self.batchSize:
+			self.flush()
+
+	def addComparison(self, subjectRepo, tool, diffSize):
+		"""
+		:param diffSize: None if the merged file or the expected file is missing
+		"""
+		self._pending.append(('INSERT INTO comparisons (runId, exampleId, tool, diffSize) VALUES (?, ?, ?, ?)',
+							  subjectRepo, (tool, diffSize)))
+		if len(self._pending) >= self.batchSize:
+			self.flush()
+
+	def flush(self):
+		if len(self._pending) == 0:
+			return
+		with self._connection:
+			for sql, subjectRepo, values in self._pending:
+				self._connection.execute(sql, (self.runId, self._getExampleId(subjectRepo)) + values)
+		self._pending = []
+
+	def importStore(self, path):
+		"""
+		Copy the runs, tool runs, and comparisons of another database into this one. Runs get new ids.
+		"""
+		self.flush()
+		self._connection.execute('ATTACH DATABASE ? AS other', (path,))
+		try:
+			with self._connection:
+				self._connection.execute('INSERT OR IGNORE INTO examples (repoUrl, repoName, mergeCommit, leftCommit, rightCommit, baseCommit, conflictingFile) '
+										 'SELECT repoUrl, repoName, mergeCommit, leftCommit, rightCommit, baseCommit, conflictingFile FROM other.examples')
+				exampleIds = dict(self._connection.execute(
+					'SELECT o.id, e.id FROM other.examples o JOIN examples e ON e.repoUrl = o.repoUrl AND e.mergeCommit = o.mergeCommit '
+					'AND e.leftCommit = o.leftCommit AND e.rightCommit = o.rightCommit AND e.baseCommit = o.baseCommit '
+					'AND e.conflictingFile = o.conflictingFile').fetchall())
+				for run in self._connection.execute('SELECT id, kind, label, startedAt, host, args FROM other.runs ORDER BY id').fetchall():
+					runId = self._connection.execute('INSERT INTO runs (kind, label, startedAt, host, args) VALUES (?, ?, ?, ?, ?)', run[1:]).lastrowid
+					for row in self._connection.execute('SELECT exampleId, tool, toolHash, outcome, duration, userTime, systemTime, maxRss, exitStatus, timedOut '
+														'FROM other.toolRuns WHERE runId = ?', (run[0],)).fetchall():
+						self._connection.execute('INSERT INTO toolRuns (runId, exampleId, tool, toolHash, outcome, duration, userTime, systemTime, maxRss, exitStatus, timedOut) '
+												 'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (runId, exampleIds[row[0]]) + row[1:])
+					for row in self._connection.execute('SELECT exampleId, tool, diffSize FROM other.comparisons WHERE runId = ?', (run[0],)).fetchall():
+						self._connection.execute('INSERT INTO comparisons (runId, exampleId, tool, diffSize) VALUES (?, ?, ?, ?)',
+												 (runId, exampleIds[row[0]]) + row[1:])
+		finally:
+			self._connection.execute('DETACH DATABASE other')
+
+	def query(self, sql, parameters=()):
+		self.flush()
+		return self._connection.execute(sql, parameters).fetchall()
+
+	def close(self):
+		self.flush()
+		self._connection.close()
+
+	def __getstate__(self):
+		self.flush()
+		return self.path, self.runId, self.batchSize
+
+	def __setstate__(self, state):
+		# A worker process opens its own connection.
+		self.__init__(*state)
@@ -0,0 +1,202 @@
+import datetime
+import hashlib
+import json
+import os
+import pathlib
+
+_toolHashes = {}
+
+
+def exampleKey(subjectRepo):
+	"""
+	Inputs of an example are a pure function of the key.
+	"""
+	return '\t'.join((subjectRepo.repoUrl, subjectRepo.mergeCommit, subjectRepo.leftCommit, subjectRepo.rightCommit,
+					  subjectRepo.baseCommit, subjectRepo.conflictingFile))
+
+
+def hashFile(path):
+	h = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(1024 * 1024), b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+
+def hashTool(toolPath):
+	"""
+	Hash the tool file, or every file in the tool folder. The result is cached for the process.
+	"""
+	toolPath = os.path.abspath(toolPath)
+	if toolPath not in _toolHashes:
+		if os.path.isdir(toolPath):
+			h = hashlib.sha256()
+			for file in sorted(pathlib.Path(toolPath).rglob('*')):
+				if file.is_file():
+					h.update(str(file.relative_to(toolPath)).encode('utf-8'))
+					h.update(hashFile(file).encode('utf-8'))
+			_toolHashes[toolPath] = h.hexdigest()
+		elif os.path.isfile(toolPath):
+			_toolHashes[toolPath] = hashFile(toolPath)
+		else:
+			# The tool is looked up in PATH.
+			_toolHashes[toolPath] = None
+	return _toolHashes[toolPath]
+
+
+def hashInputs(subjectRepo, inputFolders):
+	"""
+	:param inputFolders: (base_folder, left_Folder, right_folder, child_folder)
+	:return: a dict from version to the hash of the conflicting file, or None if the file doesn't exist in that version.
+	"""
+	hashes = {}
+	for version, folder in zip(('base', 'left', 'right', 'child'), inputFolders):
+		path = os.path.join(folder, subjectRepo.conflictingFile)
+		hashes[version] = hashFile(path) if os.path.isfile(path) else None
+	return hashes
+
+
+def statOutputs(folder):
+	"""
+	:return: a dict from relative path to (mtime_ns, size) of every merge result in folder.
+	"""
+	stats = {}
+	for item in pathlib.Path(folder).rglob('*'):
+		if item.name.endswith('-normalized.java') or not item.is_file():
+			continue
+		stat = item.stat()
+		stats[item.relative_to(folder).as_posix()] = (stat.st_mtime_ns, stat.st_size)
+	return stats
+
+
+def changedOutputs(folder, before):
+	"""
+	:param before: statOutputs of the folder before the tool runs.
+	:return: relative paths of files that the tool wrote.
+	"""
+	return [path for path, stat in statOutputs(folder).items() if before.get(path) != stat]
+
+
+def readLatest(journalPath):
+	"""
+	:return: a dict from (tool, example key) to the latest record in the journal. Empty if the journal doesn't exist.
+	"""
+	latest = {}
+	if os.path.isfile(journalPath):
+		with open(journalPath, 'r', encoding='utf-8') as f:
+			for line in f:
+				try:
+					record = json.loads(line)
+				except json.JSONDecodeError:
+					continue
+				latest[(record['tool'], record['example'])] = record
+	return latest
+
+
+def loadDurations(journalPath, tools=None):
+	"""
+	:param tools: only count runs of these tools. None counts every tool.
+	:return: a dict from example key to the seconds that the latest run of every tool took in total
+	"""
+	durations = {}
+	for (tool, key), record in readLatest(journalPath).items():
+		if tools is None or tool in tools:
+			durations[key] = durations.get(key, 0) + record['duration']
+	return durations
+
+
+def _median(values):
+	values = sorted(values)
+	return values[len(values) // 2] if len(values) > 0 else None
+
+
+def estimateCosts(examples, durations, sizes=None):
+	"""
+	Examples that the journal doesn't have are estimated by the size of their conflicting files,
+	at the seconds per byte of the known examples of the repository, or of all known examples.
+	Without a size, they take the median of the known examples of the repository, or of all known examples, or 1 if none is known.
+
+	:param examples: a dict from index to example
+	:param durations: the result of loadDurations
+	:param sizes: a dict from index to bytes of the conflicting file. Examples may be absent.
+	:return: a dict from index to the estimated seconds of the example
+	"""
+	if sizes is None:
+		sizes = {}
+	known = {i: durations[exampleKey(example)] for i, example in examples.items() if exampleKey(example) in durations}
+	knownByRepository = {}
+	for i in known:
+		knownByRepository.setdefault(examples[i].repoName, []).append(i)
+
+	def secondsPerByte(indices):
+		sized = [i for i in indices if sizes.get(i, 0) > 0]
+		return sum(known[i] for i in sized) / sum(sizes[i] for i in sized) if len(sized) > 0 else None
+
+	allRate = secondsPerByte(known)
+	allMedian = _median(known.values())
+	repositories = {name: (secondsPerByte(indices), _median(known[i] for i in indices)) for name, indices in knownByRepository.items()}
+	costs = {}
+	for i, example in examples.items():
+		if i in known:
+			costs[i] = known[i]
+			continue
+		rate, median = repositories.get(example.repoName, (None, None))
+		if rate is None:
+			rate = allRate
+		if median is None:
+			median = 1 if allMedian is None else allMedian
+		costs[i] = sizes[i] * rate if i in sizes and rate is not None else median
+	return costs
+
+
+class RunJournal:
+	"""
+	An append-only journal of tool runs, one JSON record per line.
+
+	Every record is flushed to disk before append returns, so a crash loses at most the run in progress.
+	A partially written last line is ignored when loading, and ended when the journal is opened again.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self._latest = readLatest(path)
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		# Appends from several processes don't interleave because each record is one write.
+		self._fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+		size = os.fstat(self._fd).st_size
+		if size > 0 and os.pread(self._fd, 1, size - 1) != b'\n':
+			# End the line of a crashed write, so that the next record isn't joined to it.
+			os.write(self._fd, b'\n')
+
+	def append(self, record):
+		record = dict(record, time=datetime.datetime.now().isoformat(timespec='seconds'))
+		os.write(self._fd, (json.dumps(record, sort_keys=True) + '\n').encode('utf-8'))
+		os.fsync(self._fd)
+		self._latest[(record['tool'], record['example'])] = record
+
+	def latest(self, tool, key):
+		return self._latest.get((tool, key))
+
+	def isUpToDate(self, tool, key, toolHash, resultFolder):
+		"""
+		:return: True if the latest run of tool on the example succeeded with the same tool binary, and its outputs are unchanged.
+		Failures, timeouts, and runs without output are run again.
+		"""
+		record = self.latest(tool, key)
+		if record is None or record['toolHash'] != toolHash or record.get('outcome') != 'success':
+			return False
+		for path, expected in record['outputs'].items():
+			actual = os.path.join(resultFolder, path)
+			if not os.path.isfile(actual) or hashFile(actual) != expected:
+				return False
+		return True
+
+	def close(self):
+		os.close(self._fd)
+
+	def __getstate__(self):
+		return self.path
+
+	def __setstate__(self, path):
+		# A worker process opens its own file descriptor and sees the records written so far.
+		self.__init__(path)
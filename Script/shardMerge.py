@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Combine the result folders of machines that ran merge.py with --shard into one result folder,
+and check that every example was run by exactly one shard.
+"""
+import csv
+import filecmp
+import logging
+import os
+import shutil
+import sys
+
+import optionUtils
+import resultStore
+import runManifest
+
+JOURNAL = 'journal.jsonl'
+DATABASE = 'results.sqlite'
+USAGE = 'usage'
+
+logger = logging.getLogger('shardMerge')
+
+
+def checkCoverage(exampleKeys, journals):
+	"""
+	:param exampleKeys: keys of the examples that the shards should cover
+	:param journals: paths of the journals of the shards
+	:return: (missing, duplicated), lists of (tool, example key). An example is missing if no shard ran the tool on it,
+	and duplicated if several shards did.
+	"""
+	shardCounts = {}
+	for path in journals:
+		for toolAndKey in runManifest.readLatest(path):
+			shardCounts[toolAndKey] = shardCounts.get(toolAndKey, 0) + 1
+	tools = sorted({tool for tool, _ in shardCounts})
+	missing = [(tool, key) for tool in tools for key in exampleKeys if (tool, key) not in shardCounts]
+	duplicated = sorted(toolAndKey for toolAndKey, count in shardCounts.items() if count > 1)
+	return missing, duplicated
+
+
+def copyResults(shardFolder, outputFolder, shardName):
+	"""
+	Copy the outputs of tools and the usage files of a shard. The journal and the database are merged separately.
+
+	:return: files that another shard has, with different content. The first copy is kept.
+	"""
+	conflicts = []
+	for folder, _, files in os.walk(shardFolder):
+		for name in files:
+			relativePath = os.path.relpath(os.path.join(folder, name), shardFolder)
+			if relativePath == JOURNAL or relativePath.startswith(DATABASE):
+				continue
+			target = os.path.join(outputFolder, relativePath)
+			if os.path.exists(target) and os.path.dirname(relativePath) == USAGE:
+				# Usage files are named by the start time, which machines may share.
+				target = os.path.join(outputFolder, USAGE, f'{shardName}-{name}')
+			if os.path.exists(target):
+				if not filecmp.cmp(target, os.path.join(folder, name), shallow=False):
+					conflicts.append(relativePath)
+				continue
+			os.makedirs(os.path.dirname(target), exist_ok=True)
+			shutil.copy2(os.path.join(folder, name), target)
+	return conflicts
+
+
+def mergeCsv(csvFiles, outputFile, examples):
+	"""
+	Concatenate CSV reports of compare.py, with rows in the order of examples.
+
+	:param examples: the examples that the shards should cover
+	:return: (missing, duplicated), lists of (repo, conflicting file) that have fewer or more rows than examples
+	:raise ValueError: the reports have different columns
+	"""
+	header = None
+	rows = []
+	for file in csvFiles:
+		with open(file, newline='', encoding='utf-8') as f:
+			reader = csv.reader(f)
+			fileHeader = next(reader, None)
+			if header is None:
+				header = fileHeader
+			elif fileHeader != header:
+				raise ValueError(f'Columns of {file} are {fileHeader}, but those of {csvFiles[0]} are {header}.')
+			rows.extend(row for row in reader if len(row) > 0)
+
+	expected = {}
+	rank = {}
+	for i, example in enumerate(examples):
+		key = (example.repoName, example.conflictingFile)
+		expected[key] = expected.get(key, 0) + 1
+		rank.setdefault(key, i)
+	# Rows of other examples go last.
+	rows.sort(key=lambda row: rank.get((row[0], row[1]), len(rank)))
+
+	with open(outputFile, 'w', newline='', encoding='utf-8') as f:
+		writer = csv.writer(f)
+		if header is not None:
+			writer.writerow(header)
+		writer.writerows(rows)
+
+	actual = {}
+	for row in rows:
+		actual[(row[0], row[1])] = actual.get((row[0], row[1]), 0) + 1
+	missing = [key for key, count in expected.items() if actual.get(key, 0) < count]
+	duplicated = [key for key, count in actual.items() if count > expected.get(key, 0)]
+	return missing, duplicated
+
+
+def mergeShards(shardFolders, outputFolder):
+	"""
+	Copy the result folders of the shards into outputFolder, concatenate their journals, and import their databases.
+
+	:return: files that shards have with different content
+	"""
+	os.makedirs(outputFolder, exist_ok=True)
+	conflicts = []
+	store = None
+	with open(os.path.join(outputFolder, JOURNAL), 'a', encoding='utf-8') as journal:
+		for k, shardFolder in enumerate(shardFolders):
+			conflicts.extend(copyResults(shardFolder, outputFolder, f'shard{k + 1}'))
+			if os.path.isfile(os.path.join(shardFolder, JOURNAL)):
+				with open(os.path.join(shardFolder, JOURNAL), 'r', encoding='utf-8') as f:
+					shutil.copyfileobj(f, journal)
+			if os.path.isfile(os.path.join(shardFolder, DATABASE)):
+				if store is None:
+					store = resultStore.ResultStore(os.path.join(outputFolder, DATABASE))
+				store.importStore(os.path.join(shardFolder, DATABASE))
+	if store is not None:
+		store.close()
+	return conflicts
+
+
+if __name__ == '__main__':
+	shardFolders = []
+	for arg in sys.argv[2:]:
+		if arg.startswith('--'):
+			break
+		shardFolders.append(arg)
+	if len(shardFolders) == 0 or '--help' in sys.argv:
+		print('''
+{0} output shard1 shard2 ... [--csv file]... [--csv-output file]
+
+Copy the result folders (Resource/workspace/result) of machines that ran merge.py with --shard k/n into the output folder,
+concatenate their journals, and import their results.sqlite.
+Then check that the journals have a run of every tool on every example exactly once.
+Pass the same --total_list, --range, and --filter as the machines, but not --shard.
+
+--csv file
+a CSV report of compare.py of a shard. This option can be repeated.
+
+--csv-output file
+write the rows of the CSV reports to this file, in the order of the examples, and check that every example has exactly one row.
+
+The exit code is 1 if an example is missing or duplicated, or shards have different files of the same path.
+'''.format(sys.argv[0]) + optionUtils.getHelp())
+		exit(0)
+
+	logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+	outputFolder = sys.argv[1]
+	if os.path.isdir(outputFolder) and len(os.listdir(outputFolder)) > 0:
+		print(f'The output folder {outputFolder} is not empty.', file=sys.stderr)
+		exit(1)
+	for shardFolder in shardFolders:
+		if not os.path.isdir(shardFolder):
+			print(f'The result folder {shardFolder} does not exist.', file=sys.stderr)
+			exit(1)
+
+	opt = optionUtils.Options()
+	opt.LoadDataset()
+	opt.LoadRange()
+	examples = [opt.dataset[i] for i in opt.evaluationRange]
+
+	ok = True
+	conflicts = mergeShards(shardFolders, outputFolder)
+	for path in conflicts:
+		logger.error(f'Shards have different {path}.')
+	ok = ok and len(conflicts) == 0
+
+	missing, duplicated = checkCoverage([runManifest.exampleKey(example) for example in examples],
+										[os.path.join(folder, JOURNAL) for folder in shardFolders])
+	for tool, key in missing:
+		logger.error(f'No shard ran {tool} on {key}.')
+	for tool, key in duplicated:
+		logger.error(f'Several shards ran {tool} on {key}.')
+	ok = ok and len(missing) == 0 and len(duplicated) == 0
+
+	csvFiles = [sys.argv[i + 1] for i, arg in enumerate(sys.argv[0:-1]) if arg == '--csv']
+	if '--csv-output' in sys.argv:
+		try:
+			missing, duplicated = mergeCsv(csvFiles, sys.argv[sys.argv.index('--csv-output') + 1], examples)
+		except ValueError as e:
+			print(e, file=sys.stderr)
+			exit(1)
+		for repo, file in missing:
+			logger.error(f'No CSV report has a row of {repo} {file}.')
+		for repo, file in duplicated:
+			logger.error(f'CSV reports have several rows of {repo} {file}.')
+		ok = ok and len(missing) == 0 and len(duplicated) == 0
+
+	logger.info(f'Merged {len(shardFolders)} shards of {len(examples)} examples into {outputFolder}.')
+	if not ok:
+		exit(1)
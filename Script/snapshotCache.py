@@ -0,0 +1,126 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+
+# The file doesn't exist in the commit. It's cached as well so that a hit never needs the repository.
+ABSENT = object()
+# ioctl of Linux that makes a file share the blocks of another, copy-on-write
+_FICLONE = 0x40049409
+
+
+def parseSize(value) -> int:
+	"""
+	:param value: a number of bytes, optionally followed by K, M, or G.
+	"""
+	units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+	value = value.strip().upper()
+	if len(value) > 0 and value[-1] in units:
+		return int(float(value[0:-1]) * units[value[-1]])
+	return int(value)
+
+
+class SnapshotCache:
+	"""
+	An on-disk cache of file snapshots, keyed by (repoUrl, sha, path).
+
+	A snapshot is a pure function of the key, so entries never need invalidation.
+	When the total size exceeds maxBytes, the least recently used entries are evicted.
+	Entries are read-only, and the workspace gets copies of them, so that neither tools nor later writes can change them.
+	"""
+
+	def __init__(self, root, maxBytes):
+		self.root = root
+		self.maxBytes = maxBytes
+		os.makedirs(root, exist_ok=True)
+		self._size = sum(size for _, _, size in self._entries())
+
+	@staticmethod
+	def key(repoUrl, sha, path):
+		return hashlib.sha256('\0'.join((repoUrl, sha, path)).encode('utf-8')).hexdigest()
+
+	def _path(self, key):
+		return os.path.join(self.root, key[0:2], key)
+
+	def _entries(self):
+		"""
+		:return: (path, mtime, size) of every entry
+		"""
+		for bucket in os.scandir(self.root):
+			if not bucket.is_dir():
+				continue
+			for entry in os.scandir(bucket.path):
+				stat = entry.stat()
+				yield entry.path, stat.st_mtime, stat.st_size
+
+	def get(self, repoUrl, sha, path):
+		"""
+		:return: path of the cached file, ABSENT if the file doesn't exist in the commit, or None if not cached.
+		"""
+		entry = self._path(self.key(repoUrl, sha, path))
+		for candidate in (entry, entry + '.absent'):
+			try:
+				# mtime serves as the last access time because atime is often disabled.
+				os.utime(candidate)
+			except FileNotFoundError:
+				continue
+			return entry if candidate == entry else ABSENT
+		return None
+
+	def put(self, repoUrl, sha, path, sourceFile):
+		"""
+		:param sourceFile: the file to cache, or None if the file doesn't exist in the commit.
+		"""
+		entry = self._path(self.key(repoUrl, sha, path))
+		os.makedirs(os.path.dirname(entry), exist_ok=True)
+		if sourceFile is None:
+			open(entry + '.absent', 'w').close()
+			return
+
+		# Another merge.py process may look up the same snapshot meanwhile. It finds no entry or a complete one.
+		fd, tmp = tempfile.mkstemp(dir=os.path.dirname(entry))
+		with os.fdopen(fd, 'wb') as f, open(sourceFile, 'rb') as src:
+			shutil.copyfileobj(src, f)
+		os.chmod(tmp, 0o444)
+		os.replace(tmp, entry)
+		self._size += os.path.getsize(entry)
+		if self._size > self.maxBytes:
+			self.evict()
+
+	def evict(self):
+		"""
+		Remove least recently used entries until the cache is within 90% of maxBytes.
+		"""
+		entries = sorted(self._entries(), key=lambda e: e[1])
+		self._size = sum(size for _, _, size in entries)
+		for path, _, size in entries:
+			if self._size <= self.maxBytes * 0.9:
+				break
+			try:
+				os.unlink(path)
+				self._size -= size
+			except FileNotFoundError:
+				pass
+
+	@staticmethod
+	def materialize(cachedFile, target):
+		"""
+		Copy the cached file to target, as a reflink if the file system supports it.
+		Tools may write to their inputs, and the next example writes to the same path, so a hard link would change the entry.
+		"""
+		os.makedirs(os.path.dirname(target), exist_ok=True)
+		if os.path.lexists(target):
+			os.unlink(target)
+		if fcntl is not None:
+			try:
+				with open(cachedFile, 'rb') as src, open(target, 'wb') as dst:
+					fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+				return
+			except OSError:
+				pass
+		shutil.copyfile(cachedFile, target)
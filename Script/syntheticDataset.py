@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Generate git repositories with merge scenarios, and a list of examples that points at them with file:// URLs.
+The output only depends on the parameters, so commit ids are the same on every run.
+"""
+import os
+import random
+import subprocess
+import sys
+
+# Commits have fixed dates, so that commit ids are reproducible.
+_COMMIT_TIME = 1600000000
+
+
+# Imports of generated Java files. Files take a prefix of it, so that the block is sorted in base.
+_IMPORTS = ['import java.io.File;', 'import java.io.IOException;', 'import java.nio.file.Path;', 'import java.util.ArrayList;',
+			'import java.util.HashMap;', 'import java.util.List;', 'import java.util.Map;', 'import java.util.Set;']
+
+
+class Profile:
+	"""
+	Properties of generated examples. Ratios are the probability that an example has the property.
+	"""
+
+	def __init__(self, fileLines=60, hunks=1, javaRatio=1.0, renameRatio=0.0, importShuffleRatio=0.0):
+		"""
+		:param fileLines: approximate number of lines of the conflicting file
+		:param hunks: number of places that both left and right edit, which conflict
+		:param javaRatio: Java files, otherwise .properties files
+		:param renameRatio: the merge commit moves the conflicting file to another folder
+		:param importShuffleRatio: the merge commit reorders the imports of a Java file, which compare.normalizeFile undoes
+		"""
+		self.fileLines = fileLines
+		self.hunks = hunks
+		self.javaRatio = javaRatio
+		self.renameRatio = renameRatio
+		self.importShuffleRatio = importShuffleRatio
+
+
+def _unit(rng, isJava, k):
+	"""
+	:return: lines of the k-th method of a Java class, or the k-th section of a .properties file. _edit replaces the line of value.
+	"""
+	value = f'value * {rng.randint(2, 99)}'
+	if isJava:
+		return ['', f'\tpublic int method{k}(int value) {{', f'\t\tint result = {value};', f'\t\tresult += {rng.randint(0, 999)};', '\t\treturn result;', '\t}']
+	return [f'# section {k}', f'key.{k}.a = {value}', f'key.{k}.b = {rng.randint(0, 999)}']
+
+
+def _edit(units, k, isJava, value):
+	units = list(units)
+	units[k] = list(units[k])
+	units[k][2 if isJava else 1] = f'\t\tint result = {value};' if isJava else f'key.{k}.a = {value}'
+	return units
+
+
+def _render(units, header, footer):
+	return header + [line for unit in units for line in unit] + footer
+
+
+def scenario(rng, index, profile=None):
+	"""
+	Left and right each edit one method, or section, of their own, and both edit profile.hunks others in different ways.
+	The merge takes all edits, and resolves each conflict by combining both sides.
+
+	:return: (conflicting file, merged file, base, left, right, merged), where each version is a list of lines
+	"""
+	if profile is None:
+		profile = Profile()
+	isJava = rng.random() < profile.javaRatio
+	renamed = rng.random() < profile.renameRatio
+	shuffled = isJava and rng.random() < profile.importShuffleRatio
+
+	unitLines = 6 if isJava else 3
+	count = max(profile.hunks + 2, profile.fileLines // unitLines)
+	units = [_unit(rng, isJava, k) for k in range(count)]
+	edited = rng.sample(range(count), profile.hunks + 2)
+	leftOnly, rightOnly, conflicts = edited[0], edited[1], edited[2:]
+
+	left = _edit(units, leftOnly, isJava, 'value << 1')
+	right = _edit(units, rightOnly, isJava, 'value >> 1')
+	merged = _edit(left, rightOnly, isJava, 'value >> 1')
+	for k in conflicts:
+		left = _edit(left, k, isJava, f'value + {k}')
+		right = _edit(right, k, isJava, f'value - {k}')
+		merged = _edit(merged, k, isJava, f'value + {k} - {k}')
+
+	name = f'Example{index}'
+	if isJava:
+		imports = _IMPORTS[0:rng.randint(2, len(_IMPORTS))]
+		header = ['package bench;', ''] + imports + ['', f'public class {name} {{']
+		mergedImports = list(imports)
+		if shuffled:
+			while mergedImports == imports:
+				rng.shuffle(mergedImports)
+		mergedHeader = ['package bench;', ''] + mergedImports + ['', f'public class {name} {{']
+		footer = ['}']
+		conflictingFile = f'src/main/java/bench/{name}.java'
+	else:
+		header = mergedHeader = [f'# Settings of {name}']
+		footer = []
+		conflictingFile = f'src/main/resources/{name.lower()}.properties'
+	mergedFile = conflictingFile.replace('/bench', '/bench/moved', 1) if isJava else conflictingFile.replace('/resources', '/resources/moved', 1)
+	if not renamed:
+		mergedFile = conflictingFile
+
+	return (conflictingFile, mergedFile, _render(units, header, footer), _render(left, header, footer), _render(right, header, footer),
+			_render(merged, mergedHeader, footer))
+
+
+class _FastImport:
+	"""
+	Write a git fast-import stream, where every object has a mark.
+	"""
+
+	def __init__(self):
+		self.chunks = []
+		self.mark = 0
+
+	def _nextMark(self):
+		self.mark += 1
+		return self.mark
+
+	def blob(self, lines):
+		mark = self._nextMark()
+		data = ('\n'.join(lines) + '\n').encode('utf-8')
+		self.chunks.append(f'blob\nmark :{mark}\ndata {len(data)}\n'.encode('utf-8') + data + b'\n')
+		return mark
+
+	def commit(self, message, files, parents, deleted=()):
+		"""
+		:param files: a dict from path to blob mark
+		:param parents: marks of parent commits
+		:param deleted: paths to delete
+		"""
+		mark = self._nextMark()
+		message = message.encode('utf-8')
+		header = f'commit refs/heads/master\nmark :{mark}\ncommitter Bench <bench@example.com> {_COMMIT_TIME + mark} +0000\ndata {len(message)}\n'
+		body = ''
+		if len(parents) > 0:
+			body += f'from :{parents[0]}\n'
+		for parent in parents[1:]:
+			body += f'merge :{parent}\n'
+		for path in deleted:
+			body += f'D {path}\n'
+		for path, blob in files.items():
+			body += f'M 100644 :{blob} {path}\n'
+		self.chunks.append(header.encode('utf-8') + message + b'\n' + body.encode('utf-8') + b'\n')
+		return mark
+
+	def run(self, repoPath):
+		"""
+		:return: a dict from mark to object id
+		"""
+		marksFile = os.path.join(repoPath, '.git', 'bench-marks')
+		subprocess.run(['git', 'fast-import', '--quiet', f'--export-marks={marksFile}'], cwd=repoPath, input=b''.join(self.chunks), check=True)
+		marks = {}
+		with open(marksFile) as f:
+			for line in f:
+				mark, sha = line.split()
+				marks[int(mark[1:])] = sha
+		os.unlink(marksFile)
+		return marks
+
+
+def createRepository(repoPath, repoName, firstIndex, count, seed, profile=None):
+	"""
+	Create a repository with count merge scenarios, one after another on the history.
+
+	:return: lines of the list of examples, in the format of total_list.txt
+	"""
+	os.makedirs(repoPath)
+	subprocess.run(['git', 'init', '-q'], cwd=repoPath, check=True)
+	# Clients fetch commits by id, and partial clones filter blobs.
+	subprocess.run(['git', 'config', 'uploadpack.allowAnySHA1InWant', 'true'], cwd=repoPath, check=True)
+	subprocess.run(['git', 'config', 'uploadpack.allowFilter', 'true'], cwd=repoPath, check=True)
+
+	stream = _FastImport()
+	scenarios = []
+	previous = None
+	for index in range(firstIndex, firstIndex + count):
+		path, mergedPath, base, left, right, merged = scenario(random.Random(seed * 1000003 + index), index, profile)
+		baseCommit = stream.commit(f'base {index}', {path: stream.blob(base)}, [] if previous is None else [previous])
+		leftCommit = stream.commit(f'left {index}', {path: stream.blob(left)}, [baseCommit])
+		rightCommit = stream.commit(f'right {index}', {path: stream.blob(right)}, [baseCommit])
+		previous = stream.commit(f'merge {index}', {mergedPath: stream.blob(merged)}, [leftCommit, rightCommit],
+								 [path] if mergedPath != path else [])
+		scenarios.append((previous, leftCommit, rightCommit, baseCommit, path))
+	marks = stream.run(repoPath)
+
+	url = 'file://' + os.path.abspath(repoPath).replace(os.sep, '/')
+	return ['\t'.join([url, repoName, marks[merge], marks[left], marks[right], marks[base], path])
+			for merge, left, right, base, path in scenarios]
+
+
+def createDataset(folder, examples, examplesPerRepo=50, seed=0, profile=None):
+	"""
+	Create repositories in folder/repos and the list of examples at folder/total_list.txt.
+
+	:param profile: Profile of the examples. Default is Java files of 60 lines with one conflict.
+
+	:return: path of the list of examples
+	"""
+	lines = []
+	for r in range((examples + examplesPerRepo - 1) // examplesPerRepo):
+		repoName = f'bench{r}'
+		first = r * examplesPerRepo
+		lines += createRepository(os.path.join(folder, 'repos', repoName), repoName, first, min(examplesPerRepo, examples - first), seed, profile)
+
+	totalListPath = os.path.join(folder, 'total_list.txt')
+	with open(totalListPath, 'w') as f:
+		f.write('\n'.join(lines) + '\n')
+	return totalListPath
+
+
+if __name__ == '__main__':
+	if len(sys.argv) < 3 or '--help' in sys.argv:
+		print('''
+{0} folder examples [options]
+
+Create repositories with the given number of merge scenarios in folder/repos, and the list of examples at folder/total_list.txt.
+Run merge.py and compare.py with --total_list folder/total_list.txt.
+
+--examples-per-repo N	default is 50.
+--seed N	the same seed and options create the same commits. Default is 0.
+--file-lines N	approximate number of lines of conflicting files. Default is 60.
+--hunks N	number of conflicting hunks in each example. Default is 1.
+--java-ratio R	ratio of Java files. Others are .properties files. Default is 1.
+--rename-ratio R	ratio of examples whose merge commit moves the conflicting file, which getMergedFile detects. Default is 0.
+--import-shuffle-ratio R	ratio of Java examples whose merge commit reorders imports, which compare.py normalizes. Default is 0.
+'''.format(sys.argv[0]))
+		exit(0)
+
+	options = {'--examples-per-repo': 50, '--seed': 0, '--file-lines': 60, '--hunks': 1,
+			   '--java-ratio': 1.0, '--rename-ratio': 0.0, '--import-shuffle-ratio': 0.0}
+	for name, default in options.items():
+		if name in sys.argv:
+			i = sys.argv.index(name)
+			try:
+				options[name] = type(default)(sys.argv[i + 1])
+			except (IndexError, ValueError):
+				print(f'Option {name} must be a number.', file=sys.stderr)
+				exit(1)
+
+	profile = Profile(options['--file-lines'], options['--hunks'], options['--java-ratio'], options['--rename-ratio'], options['--import-shuffle-ratio'])
+	print(createDataset(sys.argv[1], int(sys.argv[2]), options['--examples-per-repo'], options['--seed'], profile))
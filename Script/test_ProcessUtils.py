@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import ProcessUtils
+
+
+def _readRecords(path):
+	with open(path) as f:
+		return [json.loads(line) for line in f]
+
+
+def test_run(tmp_path, monkeypatch):
+	recorder = ProcessUtils.UsageRecorder(str(tmp_path / 'usage.jsonl'))
+	recorder.setContext(example='e', tool='t')
+	monkeypatch.setattr(ProcessUtils, 'usageRecorder', recorder)
+
+	cmd = [sys.executable, '-c', 'import sys; x = bytearray(50 * 1024 * 1024); sys.stdout.write("out"); sys.stderr.write("err"); sys.exit(3)']
+	result = ProcessUtils.run(cmd, 60)
+
+	assert (result.stdout, result.stderr, result.returncode, result.stopped) == (b'out', b'err', 3, False)
+	with pytest.raises(subprocess.SubprocessError, match='err'):
+		result.check()
+	[record] = _readRecords(tmp_path / 'usage.jsonl')
+	assert recorder.records == [record]
+	assert record['example'] == 'e' and record['tool'] == 't'
+	assert record['exitStatus'] == 3 and record['timedOut'] is False
+	assert record['wallTime'] > 0
+	if record['maxRss'] is not None:
+		assert record['maxRss'] > 50 * 1024
+
+
+def test_run_lineCallbacks():
+	lines = []
+
+	def onStderrLine(line):
+		lines.append(line)
+		return line == 'fatal'
+
+	cmd = [sys.executable, '-c', 'import sys, time; print("a\\nb", flush=True); print("x\\nfatal", file=sys.stderr, flush=True); time.sleep(60)']
+	result = ProcessUtils.run(cmd, 60, onStdoutLine=lines.append, onStderrLine=onStderrLine, captureStdout=False)
+
+	assert sorted(lines) == ['a', 'b', 'fatal', 'x']
+	assert result.stopped is True and result.stdout is None
+	with pytest.raises(subprocess.SubprocessError):
+		result.check()
+
+
+def test_runAsync_concurrency(tmp_path, monkeypatch):
+	monkeypatch.setattr(ProcessUtils, 'concurrencyLimit', ProcessUtils.ConcurrencyLimit(2, str(tmp_path)))
+	cmd = [sys.executable, '-c', 'import time; time.sleep(0.5)']
+
+	async def runAll():
+		return await asyncio.gather(*[ProcessUtils.runAsync(cmd, 60) for _ in range(2)])
+
+	def runInThread(results):
+		results.extend(asyncio.run(runAll()))
+
+	# run() and every thread make their own event loop, and the limit holds across them.
+	results = []
+	start = time.perf_counter()
+	thread = threading.Thread(target=runInThread, args=(results,))
+	thread.start()
+	results.extend(asyncio.run(runAll()))
+	thread.join()
+
+	assert [r.returncode for r in results] == [0] * 4
+	# Two rounds of two processes
+	assert time.perf_counter() - start >= 1
+
+
+def test_runAsync_cancel(tmp_path, monkeypatch):
+	monkeypatch.setattr(ProcessUtils, 'usageRecorder', ProcessUtils.UsageRecorder(str(tmp_path / 'usage.jsonl')))
+
+	async def cancel():
+		task = asyncio.ensure_future(ProcessUtils.runAsync([sys.executable, '-c', 'import time; time.sleep(60)'], 60))
+		await asyncio.sleep(0.5)
+		task.cancel()
+		with pytest.raises(asyncio.CancelledError):
+			await task
+
+	asyncio.run(cancel())
+	[record] = _readRecords(tmp_path / 'usage.jsonl')
+	assert record['exitStatus'] == -9
+
+
+def _isAlive(pid):
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	# A zombie is dead but not reaped by its parent.
+	with open(f'/proc/{pid}/stat') as f:
+		return f.read().split(') ')[1][0] != 'Z'
+
+
+@pytest.mark.skipif(sys.platform != 'linux', reason='reads /proc')
+def test_run_timeoutKillsTree(tmp_path, monkeypatch):
+	monkeypatch.setattr(ProcessUtils, 'usageRecorder', ProcessUtils.UsageRecorder(str(tmp_path / 'usage.jsonl')))
+	pidFile = tmp_path / 'pid'
+	# The shell starts a grandchild, like `java -jar` in a shell.
+	cmd = f'{sys.executable} -c "import os, time; open(\'{pidFile}\', \'w\').write(str(os.getpid())); time.sleep(60)" & wait'
+	with pytest.raises(subprocess.SubprocessError, match='does not finish in time'):
+		ProcessUtils.run(cmd, 1, shell=True)
+
+	grandchild = int(pidFile.read_text())
+	for _ in range(100):
+		if not _isAlive(grandchild):
+			break
+		time.sleep(0.05)
+	assert not _isAlive(grandchild)
+	[record] = _readRecords(tmp_path / 'usage.jsonl')
+	assert record['timedOut'] is True
+
+
+@pytest.mark.skipif(sys.platform != 'linux', reason='reads /proc')
+def test_run_killsBackgroundProcesses(tmp_path):
+	pidFile = tmp_path / 'pid'
+	# The shell exits, and leaves the grandchild in its process group.
+	cmd = f'{sys.executable} -c "import os, time; open(\'{pidFile}\', \'w\').write(str(os.getpid())); time.sleep(60)" & sleep 0.5'
+	result = ProcessUtils.run(cmd, 60, shell=True)
+
+	assert result.returncode == 0
+	grandchild = int(pidFile.read_text())
+	for _ in range(100):
+		if not _isAlive(grandchild):
+			break
+		time.sleep(0.05)
+	assert not _isAlive(grandchild)
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='rlimit is POSIX only')
+def test_cpuLimit(monkeypatch):
+	monkeypatch.setattr(ProcessUtils, 'cpuLimit', 1)
+
+	result = ProcessUtils.run([sys.executable, '-c', 'while True: pass'], 60)
+
+	assert result.returncode < 0
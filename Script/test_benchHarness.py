@@ -0,0 +1,17 @@
+import benchHarness
+
+
+def test_benchmark(tmp_path):
+	results = benchHarness.benchmark(str(tmp_path), 3, examplesPerRepo=2)
+	assert results['loadDataset'][0] == 1
+	assert all(results[phase][0] == 3 for phase in benchHarness.PHASES[1:])
+
+	report = benchHarness.parseReport(benchHarness.formatReport({3: results}))
+	assert sorted(phase for _, phase in report) == sorted(benchHarness.PHASES)
+
+
+def test_findRegressions():
+	baseline = {(10, 'runTool'): (1.0, 100.0), (10, 'loadDataset'): (0.001, 1.0)}
+	report = {(10, 'runTool'): (1.5, 150.0), (10, 'loadDataset'): (0.002, 2.0), (100, 'runTool'): (9.0, 90.0)}
+	assert benchHarness.findRegressions(report, baseline, 0.2) == [(10, 'runTool', 100.0, 150.0)]
+	assert benchHarness.findRegressions(report, baseline, 0.6) == []
@@ -0,0 +1,45 @@
+import os
+import shutil
+
+import bundleTool
+import gitUtils
+import merge
+import optionUtils
+import syntheticDataset
+
+
+def test_exportAndImport(tmp_path):
+	examples = optionUtils.readTotalList(syntheticDataset.createDataset(str(tmp_path / 'dataset'), 3, examplesPerRepo=2))
+	workspace = str(tmp_path / 'workspace')
+	for example in examples:
+		merge.prepare_repo(os.path.join(workspace, example.repoName), example.repoUrl, example.mergeCommit)
+	bundleFolder = str(tmp_path / 'bundles')
+	assert bundleTool.exportDataset(examples, workspace, bundleFolder, 2) == ['bench0', 'bench1']
+
+	# Without network
+	shutil.rmtree(tmp_path / 'dataset')
+	newWorkspace = str(tmp_path / 'new')
+	assert bundleTool.importRepo(os.path.join(newWorkspace, 'bench1'), examples[2].repoUrl, gitUtils.bundlePath(bundleFolder, 'bench1'))
+	assert gitUtils.listFetchedCommits(os.path.join(newWorkspace, 'bench1')) >= {examples[2].baseCommit, examples[2].mergeCommit}
+
+	merge.bundleFolder = bundleFolder
+	try:
+		for example in examples[0:2]:
+			repoPath = os.path.join(newWorkspace, example.repoName)
+			merge.prepare_repo(repoPath, example.repoUrl, example.mergeCommit)
+			assert os.path.isfile(os.path.join(repoPath, example.conflictingFile))
+	finally:
+		merge.bundleFolder = None
+
+
+def test_preparePartialRepo(tmp_path):
+	examples = optionUtils.readTotalList(syntheticDataset.createDataset(str(tmp_path / 'dataset'), 1))
+	repoPath = os.path.join(str(tmp_path / 'workspace'), 'bench0')
+	merge.prepare_repo(repoPath, examples[0].repoUrl, examples[0].mergeCommit)
+	bundleTool.exportDataset(examples, str(tmp_path / 'workspace'), str(tmp_path / 'bundles'), 1)
+
+	shutil.rmtree(tmp_path / 'dataset')
+	newRepoPath = str(tmp_path / 'new' / 'bench0')
+	assert gitUtils.preparePartialRepo(newRepoPath, examples[0].repoUrl, examples, bundleFile=gitUtils.bundlePath(str(tmp_path / 'bundles'), 'bench0')) == 0
+	with gitUtils.ObjectReader(newRepoPath) as reader:
+		assert reader.read(f'{examples[0].mergeCommit}:{examples[0].conflictingFile}') is not None
@@ -1,7 +1,9 @@
 import os
+import sys
 import tempfile
 
 import compare
+import dataset
 
 
 def test_normalizeFile():
@@ -37,3 +39,98 @@ def test_normalizeFile():
 
 	os.unlink(sampleFile.name)
 	os.unlink(outputFile.name)
+
+
+def test_diffSize_agreesWithGit(tmp_path):
+	samples = {
+		'a.java': 'class A {\n\tint x;\n}\n',
+		'spaces.java': 'class  A{\n\n    int x ;\r\n}',
+		'changed.java': 'class A {\n\tint y;\n}\n',
+		'extraLine.java': 'class A {\n\tint x;\n\tint y;\n}\n',
+	}
+	for name, content in samples.items():
+		with open(tmp_path / name, 'w', newline='') as f:
+			f.write(content)
+
+	files = [str(tmp_path / name) for name in samples]
+	for folder, _, names in os.walk(os.path.join(os.path.dirname(__file__), '..', 'mergeable')):
+		files.extend(os.path.join(folder, name) for name in names if name.endswith('.java'))
+
+	for fileActual in files:
+		for fileExpected in files:
+			size = compare.diffSize(compare.canonicalLines(compare._readLines(fileActual)), compare.canonicalLines(compare._readLines(fileExpected)))
+			gitSize, _ = compare.diffWithGit(fileActual, fileExpected)
+			assert (size == 0) == (gitSize == 0), f'{fileActual} {fileExpected}'
+
+
+def _diffSizeBothWays(actual, expected, monkeypatch):
+	"""
+	:return: diffSize aligned by difflib, and by git diff
+	"""
+	with monkeypatch.context() as m:
+		m.setattr(compare, 'DIFFLIB_MAX_PAIRS', sys.maxsize)
+		size = compare.diffSize(actual, expected)
+		m.setattr(compare, 'DIFFLIB_MAX_PAIRS', 0)
+		return size, compare.diffSize(actual, expected)
+
+
+def test_diffSize_backendsAgree(monkeypatch):
+	files = []
+	for folder, _, names in os.walk(os.path.join(os.path.dirname(__file__), '..', 'mergeable')):
+		files.extend(os.path.join(folder, name) for name in names if name.endswith('.java'))
+	pairs = [(compare.loadCanonical(fileActual), compare.loadCanonical(fileExpected)) for fileActual in files for fileExpected in files]
+	expected = [f'int x{i}=0;' for i in range(2000)]
+	# Scattered edits, a conflict block, and a moved line, in a file large enough for the git path by default
+	actual = expected[0:300] + ['<<<<<<<', 'int y=0;', '======='] + expected[300:900] + expected[901:1500] + [expected[900]] + \
+		[line + '//' for line in expected[1500:1510]] + expected[1510:]
+	pairs.append((actual, expected))
+	pairs.append((['intx;', '@@-1+1@@', '+++b', '---a'], ['intx;', '++i;', '--j;']))
+
+	for actual, expected in pairs:
+		size, gitSize = _diffSizeBothWays(actual, expected, monkeypatch)
+		assert size == gitSize
+		assert (size == 0) == (actual == expected)
+
+
+def test_diffSize_large(monkeypatch):
+	expected = [f'int x{i}=0;' for i in range(3000)]
+	actual = expected[0:1000] + ['<<<<<<<'] + [line + 'changed' for line in expected[1000:2000]] + expected[2000:]
+	changed = len('<<<<<<<') + sum(len(line) for line in expected[1000:2000]) + sum(len(line + 'changed') for line in expected[1000:2000])
+
+	assert compare.diffSize(actual, expected) == changed
+	# difflib and git diff agree.
+	monkeypatch.setattr(compare, 'DIFFLIB_MAX_PAIRS', 0)
+	assert compare.diffSize(actual, expected) == changed
+
+
+def test_processExampleMatrix(tmp_path):
+	example = dataset.SubjectRepo()
+	example.repoName = 'repo'
+	example.conflictingFile = 'A.java'
+	example._mergedFile = 'A.java'
+
+	files = {
+		'repo/A.java': 'import b;\nimport a;\nclass A {}\n',
+		'result/Same/repo/A.java': 'import a;\nimport b;\n\nclass A { }\n',
+		'result/Different/repo/A.java': 'class B {}\n',
+	}
+	for name, content in files.items():
+		os.makedirs(os.path.dirname(tmp_path / name), exist_ok=True)
+		with open(tmp_path / name, 'w') as f:
+			f.write(content)
+	os.makedirs(tmp_path / 'result' / 'Missing')
+
+	mergers = compare.listMergers(str(tmp_path / 'result'))
+	assert mergers == ['Different', 'Missing', 'Same']
+
+	csvFields = compare.processExampleMatrix(str(tmp_path / 'result'), str(tmp_path), mergers, example)
+	assert csvFields[0:2] == ['repo', 'A.java']
+	assert csvFields[2] > 0
+	assert csvFields[3:] == ['-', 0]
+
+
+def test_normalizeLines():
+	lines = ['//preamble\n', 'import b;\n', '\n', 'import a;\n', 'after\n', 'import c;\n']
+
+	assert list(compare.normalizeLines(lines)) == ['//preamble\n', '\n', 'import a;\n', 'import b;\n', 'after\n', 'import c;\n']
+	assert list(compare.normalizeLines(['import b;\n', 'import a;\n'])) == ['import a;\n', 'import b;\n']
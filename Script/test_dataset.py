@@ -0,0 +1,49 @@
+import pytest
+
+import dataset
+
+
+@pytest.fixture
+def examples(makeExample):
+	return dataset.Dataset([makeExample(repoName, file, mergeCommit)
+							for repoName, mergeCommit, file in [('a', 'aaaa1111', 'A.java'), ('b', 'bbbb2222', 'B.xml'), ('a', 'aaaa3333', 'C.JAVA'), ('b', 'bbbb2222', 'D.java')]])
+
+
+def test_indexes(examples):
+	assert examples.byRepository('a') == [0, 2]
+	assert examples.byExtension('.java') == [0, 2, 3]
+	assert examples.byMergeCommit('bbbb2222') == [1, 3]
+	assert examples.byMergeCommit('aaaa') == [0, 2]
+	assert examples.byRepository('missing') == []
+
+
+def test_select(examples):
+	assert examples.select(range(4), []) == [0, 1, 2, 3]
+	assert examples.select(range(4), ['repo=b', 'ext=java']) == [3]
+	assert examples.select([3, 2, 1, 0], ['id=0,2..4']) == [3, 2, 0]
+	assert examples.select(range(1, 4), ['repo=a,b', 'merge=aaaa']) == [2]
+	with pytest.raises(ValueError):
+		examples.select(range(4), ['name=a'])
+
+
+def test_orderByRepository(examples):
+	assert examples.orderByRepository(range(4)) == [0, 2, 1, 3]
+	assert examples.orderByRepository([3, 0, 1]) == [3, 1, 0]
+
+
+def test_shard(makeExample):
+	examples = dataset.Dataset([makeExample(repoName, f'{i}.java') for i, repoName in enumerate(['a', 'b', 'a', 'c', 'd', 'c', 'a'])])
+	costs = {0: 5, 1: 4, 2: 1, 3: 2, 4: 3, 5: 2, 6: 0}
+
+	shards = [examples.shard(range(7), k, 2, costs) for k in range(2)]
+	assert sorted(shards[0] + shards[1]) == list(range(7))
+	# a costs 6, b 4, c 4, d 3.
+	assert shards == [[0, 2, 4, 6], [1, 3, 5]]
+	assert examples.shard(range(7), 1, 2, costs) == shards[1]
+	assert examples.shard(range(7), 0, 2) == [0, 2, 4, 6]
+	assert examples.shard(range(7), 3, 4, costs) == [4]
+
+
+def test_orderByCost(examples):
+	assert examples.orderByCost(range(4), {0: 1, 1: 2, 2: 3, 3: 4}) == [3, 1, 2, 0]
+	assert examples.orderByCost([0, 1, 2], {0: 5, 1: 4, 2: 0}) == [0, 2, 1]
@@ -0,0 +1,76 @@
+import os
+import subprocess
+
+import dataset
+import gitUtils
+
+
+def _commit(repo, files, message):
+	for name, content in files.items():
+		path = os.path.join(repo, name)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(path, 'w') as f:
+			f.write(content)
+	subprocess.run(['git', 'add', '-A'], cwd=repo, check=True)
+	subprocess.run(['git', '-c', 'user.name=a', '-c', 'user.email=a@b', 'commit', '-q', '-m', message], cwd=repo, check=True)
+	return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def _createRemote(path):
+	os.makedirs(path)
+	subprocess.run(['git', 'init', '-q'], cwd=path, check=True)
+	subprocess.run(['git', 'config', 'uploadpack.allowFilter', 'true'], cwd=path, check=True)
+	subprocess.run(['git', 'config', 'uploadpack.allowAnySHA1InWant', 'true'], cwd=path, check=True)
+
+	example = dataset.SubjectRepo()
+	example.repoUrl = 'file://' + path
+	example.repoName = 'remote'
+	example.conflictingFile = 'src/A.java'
+	example.baseCommit = _commit(path, {'src/A.java': 'base\n', 'big.txt': 'x' * 10000}, 'base')
+	example.leftCommit = _commit(path, {'src/A.java': 'left\n'}, 'left')
+	example.rightCommit = _commit(path, {'src/A.java': 'right\n'}, 'right')
+	example.mergeCommit = _commit(path, {'src/A.java': 'merge\n'}, 'merge')
+	return example
+
+
+def test_preparePartialRepo(tmp_path):
+	example = _createRemote(str(tmp_path / 'remote'))
+	repoPath = str(tmp_path / 'workspace' / 'remote')
+
+	assert gitUtils.preparePartialRepo(repoPath, example.repoUrl, [example]) == 4
+	assert gitUtils.listFetchedCommits(repoPath) == {example.baseCommit, example.leftCommit, example.rightCommit, example.mergeCommit}
+
+	subprocess.run(['git', 'checkout', '-q', '-f', example.mergeCommit], cwd=repoPath, check=True)
+	with open(os.path.join(repoPath, 'src/A.java')) as f:
+		assert f.read() == 'merge\n'
+	assert os.path.exists(os.path.join(repoPath, 'big.txt')) is False
+
+	# Everything is present, so the second call doesn't fetch.
+	assert gitUtils.preparePartialRepo(repoPath, example.repoUrl, [example]) == 0
+
+
+def test_listBlobs(tmp_path):
+	example = _createRemote(str(tmp_path / 'remote'))
+
+	blobs = gitUtils.listBlobs(example.repoUrl[len('file://'):], example.baseCommit, ['src/A.java', 'missing.txt'])
+
+	assert list(blobs.keys()) == ['src/A.java']
+
+
+def test_ObjectReader(tmp_path):
+	example = _createRemote(str(tmp_path / 'remote'))
+
+	with gitUtils.ObjectReader(example.repoUrl[len('file://'):]) as reader:
+		assert reader.read(f'{example.leftCommit}:src/A.java') == b'left\n'
+		assert reader.read(f'{example.leftCommit}:missing.txt') is None
+		assert reader.read(f'{example.leftCommit}:src') is None
+		assert reader.read(f'{example.baseCommit}:src/A.java') == b'base\n'
+
+
+def test_blobSizes(tmp_path):
+	example = _createRemote(str(tmp_path / 'remote'))
+	repoPath = str(tmp_path / 'remote')
+
+	assert gitUtils.blobSizes(repoPath, [f'{example.baseCommit}:big.txt', f'{example.leftCommit}:src/A.java', f'{example.baseCommit}:missing']) == \
+		   {f'{example.baseCommit}:big.txt': 10000, f'{example.leftCommit}:src/A.java': 5}
+	assert gitUtils.blobSizes(str(tmp_path / 'none'), ['HEAD:big.txt']) == {}
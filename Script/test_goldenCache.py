@@ -0,0 +1,23 @@
+import goldenCache
+
+
+def test_getAndPut(tmp_path):
+	cache = goldenCache.GoldenCache(str(tmp_path / 'cache'))
+
+	assert cache.get('merge', 'A.java') is None
+	cache.put('merge', 'A.java', 'hash', ['classA{', '}'])
+	cache.put('merge', 'Empty.java', 'hash2', [])
+
+	assert cache.get('merge', 'A.java') == ('hash', ['classA{', '}'])
+	assert cache.get('merge', 'Empty.java') == ('hash2', [])
+	assert cache.get('merge2', 'A.java') is None
+
+
+def test_readHead(tmp_path):
+	(tmp_path / '.git').mkdir()
+	(tmp_path / '.git' / 'HEAD').write_text('0123abcd\n')
+	assert goldenCache.readHead(str(tmp_path)) == '0123abcd'
+
+	(tmp_path / '.git' / 'HEAD').write_text('ref: refs/heads/master\n')
+	assert goldenCache.readHead(str(tmp_path)) is None
+	assert goldenCache.readHead(str(tmp_path / 'missing')) is None
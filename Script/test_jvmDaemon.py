@@ -0,0 +1,59 @@
+import logging
+import shutil
+import subprocess
+
+import pytest
+
+import jvmDaemon
+import mergeTools
+
+_TOOL = '''
+public class Counter {
+	static int calls = 0;
+
+	public static void main(String[] args) {
+		calls++;
+		System.out.print(calls);
+		System.err.print(args[0]);
+		System.exit(Integer.parseInt(args[0]));
+	}
+}
+'''
+
+
+@pytest.mark.skipif(shutil.which('javac') is None or shutil.which('java') is None, reason='needs a JDK')
+def test_run(tmp_path):
+	(tmp_path / 'Counter.java').write_text(_TOOL)
+	classes = tmp_path / 'classes'
+	subprocess.run(['javac', '-d', str(classes), str(tmp_path / 'Counter.java')], check=True)
+
+	try:
+		first = jvmDaemon.run(shutil.which('java'), [str(classes)], 'Counter', ['3'], str(tmp_path), 60)
+	except jvmDaemon.DaemonUnavailable as e:
+		if "can't intercept System.exit" in str(e):
+			pytest.skip(str(e))
+		raise
+	try:
+		second = jvmDaemon.run(shutil.which('java'), [str(classes)], 'Counter', ['3'], str(tmp_path), 60)
+	finally:
+		jvmDaemon.stopAll()
+
+	assert first == (3, b'1', b'3', False)
+	# Static fields of the tool don't carry over.
+	assert second == first
+
+
+def test_runInJvmDaemon_fallsBack(monkeypatch):
+	monkeypatch.setattr(mergeTools, 'useJvmDaemon', True)
+
+	def timeOut(*args):
+		raise subprocess.TimeoutExpired('Tool', 1)
+
+	monkeypatch.setattr(jvmDaemon, 'run', timeOut)
+	assert mergeTools.runInJvmDaemon('java', [], 'Tool', [], '.', 'java Tool', logging.getLogger('test')) is None
+
+	def unavailable(*args):
+		raise jvmDaemon.DaemonUnavailable('crashed')
+
+	monkeypatch.setattr(jvmDaemon, 'run', unavailable)
+	assert mergeTools.runInJvmDaemon('java', [], 'Tool', [], '.', 'java Tool', logging.getLogger('test')) is None
@@ -0,0 +1,27 @@
+import makeLatex
+import resultStore
+
+
+def test_printLeaderboard_afterResume(tmp_path, capsys, makeExample):
+	path = str(tmp_path / 'results.sqlite')
+	store = resultStore.ResultStore(path)
+	store.startRun('merge', 'v1', [])
+	store.addToolRun(makeExample('r1', 'A.java'), 'Wiggle', 'h', 'success', 2.0, [{'maxRss': 2048, 'exitStatus': 0, 'timedOut': False}])
+	store.addToolRun(makeExample('r1', 'B.java'), 'Wiggle', 'h', 'success', 4.0, [{'maxRss': 1024, 'exitStatus': 0, 'timedOut': False}])
+	store.close()
+	store = resultStore.ResultStore(path)
+	# --resume ran B.java again, and skipped A.java.
+	store.startRun('merge', None, [])
+	store.addToolRun(makeExample('r1', 'B.java'), 'Wiggle', 'h', 'success', 6.0, [{'maxRss': 1024, 'exitStatus': 0, 'timedOut': False}])
+	store.close()
+	store = resultStore.ResultStore(path)
+	store.startRun('compare', None, [])
+	store.addComparison(makeExample('r1', 'A.java'), 'Wiggle', 0)
+	store.addComparison(makeExample('r1', 'B.java'), 'Wiggle', 5)
+	store.close()
+
+	store = resultStore.ResultStore(path)
+	makeLatex.printLeaderboard(store, makeLatex.getCompareRun(store))
+	makeLatex.printLeaderboard(store, makeLatex.getCompareRun(store), makeLatex.getMergeRuns(store, 'v1'))
+	store.close()
+	assert capsys.readouterr().out.splitlines() == [r'\ShowTool{Wiggle}{2}{1}{1}{4.0}{2}', r'\ShowTool{Wiggle}{2}{1}{1}{3.0}{2}']
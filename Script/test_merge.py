@@ -0,0 +1,33 @@
+import os
+import subprocess
+
+import goldenCache
+import merge
+import workspaceManager
+from test_gitUtils import _commit
+
+
+def test_groupByRepository(makeExample):
+	examples = [makeExample('a'), makeExample('b'), makeExample('a'), makeExample('c'), makeExample('b')]
+
+	groups = merge.groupByRepository(examples, range(1, 5))
+
+	assert groups == [[1, 4], [2], [3]]
+
+
+def test_compareNeedsClone(tmp_path, makeExample):
+	workspaceFolder = str(tmp_path / 'workspace')
+	repoPath = os.path.join(workspaceFolder, 'r1')
+	os.makedirs(repoPath)
+	subprocess.run(['git', 'init', '-q'], cwd=repoPath, check=True)
+	example = makeExample('r1')
+	example.conflictingFile = 'A.java'
+	example.baseCommit = _commit(repoPath, {'A.java': 'base'}, 'base')
+	example.mergeCommit = _commit(repoPath, {'A.java': 'merged'}, 'merge')
+	cacheFolder = str(tmp_path / 'golden-cache')
+	manager = workspaceManager.WorkspaceManager(workspaceFolder, keepClone=lambda name: merge.compareNeedsClone(cacheFolder, workspaceFolder, {'r1': [example]}, name))
+
+	# compare.py hasn't cached the expected file yet.
+	assert manager.enforceBudget(0) == []
+	goldenCache.GoldenCache(cacheFolder).put(example.mergeCommit, 'A.java', 'hash', ['merged'])
+	assert manager.enforceBudget(0) == ['r1']
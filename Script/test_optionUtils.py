@@ -0,0 +1,24 @@
+import sys
+
+import pytest
+
+import optionUtils
+
+
+def test_getPositiveInt(monkeypatch):
+	monkeypatch.setattr(sys, 'argv', ['merge.py', '--jobs', '3', '--prefetch-jobs'])
+
+	assert optionUtils.getPositiveInt('--jobs', 1) == 3
+	assert optionUtils.getPositiveInt('--tool-cpu-limit') is None
+	with pytest.raises(SystemExit):
+		optionUtils.getPositiveInt('--prefetch-jobs')
+
+
+def test_getSize(monkeypatch, capsys):
+	monkeypatch.setattr(sys, 'argv', ['merge.py', '--workspace-budget', '2k', '--budget', '-'])
+
+	assert optionUtils.getSize('--workspace-budget') == 2048
+	assert optionUtils.getSize('--snapshot-cache-size', 1024) == 1024
+	with pytest.raises(SystemExit):
+		optionUtils.getSize('--budget', example='10G')
+	assert 'Option --budget must be a size, like 10G.' in capsys.readouterr().err
@@ -0,0 +1,53 @@
+import json
+import urllib.request
+
+import ProcessUtils
+import progressMonitor
+
+
+def test_snapshot(tmp_path, makeExample):
+	progress = progressMonitor.WorkerProgress(str(tmp_path))
+	progress.startExample(0, makeExample('r1'))
+	progress.startTool('Wiggle')
+	progress.finishTool('Wiggle', 'success')
+	progress.startTool('KDiff3')
+	progress.finishTool('KDiff3', 'timeout')
+	progress.finishExample()
+	progress.startExample(1, makeExample('r2'))
+	progress.startTool('Wiggle')
+	progress.setLiveProcesses(1)
+	# Another process
+	(tmp_path / '1.json').write_text(json.dumps({'done': 2, 'example': None, 'tool': None, 'toolStarted': None, 'liveProcesses': 0,
+												 'tools': {'Wiggle': {'success': 1, 'failure': 1, 'no-output': 0, 'timeout': 0}}}))
+
+	snapshot = progressMonitor.ProgressMonitor(str(tmp_path), 10).snapshot()
+	assert (snapshot['done'], snapshot['remaining'], snapshot['liveProcesses']) == (3, 7, 1)
+	assert snapshot['tools']['Wiggle'] == {'success': 2, 'failure': 1, 'no-output': 0, 'timeout': 0}
+	assert snapshot['tools']['KDiff3']['timeout'] == 1
+	assert [(current['index'], current['repo'], current['tool']) for current in snapshot['current']] == [(1, 'r2', 'Wiggle')]
+
+
+def test_endpoint(tmp_path):
+	folder = tmp_path / 'progress'
+	folder.mkdir()
+	progress = progressMonitor.WorkerProgress(str(folder))
+	progress.finishExample()
+	monitor = progressMonitor.ProgressMonitor(str(folder), 4, str(tmp_path / 'status.json'), 0)
+	monitor.start()
+	try:
+		with urllib.request.urlopen(f'http://127.0.0.1:{monitor.port}/') as response:
+			assert json.load(response)['remaining'] == 3
+	finally:
+		monitor.stop()
+	assert json.loads((tmp_path / 'status.json').read_text())['done'] == 1
+	assert folder.exists() is False
+
+
+def test_processListener():
+	counts = []
+	ProcessUtils.processListener = counts.append
+	try:
+		ProcessUtils.run(['true'], 10)
+	finally:
+		ProcessUtils.processListener = None
+	assert counts == [1, 0]
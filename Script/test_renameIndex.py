@@ -0,0 +1,36 @@
+import os
+import subprocess
+
+import dataset
+import renameIndex
+from test_gitUtils import _commit
+
+
+def test_buildIndex(tmp_path):
+	repoPath = str(tmp_path / 'workspace' / 'repo')
+	os.makedirs(repoPath)
+	subprocess.run(['git', 'init', '-q'], cwd=repoPath, check=True)
+	base = _commit(repoPath, {'src/A.java': 'class A {\n' + 'int x;\n' * 20 + '}\n', 'src/C.java': 'class C {}\n'}, 'base')
+	subprocess.run(['git', 'mv', 'src/A.java', 'src/B.java'], cwd=repoPath, check=True)
+	merge = _commit(repoPath, {'src/C.java': 'class C { }\n'}, 'merge')
+
+	examples = []
+	for file in ('src/A.java', 'src/C.java'):
+		example = dataset.SubjectRepo()
+		example.repoName = 'repo'
+		example.baseCommit = base
+		example.mergeCommit = merge
+		example.conflictingFile = file
+		examples.append(example)
+
+	index = renameIndex.buildIndex(examples, str(tmp_path / 'workspace'), 2)
+	assert index == {(base, merge, 'src/A.java'): 'src/B.java', (base, merge, 'src/C.java'): 'src/C.java'}
+	for example in examples:
+		assert index[(base, merge, example.conflictingFile)] == dataset._findRenamedFile(example.conflictingFile, base, merge, repoPath)
+
+	indexPath = renameIndex.sidecarPath(str(tmp_path / 'total_list.txt'))
+	assert indexPath == str(tmp_path / 'total_list.renames.tsv')
+	renameIndex.save(indexPath, index)
+	renameIndex.apply(examples, renameIndex.load(indexPath))
+	# Served from the index, so the repository is not needed.
+	assert examples[0].getMergedFile(str(tmp_path / 'missing')) == 'src/B.java'
@@ -0,0 +1,57 @@
+import pickle
+
+import resultStore
+
+
+def test_addToolRun(tmp_path, makeExample):
+	store = resultStore.ResultStore(str(tmp_path / 'results.sqlite'), batchSize=10)
+	store.startRun('merge', 'v1', ['--merger', 'wiggle'])
+	usage = [{'userTime': 1.0, 'systemTime': 0.5, 'maxRss': 100, 'exitStatus': 0, 'timedOut': False},
+			 {'userTime': 2.0, 'systemTime': None, 'maxRss': 300, 'exitStatus': 1, 'timedOut': False}]
+	store.addToolRun(makeExample('r1', 'A.java'), 'wiggle', 'hash', 'done', 3.5, usage)
+	store.addToolRun(makeExample('r1', 'B.txt'), 'wiggle', 'hash', 'fail', 1.0)
+
+	assert store.query('SELECT outcome, duration, userTime, systemTime, maxRss, exitStatus, timedOut FROM toolRuns ORDER BY outcome') == \
+		   [('done', 3.5, 3.0, 0.5, 300, 1, 0), ('fail', 1.0, None, None, None, None, 0)]
+	store.close()
+
+
+def test_addComparison(tmp_path, makeExample):
+	path = str(tmp_path / 'results.sqlite')
+	store = resultStore.ResultStore(path, batchSize=2)
+	runId = store.startRun('compare', 'v1')
+	store.addComparison(makeExample('r1', 'A.java'), 'wiggle', 0)
+	store.addComparison(makeExample('r1', 'A.java'), 'summer', None)
+	# A batch is written to the database.
+	assert resultStore.ResultStore(path).query('SELECT count(*) FROM comparisons') == [(2,)]
+
+	# A worker process writes to the same run with its own connection.
+	worker = pickle.loads(pickle.dumps(store))
+	worker.addComparison(makeExample('r1', 'B.txt'), 'wiggle', 3)
+	worker.close()
+	store.close()
+
+	store = resultStore.ResultStore(path)
+	assert store.query('SELECT count(*) FROM examples') == [(2,)]
+	assert store.query('SELECT e.conflictingFile, c.tool, c.diffSize FROM comparisons c JOIN examples e ON e.id = c.exampleId '
+					   'WHERE c.runId = ? ORDER BY e.conflictingFile, c.tool', (runId,)) == \
+		   [('A.java', 'summer', None), ('A.java', 'wiggle', 0), ('B.txt', 'wiggle', 3)]
+	store.close()
+
+
+def test_importStore(tmp_path, makeExample):
+	for shard, file in [('shard1', 'A.java'), ('shard2', 'B.java')]:
+		store = resultStore.ResultStore(str(tmp_path / shard / 'results.sqlite'))
+		store.startRun('merge', shard)
+		store.addToolRun(makeExample('r1', file), 'wiggle', 'hash', 'done', 1.0)
+		store.addToolRun(makeExample('r1', 'C.java'), 'wiggle', 'hash', 'done', 2.0)
+		store.close()
+
+	store = resultStore.ResultStore(str(tmp_path / 'results.sqlite'))
+	store.importStore(str(tmp_path / 'shard1' / 'results.sqlite'))
+	store.importStore(str(tmp_path / 'shard2' / 'results.sqlite'))
+	assert store.query('SELECT r.label, e.conflictingFile FROM toolRuns t JOIN runs r ON r.id = t.runId JOIN examples e ON e.id = t.exampleId '
+					   'ORDER BY r.label, e.conflictingFile') == \
+		   [('shard1', 'A.java'), ('shard1', 'C.java'), ('shard2', 'B.java'), ('shard2', 'C.java')]
+	assert store.query('SELECT count(*) FROM examples') == [(3,)]
+	store.close()
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+import dataset
+import runManifest
+
+
+def test_journal(tmp_path):
+	output = tmp_path / 'result' / 'A.java'
+	output.parent.mkdir()
+	output.write_text('merged')
+	journalPath = str(tmp_path / 'journal.jsonl')
+
+	journal = runManifest.RunJournal(journalPath)
+	journal.append({'example': 'e1', 'tool': 'T', 'toolHash': 'h', 'outcome': 'success', 'duration': 1,
+					'outputs': {'A.java': runManifest.hashFile(output)}})
+	journal.append({'example': 'e3', 'tool': 'T', 'toolHash': 'h', 'outcome': 'timeout', 'duration': 180, 'outputs': {}})
+	journal.close()
+	# Simulate a crash in the middle of writing a record.
+	with open(journalPath, 'a') as f:
+		f.write('{"example": "e2", "tool": "T"')
+
+	journal = runManifest.RunJournal(journalPath)
+	assert journal.latest('T', 'e2') is None
+	assert journal.isUpToDate('T', 'e1', 'h', str(tmp_path / 'result'))
+	assert journal.isUpToDate('T', 'e1', 'new tool', str(tmp_path / 'result')) is False
+	assert journal.isUpToDate('T', 'e3', 'h', str(tmp_path / 'result')) is False
+
+	output.write_text('changed')
+	assert journal.isUpToDate('T', 'e1', 'h', str(tmp_path / 'result')) is False
+	# The first record after the crash is read back.
+	journal.append({'example': 'e4', 'tool': 'T', 'toolHash': 'h', 'outcome': 'success', 'duration': 1, 'outputs': {}})
+	journal.close()
+	assert runManifest.readLatest(journalPath)[('T', 'e4')]['outcome'] == 'success'
+
+
+def test_changedOutputs(tmp_path):
+	(tmp_path / 'old.java').write_text('old')
+	(tmp_path / 'A-normalized.java').write_text('normalized')
+	before = runManifest.statOutputs(tmp_path)
+	(tmp_path / 'new.java').write_text('new')
+
+	assert runManifest.changedOutputs(tmp_path, before) == ['new.java']
+
+
+def test_estimateCosts(tmp_path):
+	examples = {}
+	for i, repoName in enumerate(['a', 'a', 'a', 'b', 'c']):
+		example = dataset.SubjectRepo()
+		example.repoUrl = repoName
+		example.repoName = repoName
+		example.mergeCommit = example.leftCommit = example.rightCommit = example.baseCommit = str(i)
+		example.conflictingFile = 'A.java'
+		examples[i] = example
+	journalPath = tmp_path / 'journal.jsonl'
+	journalPath.write_text(''.join(json.dumps({'tool': tool, 'example': runManifest.exampleKey(examples[i]), 'duration': duration}) + '\n'
+								   for tool, i, duration in [('T', 0, 2), ('U', 0, 8), ('T', 1, 4), ('T', 3, 30)]))
+
+	durations = runManifest.loadDurations(str(journalPath), ['T'])
+	assert runManifest.estimateCosts(examples, durations) == {0: 2, 1: 4, 2: 4, 3: 30, 4: 4}
+	# a takes 0.01 second per byte, and all known examples 0.04.
+	costs = runManifest.estimateCosts(examples, durations, {0: 200, 1: 400, 2: 1000, 3: 300, 4: 50})
+	assert costs[2] == pytest.approx(10)
+	assert costs[4] == pytest.approx(36 / 900 * 50)
@@ -0,0 +1,40 @@
+import json
+
+import shardMerge
+
+
+def test_checkCoverage(tmp_path):
+	journals = []
+	for k, examples in enumerate([['e1', 'e2'], ['e2', 'e4']]):
+		path = tmp_path / f'journal{k}.jsonl'
+		path.write_text(''.join(json.dumps({'tool': 'T', 'example': e, 'duration': 1}) + '\n' for e in examples))
+		journals.append(str(path))
+
+	missing, duplicated = shardMerge.checkCoverage(['e1', 'e2', 'e3'], journals)
+	assert missing == [('T', 'e3')]
+	assert duplicated == [('T', 'e2')]
+
+
+def test_mergeCsv(tmp_path, makeExample):
+	(tmp_path / '1.csv').write_text('repo,conflicting file,diff size\nb,B.java,3\n')
+	(tmp_path / '2.csv').write_text('repo,conflicting file,diff size\na,A.java,0\nb,B.java,1\n')
+	examples = [makeExample('a', 'A.java'), makeExample('b', 'B.java'), makeExample('c', 'C.java')]
+
+	missing, duplicated = shardMerge.mergeCsv([str(tmp_path / '1.csv'), str(tmp_path / '2.csv')], str(tmp_path / 'all.csv'), examples)
+	assert missing == [('c', 'C.java')]
+	assert duplicated == [('b', 'B.java')]
+	assert (tmp_path / 'all.csv').read_text().splitlines() == ['repo,conflicting file,diff size', 'a,A.java,0', 'b,B.java,3', 'b,B.java,1']
+
+
+def test_mergeShards(tmp_path):
+	for shard, content in [('s1', 'one'), ('s2', 'two')]:
+		(tmp_path / shard / 'Wiggle' / shard).mkdir(parents=True)
+		(tmp_path / shard / 'Wiggle' / shard / 'A.java').write_text(content)
+		(tmp_path / shard / 'Wiggle' / 'shared.txt').write_text(content)
+		(tmp_path / shard / 'journal.jsonl').write_text(json.dumps({'tool': 'Wiggle', 'example': shard, 'duration': 1}) + '\n')
+
+	output = tmp_path / 'all'
+	conflicts = shardMerge.mergeShards([str(tmp_path / 's1'), str(tmp_path / 's2')], str(output))
+	assert conflicts == ['Wiggle/shared.txt']
+	assert (output / 'Wiggle' / 's2' / 'A.java').read_text() == 'two'
+	assert len((output / 'journal.jsonl').read_text().splitlines()) == 2
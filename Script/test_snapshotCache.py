@@ -0,0 +1,49 @@
+import time
+
+import snapshotCache
+
+
+def test_parseSize():
+	assert snapshotCache.parseSize('100') == 100
+	assert snapshotCache.parseSize('2k') == 2048
+	assert snapshotCache.parseSize('1.5G') == int(1.5 * 1024 ** 3)
+
+
+def test_getAndPut(tmp_path):
+	source = tmp_path / 'A.java'
+	source.write_text('class A {}')
+	cache = snapshotCache.SnapshotCache(str(tmp_path / 'cache'), 1024)
+
+	assert cache.get('url', 'sha', 'A.java') is None
+	cache.put('url', 'sha', 'A.java', str(source))
+	cache.put('url', 'sha2', 'A.java', None)
+
+	cachedFile = cache.get('url', 'sha', 'A.java')
+	with open(cachedFile) as f:
+		assert f.read() == 'class A {}'
+	assert cache.get('url', 'sha2', 'A.java') is snapshotCache.ABSENT
+
+	target = tmp_path / 'workspace' / 'A.java'
+	cache.materialize(cachedFile, str(target))
+	assert target.read_text() == 'class A {}'
+	# Writing to the input doesn't change the cache.
+	target.write_text('changed')
+	with open(cachedFile) as f:
+		assert f.read() == 'class A {}'
+
+
+def test_evict(tmp_path):
+	source = tmp_path / 'A.java'
+	source.write_bytes(b'x' * 400)
+	cache = snapshotCache.SnapshotCache(str(tmp_path / 'cache'), 1000)
+
+	cache.put('url', 'sha1', 'A.java', str(source))
+	cache.put('url', 'sha2', 'A.java', str(source))
+	# Make sha1 the most recently used entry.
+	time.sleep(0.01)
+	cache.get('url', 'sha1', 'A.java')
+	cache.put('url', 'sha3', 'A.java', str(source))
+
+	assert cache.get('url', 'sha1', 'A.java') is not None
+	assert cache.get('url', 'sha2', 'A.java') is None
+	assert cache.get('url', 'sha3', 'A.java') is not None
@@ -0,0 +1,48 @@
+import random
+import subprocess
+
+import compare
+import optionUtils
+import syntheticDataset
+
+
+def _show(repoPath, revision):
+	return subprocess.run(['git', 'show', revision], cwd=repoPath, capture_output=True, text=True, check=True).stdout
+
+
+def test_createDataset(tmp_path):
+	totalListPath = syntheticDataset.createDataset(str(tmp_path / 'a'), 3, examplesPerRepo=2)
+	examples = optionUtils.readTotalList(totalListPath)
+	assert [e.repoName for e in examples] == ['bench0', 'bench0', 'bench1']
+
+	example = examples[1]
+	repoPath = str(tmp_path / 'a' / 'repos' / 'bench0')
+	parents = subprocess.run(['git', 'rev-list', '--parents', '-n', '1', example.mergeCommit], cwd=repoPath, capture_output=True, text=True).stdout.split()
+	assert parents[1:] == [example.leftCommit, example.rightCommit]
+	merged = _show(repoPath, f'{example.mergeCommit}:{example.conflictingFile}')
+	assert 'value << 1' in merged and 'value >> 1' in merged
+	assert 'value << 1' not in _show(repoPath, f'{example.baseCommit}:{example.conflictingFile}')
+
+	# Commit ids only depend on the parameters.
+	syntheticDataset.createDataset(str(tmp_path / 'b'), 3, examplesPerRepo=2)
+	assert [e.mergeCommit for e in optionUtils.readTotalList(str(tmp_path / 'b' / 'total_list.txt'))] == [e.mergeCommit for e in examples]
+
+
+def test_scenario():
+	profile = syntheticDataset.Profile(fileLines=120, hunks=3, renameRatio=1, importShuffleRatio=1)
+	conflictingFile, mergedFile, base, left, right, merged = syntheticDataset.scenario(random.Random(1), 7, profile)
+	assert mergedFile == 'src/main/java/bench/moved/Example7.java'
+	assert len(base) > 100
+	assert sum(1 for a, b in zip(left, right) if a != b) == 3 + 2
+	imports = [line for line in merged if line.startswith('import ')]
+	assert imports != sorted(imports)
+	assert [line for line in compare.normalizeLines(merged) if line.startswith('import ')] == [line for line in left if line.startswith('import ')]
+
+	conflictingFile, mergedFile, base, left, right, merged = syntheticDataset.scenario(random.Random(1), 7, syntheticDataset.Profile(javaRatio=0))
+	assert conflictingFile == mergedFile == 'src/main/resources/example7.properties'
+
+
+def test_findRenamedFile(tmp_path):
+	totalListPath = syntheticDataset.createDataset(str(tmp_path), 2, profile=syntheticDataset.Profile(renameRatio=1))
+	for example in optionUtils.readTotalList(totalListPath):
+		assert example.getMergedFile(str(tmp_path / 'repos')) == example.conflictingFile.replace('/bench/', '/bench/moved/')
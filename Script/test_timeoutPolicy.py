@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+import timeoutPolicy
+
+
+def test_timeout():
+	history = {'Wiggle': [(0.1 * (i % 5 + 1), 1000 * (i % 5 + 1)) for i in range(20)], 'IntelliMerge': [(5, None)] * 19}
+	policy = timeoutPolicy.TimeoutPolicy(history, 180)
+
+	# Wiggle takes 0.3 s in median and 0.1 ms per byte.
+	assert policy.timeout('Wiggle', 1000)[0] == timeoutPolicy.MIN_SECONDS
+	assert policy.timeout('Wiggle', 200000)[0] == pytest.approx(60)
+	assert policy.timeout('Wiggle', 10 ** 7)[0] == 180
+	assert policy.timeout('Wiggle')[0] == timeoutPolicy.MIN_SECONDS
+	# Too few runs
+	seconds, reason = policy.timeout('IntelliMerge', 1000)
+	assert seconds == 180 and 'fewer than' in reason
+	assert policy.timeout('KDiff3', 1000)[0] == 180
+
+
+def test_fromJournal(tmp_path):
+	journalPath = tmp_path / 'journal.jsonl'
+	records = [{'tool': 'Wiggle', 'example': str(i), 'outcome': 'success', 'duration': 20, 'inputBytes': 100} for i in range(20)]
+	records.append({'tool': 'Wiggle', 'example': 'hung', 'outcome': 'failure', 'duration': 180, 'inputBytes': 100})
+	journalPath.write_text(''.join(json.dumps(record) + '\n' for record in records))
+
+	policy = timeoutPolicy.TimeoutPolicy.fromJournal(str(journalPath), 180)
+	assert policy.timeout('Wiggle', 100)[0] == 60
+	assert policy.timeout('Wiggle', 300)[0] == 180
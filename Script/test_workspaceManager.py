@@ -0,0 +1,105 @@
+import os
+import subprocess
+
+import pytest
+
+import workspaceManager
+from test_gitUtils import _commit
+
+
+def _clone(root, name, size):
+	path = os.path.join(root, name)
+	os.makedirs(path)
+	subprocess.run(['git', 'init', '-q'], cwd=path, check=True)
+	_commit(path, {'big.txt': 'x' * size}, 'init')
+	return path
+
+
+def test_releaseInputs(tmp_path):
+	root = str(tmp_path)
+	repoPath = _clone(root, 'r1', 10)
+	worktree = os.path.join(root, 'r1-base')
+	subprocess.run(['git', 'worktree', 'add', '-q', '--detach', worktree], cwd=repoPath, check=True)
+	os.makedirs(os.path.join(root, 'r1-left'))
+
+	manager = workspaceManager.WorkspaceManager(root)
+	manager.releaseInputs('r1')
+
+	assert not os.path.exists(worktree)
+	assert not os.path.exists(os.path.join(root, 'r1-left'))
+	worktrees = subprocess.run(['git', 'worktree', 'list', '--porcelain'], cwd=repoPath, capture_output=True, text=True).stdout
+	assert 'r1-base' not in worktrees
+
+
+def test_enforceBudget(tmp_path):
+	root = str(tmp_path)
+	for name in ('r1', 'r2', 'r3'):
+		_clone(root, name, 100000)
+	manager = workspaceManager.WorkspaceManager(root)
+	manager.useRepo('r1')
+	manager.useRepo('r2')
+	os.utime(manager._marker('r1'), (1, 1))
+	manager.useRepo('r3')
+	budget = workspaceManager.diskUsage(os.path.join(root, 'r3')) + 1000
+
+	# r2 is in use by another process.
+	other = workspaceManager.WorkspaceManager(root)
+	other.useRepo('r2')
+	# r3 is in use by this process.
+	assert manager.enforceBudget(budget, dryRun=True) == ['r1']
+	assert manager.enforceBudget(budget) == ['r1']
+	assert manager.listClones() == ['r2', 'r3']
+
+	other.release()
+	assert manager.enforceBudget(budget) == ['r2']
+	manager.release()
+
+
+def test_enforceBudget_keepClone(tmp_path):
+	root = str(tmp_path)
+	for name in ('r1', 'r2'):
+		_clone(root, name, 100000)
+	manager = workspaceManager.WorkspaceManager(root, keepClone=lambda name: name == 'r1')
+
+	assert manager.enforceBudget(0) == ['r2']
+	assert manager.listClones() == ['r1']
+
+
+@pytest.mark.skipif(workspaceManager.fcntl is None, reason='flock is POSIX only')
+def test_lockUnused(tmp_path):
+	root = str(tmp_path)
+	_clone(root, 'r1', 10)
+	manager = workspaceManager.WorkspaceManager(root)
+	other = workspaceManager.WorkspaceManager(root)
+
+	with manager._lockUnused('r1') as locked:
+		assert locked
+		# Another process can't start using the clone while it's locked.
+		fd = os.open(other._marker('r1'), os.O_RDWR)
+		with pytest.raises(OSError):
+			workspaceManager.fcntl.flock(fd, workspaceManager.fcntl.LOCK_SH | workspaceManager.fcntl.LOCK_NB)
+		os.close(fd)
+
+	other.useRepo('r1')
+	with manager._lockUnused('r1') as locked:
+		assert not locked
+	other.release()
+
+
+def test_scratch(tmp_path):
+	root = str(tmp_path / 'workspace')
+	_clone(root, 'r1', 10)
+	manager = workspaceManager.WorkspaceManager(root, scratch=str(tmp_path / 'scratch'))
+	manager.useRepo('r1')
+	assert manager.inputFolders('r1')[0] == os.path.join(str(tmp_path / 'scratch'), str(os.getpid()), 'r1-base')
+
+	staged = os.path.join(manager.outputRoot(), 'Wiggle', 'r1', 'A.java')
+	os.makedirs(os.path.dirname(staged))
+	open(staged, 'w').close()
+	workspaceManager.copyOutputs(os.path.dirname(staged), os.path.join(root, 'result', 'Wiggle', 'r1'), ['A.java'])
+	manager.releaseInputs('r1')
+
+	assert os.path.isfile(os.path.join(root, 'result', 'Wiggle', 'r1', 'A.java'))
+	assert not os.path.exists(staged)
+	manager.release()
+	assert os.listdir(str(tmp_path / 'scratch')) == []
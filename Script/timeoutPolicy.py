@@ -0,0 +1,77 @@
+"""
+Set the timeout of each tool run from the durations of the tool in the journal and the size of the inputs,
+instead of the same fixed timeout for every tool and file.
+"""
+import runManifest
+
+# A tool with fewer successful runs in the journal gets the upper bound.
+MIN_SAMPLES = 20
+# The timeout is this many times the predicted duration.
+FACTOR = 3
+# Quantile of the durations, and of the seconds per input byte, that predicts the duration of a run.
+QUANTILE = 0.99
+# No timeout is shorter, so that a loaded machine doesn't turn slow runs into timeouts.
+MIN_SECONDS = 10
+
+
+def _quantile(values, q):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class TimeoutPolicy:
+	"""
+	The timeout of a run is FACTOR times the larger of the median duration of the tool, which covers its startup,
+	and the QUANTILE of its seconds per input byte times the input bytes of the run. It's within [MIN_SECONDS, upperBound].
+
+	The policy doesn't learn from the runs it times, so the same journal gives the same timeouts.
+	"""
+
+	def __init__(self, history, upperBound):
+		"""
+		:param history: a dict from tool to a list of (seconds, input bytes) of its successful runs. Bytes may be None.
+		:param upperBound: the fixed timeout that was used before, in seconds
+		"""
+		self.upperBound = upperBound
+		self._models = {}
+		for tool, runs in history.items():
+			if len(runs) < MIN_SAMPLES:
+				continue
+			rates = [seconds / size for seconds, size in runs if size]
+			self._models[tool] = (_quantile([seconds for seconds, _ in runs], 0.5),
+								  _quantile(rates, QUANTILE) if len(rates) > 0 else None,
+								  _quantile([seconds for seconds, _ in runs], QUANTILE))
+
+	@staticmethod
+	def fromJournal(journalPath, upperBound):
+		history = {}
+		for (tool, _), record in runManifest.readLatest(journalPath).items():
+			if record.get('outcome') == 'success':
+				history.setdefault(tool, []).append((record['duration'], record.get('inputBytes')))
+		return TimeoutPolicy(history, upperBound)
+
+	def describe(self, tool):
+		model = self._models.get(tool)
+		if model is None:
+			return f'{tool} has fewer than {MIN_SAMPLES} successful runs in the journal.'
+		median, rate, high = model
+		return f'{tool} takes {median:.2f} s in median, ' + \
+			(f'{rate * 1000:.4f} s per KB at quantile {QUANTILE}.' if rate is not None else f'{high:.2f} s at quantile {QUANTILE}.')
+
+	def timeout(self, tool, inputBytes=None):
+		"""
+		:param inputBytes: total size of the input files of the run, or None if unknown
+		:return: (seconds, the reason, for the log)
+		"""
+		model = self._models.get(tool)
+		if model is None:
+			return self.upperBound, f'the upper bound, because {tool} has fewer than {MIN_SAMPLES} successful runs in the journal'
+		median, rate, high = model
+		if rate is not None and inputBytes is not None:
+			predicted = rate * inputBytes
+			reason = f'{FACTOR} x max(median {median:.2f} s, {rate * 1000:.4f} s/KB x {inputBytes / 1000:.1f} KB)'
+		else:
+			predicted = high
+			reason = f'{FACTOR} x max(median {median:.2f} s, quantile {QUANTILE} {high:.2f} s)'
+		seconds = min(self.upperBound, max(MIN_SECONDS, FACTOR * max(median, predicted)))
+		return seconds, reason + f', within [{MIN_SECONDS}, {self.upperBound}] s'
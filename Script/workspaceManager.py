@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Own the folders in Resource/workspace: clones of the repositories, the base/left/right/child input folders of examples,
+and the temporary folders that tools leave behind.
+"""
+import contextlib
+import logging
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import time
+
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+
+import optionUtils
+
+# Suffixes of the input folders of an example, next to the clone or in scratch
+INPUT_SUFFIXES = ('-base', '-left', '-right', '-child')
+# Folder of one marker file per clone, touched whenever the clone is used. Its mtime is the last access time of the clone.
+MARKER_FOLDER = '.clones'
+# Without fcntl, a clone used within this many seconds is considered in use by another process.
+IN_USE_SECONDS = 60 * 60
+
+logger = logging.getLogger('workspaceManager')
+
+
+def diskUsage(path) -> int:
+	"""
+	:return: bytes that the files in path occupy on disk. Hard links to the same file are counted once.
+	"""
+	total = 0
+	seen = set()
+	for folder, _, files in os.walk(path):
+		for name in files:
+			try:
+				st = os.lstat(os.path.join(folder, name))
+			except OSError:
+				continue
+			if st.st_nlink > 1:
+				if (st.st_dev, st.st_ino) in seen:
+					continue
+				seen.add((st.st_dev, st.st_ino))
+			# st_blocks is missing on Windows.
+			total += st.st_blocks * 512 if hasattr(st, 'st_blocks') else st.st_size
+	return total
+
+
+def removeTree(path):
+	"""
+	Same as shutil.rmtree, but read-only files, e.g. git objects on Windows, are removed as well.
+	"""
+
+	def onError(func, failedPath, _):
+		os.chmod(failedPath, stat.S_IWRITE)
+		func(failedPath)
+
+	if os.path.lexists(path):
+		shutil.rmtree(path, onerror=onError)
+
+
+def copyOutputs(source, target, files):
+	"""
+	Copy files, relative to source, to target.
+	"""
+	for file in files:
+		targetFile = os.path.join(target, file)
+		os.makedirs(os.path.dirname(targetFile), exist_ok=True)
+		shutil.copyfile(os.path.join(source, file), targetFile)
+
+
+def isClone(path):
+	return os.path.isdir(os.path.join(path, '.git'))
+
+
+class WorkspaceManager:
+	"""
+	Input folders of an example are removed once its results are recorded, and the worktrees are pruned.
+	If maxBytes is set and the clones take more, the least recently used clones are evicted.
+	A clone in use by any process, which holds a shared lock on it, is never evicted.
+	"""
+
+	def __init__(self, root, maxBytes=None, keepInputs=False, scratch=None, keepClone=None):
+		"""
+		:param maxBytes: disk budget of the clones, or None for unlimited
+		:param keepInputs: don't remove input folders, e.g. to inspect them with folderTool.py
+		:param scratch: a folder, preferably on tmpfs, for the input folders and tool outputs of examples. None to use root.
+		:param keepClone: called with a repository name before its clone is evicted. If it returns True, the clone is kept.
+		It must be picklable for merge.py --jobs.
+		"""
+		self.root = root
+		self.maxBytes = maxBytes
+		self.keepInputs = keepInputs
+		self.scratch = scratch
+		self.keepClone = keepClone
+		self._sizes = {}
+		self._current = None
+		self._lockFd = None
+
+	def clonePath(self, repoName):
+		return os.path.join(self.root, repoName)
+
+	def inputRoot(self):
+		"""
+		:return: the folder of the input folders. Every process has its own folder in scratch.
+		"""
+		if self.scratch is None:
+			return self.root
+		return os.path.join(self.scratch, str(os.getpid()))
+
+	def outputRoot(self):
+		"""
+		:return: the folder where tools write outputs before they are copied to the result folder, or None if tools write to the result folder.
+		"""
+		if self.scratch is None:
+			return None
+		folder = os.path.join(self.inputRoot(), 'result')
+		os.makedirs(folder, exist_ok=True)
+		return folder
+
+	def inputFolders(self, repoName):
+		return [os.path.join(self.inputRoot(), repoName + suffix) for suffix in INPUT_SUFFIXES]
+
+	def listClones(self):
+		"""
+		:return: names of the clones
+		"""
+		return sorted(entry.name for entry in os.scandir(self.root) if entry.is_dir() and isClone(entry.path))
+
+	def _marker(self, repoName):
+		return os.path.join(self.root, MARKER_FOLDER, repoName)
+
+	def lastUsed(self, repoName):
+		try:
+			return os.path.getmtime(self._marker(repoName))
+		except OSError:
+			# Clones made before the manager have no marker. Their .git folder is the best guess.
+			return os.path.getmtime(os.path.join(self.clonePath(repoName), '.git'))
+
+	def useRepo(self, repoName):
+		"""
+		Mark the clone of repoName as used by this process, until another repository is used or release is called.
+		When this process moves on to another repository, the disk budget is enforced.
+		"""
+		if repoName == self._current:
+			return
+		previous = self._current
+		self.release()
+		if previous is not None and isClone(self.clonePath(previous)):
+			# A clone grows as commits are fetched and checked out, so measure it once it's no longer used.
+			self._sizes[previous] = diskUsage(self.clonePath(previous))
+
+		self._current = repoName
+		# The clone may not exist yet, so the marker is outside of it.
+		marker = self._marker(repoName)
+		os.makedirs(os.path.dirname(marker), exist_ok=True)
+		self._lockFd = os.open(marker, os.O_RDWR | os.O_CREAT, 0o644)
+		os.utime(marker)
+		if fcntl is not None:
+			fcntl.flock(self._lockFd, fcntl.LOCK_SH)
+
+		if self.maxBytes is not None:
+			self.enforceBudget()
+
+	def release(self):
+		if self.scratch is not None and not self.keepInputs:
+			removeTree(self.inputRoot())
+		if self._lockFd is not None:
+			# Closing the file releases the lock.
+			os.close(self._lockFd)
+			self._lockFd = None
+		self._current = None
+
+	@contextlib.contextmanager
+	def _lockUnused(self, repoName):
+		"""
+		Lock the clone of repoName against other processes until the with block ends, if no process is using it.
+		useRepo of other processes waits until then, so the clone can be removed in the with block.
+
+		:return: whether the clone is locked. False if it's in use.
+		"""
+		if repoName == self._current:
+			yield False
+			return
+		marker = self._marker(repoName)
+		if fcntl is None:
+			yield not (os.path.exists(marker) and time.time() - os.path.getmtime(marker) < IN_USE_SECONDS)
+			return
+		os.makedirs(os.path.dirname(marker), exist_ok=True)
+		fd = os.open(marker, os.O_RDWR | os.O_CREAT, 0o644)
+		try:
+			try:
+				fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+			except OSError:
+				yield False
+				return
+			yield True
+		finally:
+			# Closing the marker drops the exclusive lock, and useRepo of other processes goes on.
+			os.close(fd)
+
+	def releaseInputs(self, repoName):
+		"""
+		Remove the input folders of repoName, and prune the worktrees among them from the clone.
+		Outputs in scratch are removed as well.
+		Call this after the results of an example are recorded.
+		"""
+		if self.scratch is not None:
+			removeTree(os.path.join(self.inputRoot(), 'result'))
+		if self.keepInputs:
+			return
+		for folder in self.inputFolders(repoName):
+			removeTree(folder)
+		if isClone(self.clonePath(repoName)):
+			subprocess.run(['git', 'worktree', 'prune'], cwd=self.clonePath(repoName), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+	def evict(self, repoName):
+		"""
+		Remove the clone of repoName and its input folders. Call it in the with block of _lockUnused.
+
+		:return: bytes freed
+		"""
+		size = self._sizes.pop(repoName, None)
+		if size is None:
+			size = diskUsage(self.clonePath(repoName))
+		for folder in self.inputFolders(repoName):
+			removeTree(folder)
+		removeTree(self.clonePath(repoName))
+		# The marker stays. A process waiting for its lock in useRepo would hold a removed file, which no longer locks the clone.
+		logger.info(f'Evicted {repoName}, {size // 1024 ** 2} MiB.')
+		return size
+
+	def enforceBudget(self, maxBytes=None, dryRun=False):
+		"""
+		Evict the least recently used clones that aren't in use or kept by keepClone, until the clones take at most maxBytes.
+
+		:param maxBytes: default is self.maxBytes
+		:return: names of the evicted clones
+		"""
+		if maxBytes is None:
+			maxBytes = self.maxBytes
+		clones = self.listClones()
+		for name in clones:
+			if name not in self._sizes:
+				self._sizes[name] = diskUsage(self.clonePath(name))
+		total = sum(self._sizes[name] for name in clones)
+
+		evicted = []
+		for name in sorted(clones, key=self.lastUsed):
+			if total <= maxBytes:
+				break
+			with self._lockUnused(name) as locked:
+				if not locked or (self.keepClone is not None and self.keepClone(name)):
+					continue
+				if dryRun:
+					total -= self._sizes[name]
+				else:
+					total -= self.evict(name)
+			evicted.append(name)
+		if total > maxBytes:
+			logger.warning(f'Clones in use take {total // 1024 ** 2} MiB, more than the budget of {maxBytes // 1024 ** 2} MiB.')
+		return evicted
+
+	def cleanToolTemp(self, maxAge=None):
+		"""
+		Remove temporary folders that FSTMerge leaves in result/FSTMerge when it throws.
+
+		:param maxAge: only remove folders not modified in this many seconds, because a tool in another process may still use them.
+		None removes all of them.
+		"""
+		toolFolder = os.path.join(self.root, 'result', 'FSTMerge')
+		if not os.path.isdir(toolFolder):
+			return
+		now = time.time()
+		for entry in os.scandir(toolFolder):
+			if not entry.is_dir() or 'fstmerge_tmp' not in entry.name:
+				continue
+			if maxAge is not None and now - entry.stat().st_mtime < maxAge:
+				continue
+			try:
+				removeTree(entry.path)
+			except OSError as e:
+				logger.warning(f'Failed to delete {entry.path}: {e}')
+
+	def gc(self, maxBytes=None, dryRun=False):
+		"""
+		Remove the input folders of every repository, prune worktrees, remove temporary folders of tools,
+		and evict clones over maxBytes.
+		Run it when no merge.py is running.
+
+		:return: bytes freed
+		"""
+		before = diskUsage(self.root)
+		if dryRun:
+			inputs = [folder for name in self.listClones() for folder in self.inputFolders(name) if os.path.isdir(folder)]
+			logger.info(f'Would remove {len(inputs)} input folders.')
+			if maxBytes is not None:
+				logger.info(f'Would evict {", ".join(self.enforceBudget(maxBytes, dryRun=True)) or "nothing"}.')
+			return 0
+
+		for entry in os.scandir(self.root):
+			for suffix in INPUT_SUFFIXES:
+				if entry.is_dir() and entry.name.endswith(suffix) and isClone(self.clonePath(entry.name[0:-len(suffix)])):
+					removeTree(entry.path)
+		for name in self.listClones():
+			subprocess.run(['git', 'worktree', 'prune'], cwd=self.clonePath(name), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		self.cleanToolTemp()
+		if self.scratch is not None and os.path.isdir(self.scratch):
+			# Folders of processes that were killed
+			for entry in os.scandir(self.scratch):
+				if entry.is_dir() and entry.name.isdigit():
+					removeTree(entry.path)
+		if maxBytes is not None:
+			self.enforceBudget(maxBytes)
+		return before - diskUsage(self.root)
+
+	def __getstate__(self):
+		return self.root, self.maxBytes, self.keepInputs, self.scratch, self.keepClone
+
+	def __setstate__(self, state):
+		# A worker process holds its own lock.
+		self.__init__(*state)
+
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2 or sys.argv[1] != 'gc' or '--help' in sys.argv:
+		print('''
+{0} gc [--path-prefix folder] [--budget size] [--scratch folder] [--dry-run]
+
+Remove the base/left/right/child folders of every repository in Resource/workspace, prune their worktrees,
+and remove temporary folders that FSTMerge left. Don't run it while merge.py is running.
+
+--budget size
+Evict the least recently used clones until the clones take at most size, like 10G.
+compare.py reads expected files from the clones, so run it with the golden cache before evicting.
+
+--scratch folder
+Remove what merge.py --scratch left in folder, e.g. after it was killed.
+
+--dry-run
+Print what would be removed.
+'''.format(sys.argv[0]))
+		exit(0)
+
+	logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+	try:
+		i = sys.argv.index('--path-prefix')
+		pathPrefix = sys.argv[i + 1]
+	except:
+		pathPrefix = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+	budget = optionUtils.getSize('--budget', example='10G')
+
+	try:
+		i = sys.argv.index('--scratch')
+		scratch = sys.argv[i + 1]
+	except:
+		scratch = None
+
+	manager = WorkspaceManager(os.path.join(pathPrefix, 'Resource/workspace'), scratch=scratch)
+	freed = manager.gc(budget, '--dry-run' in sys.argv)
+	if '--dry-run' not in sys.argv:
+		logger.info(f'Freed {freed // 1024 ** 2} MiB.')